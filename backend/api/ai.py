@@ -1,169 +1,862 @@
-from datetime import date
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 
 from models.schemas import (
     AIRequest,
     QuizRequest,
     StudyPlanRequest,
     ChatRequest,
+    ChatSessionCreate,
+    ChatSessionMessage,
+    FlashcardItem,
+    QuizQuestionItem,
+    StudyPackRequest,
+    SummaryRequest,
 )
-from services.ollama_service import chat_with_context
+from services import chat_sessions
+from services.context_cache import NotebookSnapshot, context_cache
+from services.ollama_service import (
+    chat_ollama,
+    chat_with_context,
+    generate_ollama_with_state,
+    stream_chat_ollama,
+    stream_chat_with_context,
+)
+from services.llm_scheduler import (
+    Priority,
+    SchedulerSaturated,
+    llm_scheduler,
+    set_request,
+)
+from services.prompt_budget import (
+    PromptPlan,
+    Section,
+    count_tokens,
+    escape_template,
+    fit_prompt,
+)
+from services.response_cache import cache_key, response_cache
+from services.retrieval import NOTE_DOC_ID, file_doc_id, retrieval_index
+from services.structured_stream import ItemBatcher
+from services.summarize import map_reduce_summary
 from utils.auth import get_current_user
-from utils.database import supabase
+from utils.config import settings
+from utils.metrics import span
+from utils.repository import (
+    chat_message_repo,
+    chat_session_repo,
+    flashcard_repo,
+    note_repo,
+    notebook_repo,
+    quiz_question_repo,
+    quiz_repo,
+    study_plan_repo,
+)
 
 
 router = APIRouter()
 
+# Background cleanups of aborted streams (see `_sse_response`).
+_tasks: set[asyncio.Task] = set()
 
-def _build_notebook_context(notebook_id: str, user_id: str) -> str:
-    # Ensure notebook belongs to user
-    nb = (
-        supabase.table("notebooks")
-        .select("id, user_id, title, description")
-        .eq("id", notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if not nb.data or nb.data[0]["user_id"] != user_id:
+
+async def _load_snapshot(notebook_id: str, user_id: str) -> NotebookSnapshot | None:
+    # One round trip: ownership check, notebook, main note and file texts.
+    bundle = await notebook_repo.get_bundle(notebook_id, user_id, include_text=True)
+    if bundle is None:
+        return None
+    note = bundle["note"]
+    documents = {NOTE_DOC_ID: note["content"] if note else ""}
+    for f in bundle["files"]:
+        documents[file_doc_id(f["id"])] = f["extracted_text"] or ""
+    return NotebookSnapshot(bundle["notebook"], documents)
+
+
+async def _get_snapshot(notebook_id: str, user_id: str) -> NotebookSnapshot:
+    snapshot = context_cache.get(notebook_id)
+    if snapshot is None:
+        version = context_cache.version(notebook_id)
+        snapshot = await _load_snapshot(notebook_id, user_id)
+        if snapshot is not None:
+            context_cache.put(notebook_id, version, snapshot)
+    # Ensure notebook belongs to user (cached snapshots are shared across users)
+    if snapshot is None or snapshot.notebook["user_id"] != user_id:
         raise HTTPException(status_code=404, detail="Notebook not found")
+    return snapshot
 
-    notebook = nb.data[0]
-    note_resp = (
-        supabase.table("notes")
-        .select("content")
-        .eq("notebook_id", notebook_id)
-        .limit(1)
-        .execute()
-    )
-    note_text = note_resp.data[0]["content"] if note_resp.data else ""
 
-    files_resp = (
-        supabase.table("files")
-        .select("extracted_text")
-        .eq("notebook_id", notebook_id)
-        .execute()
+async def _build_notebook_context(notebook_id: str, user_id: str, query: str = "") -> str:
+    with span("context"):
+        version = context_cache.version(notebook_id)
+        snapshot = await _get_snapshot(notebook_id, user_id)
+        notebook = snapshot.notebook
+        await retrieval_index.ensure_loaded(notebook_id, snapshot.documents, version)
+        passages = await retrieval_index.build_context(notebook_id, query)
+    return (
+        f"Notebook: {notebook['title']}\nDescription: {notebook.get('description') or ''}"
+        f"\n\nRelevant material:\n{passages}"
     )
-    file_texts = [f["extracted_text"] for f in files_resp.data] if files_resp.data else []
 
-    combined = f"Notebook: {notebook['title']}\nDescription: {notebook.get('description') or ''}\n\nNotes:\n{note_text}\n\nFiles:\n" + "\n\n".join(
-        file_texts
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(
+    tokens: AsyncIterator[str],
+    result_key: str,
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    batcher: Optional[ItemBatcher] = None,
+    items_key: str = "items",
+    extra: Optional[dict] = None,
+    on_abort: Optional[Callable[[], Awaitable[None]]] = None,
+) -> StreamingResponse:
+    """Stream Ollama tokens to the client as Server-Sent Events.
+
+    Emits one `token` event per chunk, then a `done` event carrying the same
+    body the non-streaming route returns. `on_complete` persists the answer
+    and only runs when the generation finished; if the client disconnects,
+    Starlette cancels this generator, which closes the upstream Ollama stream
+    and skips persistence. With a `batcher`, structured items parsed from
+    the output are also sent as `item` events as soon as they are complete
+    (and persisted in batches), and listed under `items_key` in `done`;
+    `on_abort` then removes those rows again if the stream ends any other
+    way than with `done` (disconnect, generation error). It runs as its own
+    task, since the request's task may already be cancelled. `extra` (e.g.
+    token usage) is merged into the `done` payload.
+    """
+
+    async def events() -> AsyncIterator[str]:
+        parts: list[str] = []
+        completed = False
+        try:
+            try:
+                async with aclosing(tokens):
+                    async for token in tokens:
+                        parts.append(token)
+                        yield _sse_event("token", {"token": token})
+                        if batcher is not None:
+                            for item in await batcher.feed(token):
+                                yield _sse_event("item", {"item": item})
+                if batcher is not None:
+                    await batcher.close()
+            except Exception as exc:
+                yield _sse_event("error", {"detail": f"Generation failed: {exc}"})
+                return
+
+            answer = "".join(parts).strip()
+            if on_complete is not None:
+                await on_complete(answer)
+            completed = True
+            done = {result_key: answer, **(extra or {})}
+            if batcher is not None:
+                done[items_key] = batcher.items
+            yield _sse_event("done", done)
+        finally:
+            if not completed and on_abort is not None:
+                task = asyncio.get_running_loop().create_task(on_abort())
+                _tasks.add(task)
+                task.add_done_callback(_tasks.discard)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    return combined
 
 
-@router.post("/summary")
-async def summarize(req: AIRequest, user=Depends(get_current_user)):
-    context = ""
-    if req.notebook_id:
-        context = _build_notebook_context(req.notebook_id, user["id"])
-    prompt = (
+SUMMARY_SYSTEM_PROMPT = "Summarize study notes for exams."
+FLASHCARDS_SYSTEM_PROMPT = "Create flashcards for spaced repetition."
+QUIZ_SYSTEM_PROMPT = "Create practice exam questions."
+STUDY_PLAN_SYSTEM_PROMPT = "Plan an efficient exam study schedule."
+CHAT_SYSTEM_PROMPT = (
+    "You are an AI study assistant helping a university student prepare for exams. "
+    "Answer based only on the provided notebook context and conversation history when possible."
+)
+
+# Answer length allowed per artifact (Ollama num_predict). The prompt is
+# trimmed so that prompt + answer fit in OLLAMA_NUM_CTX; notebook context is
+# cut before the user's own text.
+NUM_PREDICT = {
+    "summary": 768,
+    "flashcards": 1536,
+    "quiz": 1536,
+    "study_plan": 1536,
+    "chat": 768,
+}
+
+
+def _material_sections(req, context: str) -> list[Section]:
+    return [
+        Section("text", req.text, priority=1),
+        Section("context", context, priority=2),
+    ]
+
+
+def _summary_prompt(req: AIRequest, context: str) -> PromptPlan:
+    return fit_prompt(
         "You are an AI study assistant. Create a concise, exam-focused summary of the following content.\n\n"
-        f"Context:\n{context}\n\nText:\n{req.text}"
+        "Context:\n$context\n\nText:\n$text",
+        _material_sections(req, context),
+        NUM_PREDICT["summary"],
+        system=SUMMARY_SYSTEM_PROMPT,
     )
-    answer = await chat_with_context("Summarize study notes for exams.", prompt)
 
-    if req.notebook_id:
-        # store summary on the main note if present
-        notes = (
-            supabase.table("notes")
-            .select("id")
-            .eq("notebook_id", req.notebook_id)
-            .limit(1)
-            .execute()
+
+MAP_REDUCE_SUMMARY_PROMPT = (
+    "You are an AI study assistant. Below are summaries of consecutive sections "
+    "of a student's notebook. Combine them into one concise, exam-focused summary "
+    "of the whole notebook.\n\n$notebook\n\nSection summaries:\n$sections"
+)
+
+
+async def _summary_plan(req: SummaryRequest, user_id: str) -> tuple[PromptPlan, dict]:
+    """Prompt for a summary, map-reducing large notebooks first.
+
+    Returns the final prompt and the usage report. In map-reduce mode the
+    notebook's documents (and the request text, if it isn't one of them)
+    are summarized per chunk by services.summarize, and the final prompt
+    only has to merge those summaries.
+    """
+    if not req.notebook_id:
+        plan = _summary_prompt(req, "")
+        return plan, plan.usage()
+    if req.mode != "single":
+        snapshot = await _get_snapshot(req.notebook_id, user_id)
+        documents = [d for d in snapshot.documents.values() if d.strip()]
+        if req.text.strip() and req.text.strip() not in (d.strip() for d in documents):
+            documents.append(req.text)
+        material = sum(count_tokens(d) for d in documents)
+        if req.mode == "map_reduce" or material > settings.summary_map_reduce_min_tokens:
+            notebook = snapshot.notebook
+            header = escape_template(
+                f"Notebook: {notebook['title']}\n"
+                f"Description: {notebook.get('description') or ''}"
+            )
+            template = MAP_REDUCE_SUMMARY_PROMPT.replace("$notebook", header)
+            empty = fit_prompt(
+                template,
+                [Section("sections", "")],
+                NUM_PREDICT["summary"],
+                system=SUMMARY_SYSTEM_PROMPT,
+            )
+            budget = (
+                empty.num_ctx
+                - empty.num_predict
+                - empty.prompt_tokens
+                - settings.prompt_overhead_tokens
+            )
+            result = await map_reduce_summary(documents, budget)
+            plan = fit_prompt(
+                template,
+                [Section("sections", "\n\n".join(result.summaries))],
+                NUM_PREDICT["summary"],
+                system=SUMMARY_SYSTEM_PROMPT,
+            )
+            return plan, {**plan.usage(), "map_reduce": result.usage()}
+    context = await _build_notebook_context(req.notebook_id, user_id, req.text)
+    plan = _summary_prompt(req, context)
+    return plan, plan.usage()
+
+
+async def _save_summary(notebook_id: Optional[str], answer: str) -> None:
+    # store summary on the main note if present
+    if notebook_id:
+        await note_repo.set_summary(notebook_id, answer)
+
+
+def _flashcards_prompt(req: AIRequest, context: str) -> PromptPlan:
+    return fit_prompt(
+        "Generate high-quality flashcards in JSON array format "
+        '[{"front": "...", "back": "..."}] from the following exam notes.\n\n'
+        "Context:\n$context\n\nText:\n$text",
+        _material_sections(req, context),
+        NUM_PREDICT["flashcards"],
+        system=FLASHCARDS_SYSTEM_PROMPT,
+    )
+
+
+class _BatchWriter(ABC):
+    """Stores items parsed from a generation as batches arrive.
+
+    Each batch is written by its own task and awaited through a shield, so
+    a request cancelled mid-write still completes the write and `discard`
+    (for a generation that never finished) sees every row to delete.
+    """
+
+    def __init__(self, notebook_id: Optional[str], schema) -> None:
+        self.notebook_id = notebook_id
+        self.batcher = ItemBatcher(schema, self._flush, settings.structured_batch_size)
+        self._write: Optional[asyncio.Task] = None
+
+    async def _flush(self, items: list[dict], start: int) -> None:
+        if not self.notebook_id:
+            return
+        self._write = asyncio.ensure_future(self._insert(items, start))
+        await asyncio.shield(self._write)
+
+    @abstractmethod
+    async def _insert(self, items: list[dict], start: int) -> None:
+        """Store one batch of parsed items."""
+
+    @abstractmethod
+    async def _delete(self) -> None:
+        """Delete everything `_insert` stored."""
+
+    async def discard(self) -> None:
+        if self._write is not None:
+            await asyncio.wait([self._write])
+        await self._delete()
+
+
+class _FlashcardWriter(_BatchWriter):
+    """Stores parsed flashcards one row each as batches arrive."""
+
+    def __init__(self, notebook_id: Optional[str]) -> None:
+        super().__init__(notebook_id, FlashcardItem)
+        self.card_ids: list[str] = []
+
+    async def _insert(self, cards: list[dict], start: int) -> None:
+        rows = await flashcard_repo.create_many(self.notebook_id, cards)
+        self.card_ids.extend(row["id"] for row in rows)
+
+    async def _delete(self) -> None:
+        await flashcard_repo.delete_many(self.card_ids)
+
+    async def save(self, answer: str) -> None:
+        # Parsed cards are already stored. If nothing parsed, keep the raw
+        # output as before so it isn't lost.
+        if self.notebook_id and not self.batcher.items:
+            await flashcard_repo.create(self.notebook_id, "BULK_JSON", answer)
+
+
+def _quiz_prompt(req: QuizRequest, context: str) -> PromptPlan:
+    return fit_prompt(
+        "Generate a set of exam-style questions as JSON with fields "
+        "type, question, options (for MCQ), answer, explanation. "
+        + escape_template(f"Level: {req.level}. Type: {req.qtype}.")
+        + "\n\n"
+        "Context:\n$context\n\nText:\n$text",
+        _material_sections(req, context),
+        NUM_PREDICT["quiz"],
+        system=QUIZ_SYSTEM_PROMPT,
+    )
+
+
+def _study_plan_prompt(req: StudyPlanRequest, context: str) -> PromptPlan:
+    date_str = req.exam_date.isoformat() if req.exam_date else "unknown"
+    return fit_prompt(
+        "Create a detailed day-by-day study plan in JSON format for an upcoming university exam. "
+        f"Exam date: {date_str}.\n"
+        "Return a JSON object with days and tasks."
+        "\n\nContext:\n$context\n\nText:\n$text",
+        _material_sections(req, context),
+        NUM_PREDICT["study_plan"],
+        system=STUDY_PLAN_SYSTEM_PROMPT,
+    )
+
+
+class _QuizWriter(_BatchWriter):
+    """Stores parsed questions in quiz_questions as batches arrive.
+
+    The quizzes row is created with the first batch and ends up holding the
+    parsed question list, or the raw answer when nothing could be parsed.
+    """
+
+    def __init__(self, notebook_id: Optional[str]) -> None:
+        super().__init__(notebook_id, QuizQuestionItem)
+        self.quiz_id: Optional[str] = None
+
+    async def _insert(self, questions: list[dict], start: int) -> None:
+        if self.quiz_id is None:
+            self.quiz_id = (await quiz_repo.create(self.notebook_id, []))["id"]
+        await quiz_question_repo.create_many(
+            self.quiz_id, self.notebook_id, questions, start
         )
-        if notes.data:
-            supabase.table("notes").update({"ai_summary": answer}).eq(
-                "id", notes.data[0]["id"]
-            ).execute()
 
-    return {"summary": answer}
+    async def _delete(self) -> None:
+        if self.quiz_id is not None:
+            await quiz_repo.delete(self.quiz_id)
+
+    async def save(self, answer: str) -> None:
+        if not self.notebook_id:
+            return
+        if self.quiz_id is None:
+            await quiz_repo.create(self.notebook_id, answer)
+        else:
+            await quiz_repo.set_data(self.quiz_id, self.batcher.items)
+
+
+def _cache_kwargs(req) -> dict:
+    return {
+        "use_cache": True,
+        "refresh_cache": req.no_cache,
+        "notebook_id": req.notebook_id,
+    }
+
+
+def _latest_question(req: ChatRequest) -> str:
+    for m in reversed(req.messages):
+        if m.role == "user":
+            return m.content
+    return ""
+
+
+def _chat_prompt(req: ChatRequest, context: str) -> PromptPlan:
+    history_text = ""
+    for m in req.messages:
+        history_text += f"{m.role.upper()}: {m.content}\n"
+    # Over budget, context is cut first, then the oldest turns.
+    return fit_prompt(
+        "Notebook context:\n$context\n\nConversation:\n$history",
+        [
+            Section("history", history_text, priority=1, keep="tail"),
+            Section("context", context, priority=2),
+        ],
+        NUM_PREDICT["chat"],
+        system=CHAT_SYSTEM_PROMPT,
+    )
+
+
+def _llm_user(priority: Priority):
+    """Dependency: authenticate, then admit the request to the LLM queue.
+
+    Rejects with 429 up front when the queue is saturated (before any
+    context is built or a stream is opened). Otherwise reserves the
+    request's queue place, which its first Ollama call takes over, so a
+    stream that has already sent its headers can't be refused afterwards;
+    and tags the request so its Ollama calls are scheduled with `priority`
+    for this user. An unused reservation (e.g. a cache hit) is released once
+    the response has been sent.
+    """
+
+    async def dependency(user=Depends(get_current_user)):
+        try:
+            reservation = llm_scheduler.reserve(priority, user["id"])
+        except SchedulerSaturated as exc:
+            raise HTTPException(
+                status_code=429,
+                detail="The AI service is busy, please retry shortly",
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+        set_request(priority, user["id"], reservation)
+        try:
+            yield user
+        finally:
+            llm_scheduler.release(reservation)
+
+    return dependency
+
+
+@router.post("/summary")
+async def summarize(req: SummaryRequest, user=Depends(_llm_user(Priority.STANDARD))):
+    plan, usage = await _summary_plan(req, user["id"])
+    answer = await chat_with_context(
+        SUMMARY_SYSTEM_PROMPT, plan.prompt, options=plan.options(), **_cache_kwargs(req)
+    )
+    await _save_summary(req.notebook_id, answer)
+    return {"summary": answer, "usage": usage}
+
+
+@router.post("/summary/stream")
+async def summarize_stream(
+    req: SummaryRequest, user=Depends(_llm_user(Priority.STANDARD))
+):
+    # The map phase of a map-reduce summary runs before the stream opens;
+    # only the final merge is streamed.
+    plan, usage = await _summary_plan(req, user["id"])
+    return _sse_response(
+        stream_chat_with_context(
+            SUMMARY_SYSTEM_PROMPT,
+            plan.prompt,
+            options=plan.options(),
+            **_cache_kwargs(req),
+        ),
+        "summary",
+        lambda answer: _save_summary(req.notebook_id, answer),
+        extra={"usage": usage},
+    )
 
 
 @router.post("/flashcards")
-async def flashcards(req: AIRequest, user=Depends(get_current_user)):
+async def flashcards(req: AIRequest, user=Depends(_llm_user(Priority.STANDARD))):
     context = ""
     if req.notebook_id:
-        context = _build_notebook_context(req.notebook_id, user["id"])
-    prompt = (
-        "Generate high-quality flashcards in JSON array format "
-        '[{"front": "...", "back": "..."}] from the following exam notes.\n\n'
-        f"Context:\n{context}\n\nText:\n{req.text}"
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
+    plan = _flashcards_prompt(req, context)
+    answer = await chat_with_context(
+        FLASHCARDS_SYSTEM_PROMPT,
+        plan.prompt,
+        options=plan.options(),
+        **_cache_kwargs(req),
     )
-    answer = await chat_with_context("Create flashcards for spaced repetition.", prompt)
+    writer = _FlashcardWriter(req.notebook_id)
+    await writer.batcher.feed(answer)
+    await writer.batcher.close()
+    await writer.save(answer)
+    return {
+        "flashcards_raw": answer,
+        "flashcards": writer.batcher.items,
+        "usage": plan.usage(),
+    }
 
-    # naive store: save raw JSON string in flashcards table if parse fails client-side
-    if req.notebook_id:
-        supabase.table("flashcards").insert(
-            {"notebook_id": req.notebook_id, "front": "BULK_JSON", "back": answer}
-        ).execute()
 
-    return {"flashcards_raw": answer}
+@router.post("/flashcards/stream")
+async def flashcards_stream(req: AIRequest, user=Depends(_llm_user(Priority.STANDARD))):
+    context = ""
+    if req.notebook_id:
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
+    plan = _flashcards_prompt(req, context)
+    writer = _FlashcardWriter(req.notebook_id)
+    return _sse_response(
+        stream_chat_with_context(
+            FLASHCARDS_SYSTEM_PROMPT,
+            plan.prompt,
+            options=plan.options(),
+            **_cache_kwargs(req),
+        ),
+        "flashcards_raw",
+        writer.save,
+        batcher=writer.batcher,
+        items_key="flashcards",
+        extra={"usage": plan.usage()},
+        on_abort=writer.discard,
+    )
 
 
 @router.post("/quiz")
-async def quiz(req: QuizRequest, user=Depends(get_current_user)):
+async def quiz(req: QuizRequest, user=Depends(_llm_user(Priority.STANDARD))):
     context = ""
     if req.notebook_id:
-        context = _build_notebook_context(req.notebook_id, user["id"])
-    prompt = (
-        "Generate a set of exam-style questions as JSON with fields "
-        'type, question, options (for MCQ), answer, explanation. '
-        f"Level: {req.level}. Type: {req.qtype}.\n\n"
-        f"Context:\n{context}\n\nText:\n{req.text}"
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
+    plan = _quiz_prompt(req, context)
+    answer = await chat_with_context(
+        QUIZ_SYSTEM_PROMPT, plan.prompt, options=plan.options(), **_cache_kwargs(req)
     )
-    answer = await chat_with_context("Create practice exam questions.", prompt)
+    writer = _QuizWriter(req.notebook_id)
+    await writer.batcher.feed(answer)
+    await writer.batcher.close()
+    await writer.save(answer)
+    return {
+        "quiz_raw": answer,
+        "questions": writer.batcher.items,
+        "usage": plan.usage(),
+    }
+
+
+@router.post("/quiz/stream")
+async def quiz_stream(req: QuizRequest, user=Depends(_llm_user(Priority.STANDARD))):
+    context = ""
     if req.notebook_id:
-        supabase.table("quizzes").insert(
-            {"notebook_id": req.notebook_id, "data": answer}
-        ).execute()
-    return {"quiz_raw": answer}
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
+    plan = _quiz_prompt(req, context)
+    writer = _QuizWriter(req.notebook_id)
+    return _sse_response(
+        stream_chat_with_context(
+            QUIZ_SYSTEM_PROMPT, plan.prompt, options=plan.options(), **_cache_kwargs(req)
+        ),
+        "quiz_raw",
+        writer.save,
+        batcher=writer.batcher,
+        items_key="questions",
+        extra={"usage": plan.usage()},
+        on_abort=writer.discard,
+    )
 
 
 @router.post("/study-plan")
-async def study_plan(req: StudyPlanRequest, user=Depends(get_current_user)):
+async def study_plan(req: StudyPlanRequest, user=Depends(_llm_user(Priority.BATCH))):
     context = ""
     if req.notebook_id:
-        context = _build_notebook_context(req.notebook_id, user["id"])
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
 
-    exam_date: date | None = req.exam_date
-    date_str = exam_date.isoformat() if exam_date else "unknown"
-    prompt = (
-        "Create a detailed day-by-day study plan in JSON format for an upcoming university exam. "
-        f"Exam date: {date_str}.\n"
+    plan = _study_plan_prompt(req, context)
+    answer = await chat_with_context(
+        STUDY_PLAN_SYSTEM_PROMPT,
+        plan.prompt,
+        options=plan.options(),
+        **_cache_kwargs(req),
+    )
+
+    if req.notebook_id:
+        await study_plan_repo.create(req.notebook_id, req.exam_date, answer)
+
+    return {"plan_raw": answer, "usage": plan.usage()}
+
+
+STUDY_PACK_SYSTEM_PROMPT = (
+    "You are an AI study assistant preparing exam material from a student's notes."
+)
+STUDY_PACK_INSTRUCTIONS = {
+    "summary": "Create a concise, exam-focused summary of the material above.",
+    "flashcards": (
+        "Generate high-quality flashcards in JSON array format "
+        '[{{"front": "...", "back": "..."}}] from the material above.'
+    ),
+    "quiz": (
+        "Generate a set of exam-style questions from the material above as JSON "
+        "with fields type, question, options (for MCQ), answer, explanation. "
+        "Level: {level}. Type: {qtype}."
+    ),
+    "study_plan": (
+        "Create a detailed day-by-day study plan in JSON format for an upcoming "
+        "university exam based on the material above. Exam date: {exam_date}. "
         "Return a JSON object with days and tasks."
-        f"\n\nContext:\n{context}\n\nText:\n{req.text}"
+    ),
+}
+
+
+def _study_pack_prefix(
+    req: StudyPackRequest, context: str, artifacts: list[str]
+) -> PromptPlan:
+    # Every call of the pack shares one num_ctx so Ollama keeps the same
+    # loaded runner; the window must fit the longest instruction and answer.
+    return fit_prompt(
+        f"{STUDY_PACK_SYSTEM_PROMPT}\n\nContext:\n$context\n\nText:\n$text",
+        _material_sections(req, context),
+        max(NUM_PREDICT[a] for a in artifacts),
+        reserved=max(count_tokens(_study_pack_instruction(req, a)) for a in artifacts),
     )
-    answer = await chat_with_context("Plan an efficient exam study schedule.", prompt)
 
+
+def _study_pack_instruction(req: StudyPackRequest, artifact: str) -> str:
+    return STUDY_PACK_INSTRUCTIONS[artifact].format(
+        level=req.level,
+        qtype=req.qtype,
+        exam_date=req.exam_date.isoformat() if req.exam_date else "unknown",
+    )
+
+
+async def _generate_study_pack(
+    req: StudyPackRequest, plan: PromptPlan, artifacts: list[str]
+) -> dict[str, str]:
+    """Generate each artifact on top of one shared, prefilled prefix.
+
+    The prefix (notebook context + text) is evaluated once in a short
+    priming call; every artifact then continues from the returned Ollama
+    `context` with only its own instruction as new prompt, and `keep_alive`
+    keeps the model loaded in between. Artifacts run one after another so
+    they reuse the same warm model instead of competing for it. Cached
+    artifacts are served from the response cache without priming.
+    """
+    prefix = plan.prompt
+    answers: dict[str, str] = {}
+    keys = {}
+    for artifact in artifacts:
+        keys[artifact] = cache_key(
+            settings.ollama_model,
+            f"study-pack:{artifact}",
+            prefix + "\n\n" + _study_pack_instruction(req, artifact),
+        )
+        if settings.response_cache_enabled and not req.no_cache:
+            cached = await response_cache.aget(keys[artifact])
+            if cached is not None:
+                answers[artifact] = cached
+
+    primed: list[int] | None = None
+    for artifact in artifacts:
+        if artifact in answers:
+            continue
+        if primed is None:
+            _, primed = await generate_ollama_with_state(
+                prefix + "\n\nRead the material above. Reply only with OK.",
+                options={"num_ctx": plan.num_ctx, "num_predict": 1},
+                keep_alive=settings.ollama_keep_alive,
+            )
+        instruction = _study_pack_instruction(req, artifact)
+        # Without a returned context (older Ollama) fall back to the full prompt.
+        answer, _ = await generate_ollama_with_state(
+            instruction if primed else f"{prefix}\n\n{instruction}",
+            context=primed,
+            options={"num_ctx": plan.num_ctx, "num_predict": NUM_PREDICT[artifact]},
+            keep_alive=settings.ollama_keep_alive,
+        )
+        answers[artifact] = answer
+        if settings.response_cache_enabled:
+            await response_cache.aput(keys[artifact], answer, req.notebook_id)
+    return answers
+
+
+@router.post("/study-pack")
+async def study_pack(req: StudyPackRequest, user=Depends(_llm_user(Priority.BATCH))):
+    context = ""
     if req.notebook_id:
-        supabase.table("study_plans").insert(
-            {
-                "notebook_id": req.notebook_id,
-                "exam_date": exam_date,
-                "plan_json": answer,
-            }
-        ).execute()
+        context = await _build_notebook_context(req.notebook_id, user["id"], req.text)
+    artifacts = list(dict.fromkeys(req.artifacts))
+    plan = _study_pack_prefix(req, context, artifacts)
+    answers = await _generate_study_pack(req, plan, artifacts)
 
-    return {"plan_raw": answer}
+    result: dict = {"usage": plan.usage()}
+    if "summary" in answers:
+        await _save_summary(req.notebook_id, answers["summary"])
+        result["summary"] = answers["summary"]
+    if "flashcards" in answers:
+        cards = _FlashcardWriter(req.notebook_id)
+        await cards.batcher.feed(answers["flashcards"])
+        await cards.batcher.close()
+        await cards.save(answers["flashcards"])
+        result["flashcards_raw"] = answers["flashcards"]
+        result["flashcards"] = cards.batcher.items
+    if "quiz" in answers:
+        writer = _QuizWriter(req.notebook_id)
+        await writer.batcher.feed(answers["quiz"])
+        await writer.batcher.close()
+        await writer.save(answers["quiz"])
+        result["quiz_raw"] = answers["quiz"]
+        result["questions"] = writer.batcher.items
+    if "study_plan" in answers:
+        if req.notebook_id:
+            await study_plan_repo.create(
+                req.notebook_id, req.exam_date, answers["study_plan"]
+            )
+        result["plan_raw"] = answers["study_plan"]
+    return result
 
 
 @router.post("/chat")
-async def rag_chat(req: ChatRequest, user=Depends(get_current_user)):
+async def rag_chat(req: ChatRequest, user=Depends(_llm_user(Priority.INTERACTIVE))):
     context = ""
     if req.notebook_id:
-        context = _build_notebook_context(req.notebook_id, user["id"])
+        context = await _build_notebook_context(
+            req.notebook_id, user["id"], _latest_question(req)
+        )
+    plan = _chat_prompt(req, context)
+    answer = await chat_with_context(
+        CHAT_SYSTEM_PROMPT, plan.prompt, options=plan.options()
+    )
+    return {"answer": answer, "usage": plan.usage()}
 
-    history_text = ""
-    for m in req.messages:
-        history_text += f"{m.role.upper()}: {m.content}\n"
 
-    system_prompt = (
-        "You are an AI study assistant helping a university student prepare for exams. "
-        "Answer based only on the provided notebook context and conversation history when possible."
+@router.post("/chat/stream")
+async def rag_chat_stream(req: ChatRequest, user=Depends(_llm_user(Priority.INTERACTIVE))):
+    context = ""
+    if req.notebook_id:
+        context = await _build_notebook_context(
+            req.notebook_id, user["id"], _latest_question(req)
+        )
+    plan = _chat_prompt(req, context)
+    return _sse_response(
+        stream_chat_with_context(CHAT_SYSTEM_PROMPT, plan.prompt, options=plan.options()),
+        "answer",
+        extra={"usage": plan.usage()},
+    )
+
+
+# Server-side chat sessions: the client sends only the new message; history
+# lives in chat_messages and is compacted into a rolling summary once it
+# passes the session's token budget (see services.chat_sessions).
+
+
+def _max_session_budget() -> int:
+    """Largest history budget that still leaves room for the system prompt
+    and the answer in the context window."""
+    return (
+        settings.ollama_num_ctx
+        - NUM_PREDICT["chat"]
+        - count_tokens(CHAT_SYSTEM_PROMPT)
+        - settings.prompt_overhead_tokens
+    )
+
+
+@router.post("/chat/sessions")
+async def create_chat_session(payload: ChatSessionCreate, user=Depends(get_current_user)):
+    if payload.notebook_id:
+        notebook = await notebook_repo.get_owned(payload.notebook_id, user["id"])
+        if notebook is None:
+            raise HTTPException(status_code=404, detail="Notebook not found")
+    return await chat_session_repo.create(
+        user["id"],
+        payload.notebook_id,
+        payload.title,
+        min(
+            payload.token_budget or settings.chat_session_token_budget,
+            _max_session_budget(),
+        ),
+    )
+
+
+@router.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str, user=Depends(get_current_user)):
+    session = await chat_session_repo.get_owned(session_id, user["id"])
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    messages = await chat_message_repo.list_for_session(
+        session_id, include_compacted=True
     )
-    user_message = f"Notebook context:\n{context}\n\nConversation:\n{history_text}"
-    answer = await chat_with_context(system_prompt, user_message)
-    return {"answer": answer}
+    return {**session, "messages": messages}
 
 
+async def _prepare_session_turn(
+    session_id: str, user_id: str, content: str
+) -> tuple[dict, list[dict], PromptPlan]:
+    session, history = await chat_sessions.load_session(session_id, user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    # Sessions created before budgets were clamped may still exceed the window.
+    session = {
+        **session,
+        "token_budget": min(session["token_budget"], _max_session_budget()),
+    }
+    # The summary, history and new message are capped by the session budget
+    # (build_messages drops the oldest turns), unless the summary and the
+    # message alone already exceed it.
+    reserved = max(
+        session["token_budget"],
+        count_tokens(session.get("summary") or "") + count_tokens(content),
+    )
+    if reserved > _max_session_budget():
+        raise HTTPException(
+            status_code=413, detail="Message too long for this chat session"
+        )
+    context = ""
+    if session.get("notebook_id"):
+        context = await _build_notebook_context(session["notebook_id"], user_id, content)
+    # The notebook context gets whatever is left of the window.
+    plan = fit_prompt(
+        "$context",
+        [Section("context", context, priority=2)],
+        NUM_PREDICT["chat"],
+        system=CHAT_SYSTEM_PROMPT,
+        reserved=reserved,
+    )
+    messages = chat_sessions.build_messages(
+        session, history, CHAT_SYSTEM_PROMPT, plan.prompt, content
+    )
+    return session, messages, plan
+
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def send_chat_message(
+    session_id: str, payload: ChatSessionMessage, user=Depends(_llm_user(Priority.INTERACTIVE))
+):
+    asked_at = chat_sessions.now()
+    session, messages, plan = await _prepare_session_turn(
+        session_id, user["id"], payload.content
+    )
+    answer = await chat_ollama(messages, options=plan.options())
+    await chat_sessions.record_turn(session, payload.content, answer, asked_at)
+    return {"session_id": session_id, "answer": answer, "usage": plan.usage()}
+
+
+@router.post("/chat/sessions/{session_id}/messages/stream")
+async def send_chat_message_stream(
+    session_id: str, payload: ChatSessionMessage, user=Depends(_llm_user(Priority.INTERACTIVE))
+):
+    asked_at = chat_sessions.now()
+    session, messages, plan = await _prepare_session_turn(
+        session_id, user["id"], payload.content
+    )
+    return _sse_response(
+        stream_chat_ollama(messages, options=plan.options()),
+        "answer",
+        lambda answer: chat_sessions.record_turn(
+            session, payload.content, answer, asked_at
+        ),
+        extra={"usage": plan.usage()},
+    )
@@ -72,7 +72,8 @@ def login(payload: UserLogin):
                 raise HTTPException(status_code=400, detail="Invalid credentials")
 
             access_token = create_access_token(
-                data={"sub": user["id"]}, expires_delta=timedelta(hours=24)
+                data={"sub": user["id"], "email": user["email"]},
+                expires_delta=timedelta(hours=24),
             )
             return {"access_token": access_token, "token_type": "bearer"}
 
@@ -91,7 +92,8 @@ def login(payload: UserLogin):
             raise HTTPException(status_code=400, detail="Invalid credentials")
 
         access_token = create_access_token(
-            data={"sub": user["id"]}, expires_delta=timedelta(hours=24)
+            data={"sub": user["id"], "email": user["email"]},
+            expires_delta=timedelta(hours=24),
         )
         return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
@@ -1,117 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException
-
-from models.schemas import NotebookCreate, NotebookOut, NoteCreate, NoteOut
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from models.schemas import (
+    NotebookCreate,
+    NotebookOut,
+    NoteCreate,
+    NoteOut,
+    Page,
+    SearchPage,
+)
+from services.content_events import document_changed
+from services.retrieval import NOTE_DOC_ID
 from utils.auth import get_current_user
-from utils.database import supabase
+from utils.columns import FILE_META_COLUMNS
+from utils.pagination import (
+    decode_cursor,
+    decode_keyset_cursor,
+    encode_cursor,
+    keyset_page,
+    select_columns,
+)
+from utils.repository import (
+    file_repo,
+    flashcard_repo,
+    notebook_repo,
+    note_repo,
+    quiz_repo,
+    search_repo,
+    study_plan_repo,
+)
 
 
 router = APIRouter()
 
+# Columns each listing may return through `fields=`; without it a listing
+# returns all of them (files: all but extracted_text).
+NOTEBOOK_FIELDS = ("id", "user_id", "title", "description", "created_at")
+FILE_FIELDS = tuple(c.strip() for c in FILE_META_COLUMNS.split(",")) + (
+    "extracted_text",
+)
+FLASHCARD_FIELDS = ("id", "notebook_id", "front", "back", "created_at")
+QUIZ_FIELDS = ("id", "notebook_id", "data", "created_at")
+STUDY_PLAN_FIELDS = ("id", "notebook_id", "exam_date", "plan_json", "created_at")
+
+
+async def _get_owned_notebook(notebook_id: str, user_id: str) -> dict:
+    notebook = await notebook_repo.get_owned(notebook_id, user_id)
+    if notebook is None:
+        raise HTTPException(status_code=404, detail="Notebook not found")
+    return notebook
+
 
 @router.post("/create", response_model=NotebookOut)
 async def create_notebook(payload: NotebookCreate, user=Depends(get_current_user)):
-    resp = (
-        supabase.table("notebooks")
-        .insert(
-            {
-                "user_id": user["id"],
-                "title": payload.title,
-                "description": payload.description,
-            }
-        )
-        .execute()
+    return await notebook_repo.create(user["id"], payload.title, payload.description)
+
+
+@router.get("/list", response_model=Page)
+async def list_notebooks(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    """The user's notebooks, newest first.
+
+    `fields=id,title` returns only those columns (`id` and `created_at` are
+    always included); pass `next_cursor` back as `cursor` for the next page.
+    """
+    columns = select_columns(fields, NOTEBOOK_FIELDS, NOTEBOOK_FIELDS)
+    after = decode_keyset_cursor(cursor)
+    rows = await notebook_repo.list_page(user["id"], columns, limit + 1, after)
+    return keyset_page(rows, limit)
+
+
+# Declared before /{notebook_id} so "search" isn't taken for a notebook id.
+@router.get("/search", response_model=SearchPage)
+async def search_notebooks(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    """Full-text search over the user's notes and extracted file text.
+
+    Results are ranked best first; pass `next_cursor` back as `cursor` for
+    the next page.
+    """
+    after = decode_cursor(cursor, 2)
+    rows = await search_repo.search(user["id"], q, limit + 1, after)
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1]["score"], page[-1]["id"])
+    return {
+        "items": [{**row, "score": -row["score"]} for row in page],
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/{notebook_id}", response_model=NotebookOut)
+async def get_notebook(notebook_id: str, user=Depends(get_current_user)):
+    return await _get_owned_notebook(notebook_id, user["id"])
+
+
+async def _list_children(
+    repo,
+    allowed: Tuple[str, ...],
+    notebook_id: str,
+    fields: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+    user: dict,
+    default: Optional[Tuple[str, ...]] = None,
+) -> dict:
+    columns = select_columns(fields, allowed, default or allowed)
+    after = decode_keyset_cursor(cursor)
+    await _get_owned_notebook(notebook_id, user["id"])
+    rows = await repo.list_page(notebook_id, columns, limit + 1, after)
+    return keyset_page(rows, limit)
+
+
+# The per-notebook listings below page like /list.
+
+
+@router.get("/{notebook_id}/files", response_model=Page)
+async def list_files(
+    notebook_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    return await _list_children(
+        file_repo,
+        FILE_FIELDS,
+        notebook_id,
+        fields,
+        limit,
+        cursor,
+        user,
+        default=FILE_FIELDS[:-1],
     )
-    return resp.data[0]
 
 
-@router.get("/list", response_model=list[NotebookOut])
-async def list_notebooks(user=Depends(get_current_user)):
-    resp = (
-        supabase.table("notebooks")
-        .select("*")
-        .eq("user_id", user["id"])
-        .order("created_at", desc=True)
-        .execute()
+@router.get("/{notebook_id}/flashcards", response_model=Page)
+async def list_flashcards(
+    notebook_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    return await _list_children(
+        flashcard_repo, FLASHCARD_FIELDS, notebook_id, fields, limit, cursor, user
     )
-    return resp.data
 
 
-@router.get("/{notebook_id}", response_model=NotebookOut)
-async def get_notebook(notebook_id: str, user=Depends(get_current_user)):
-    resp = (
-        supabase.table("notebooks")
-        .select("*")
-        .eq("id", notebook_id)
-        .eq("user_id", user["id"])
-        .limit(1)
-        .execute()
+@router.get("/{notebook_id}/quizzes", response_model=Page)
+async def list_quizzes(
+    notebook_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    return await _list_children(
+        quiz_repo, QUIZ_FIELDS, notebook_id, fields, limit, cursor, user
+    )
+
+
+@router.get("/{notebook_id}/study-plans", response_model=Page)
+async def list_study_plans(
+    notebook_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    return await _list_children(
+        study_plan_repo, STUDY_PLAN_FIELDS, notebook_id, fields, limit, cursor, user
     )
-    if not resp.data:
-        raise HTTPException(status_code=404, detail="Notebook not found")
-    return resp.data[0]
 
 
 @router.post("/notes", response_model=NoteOut)
 async def create_or_update_note(payload: NoteCreate, user=Depends(get_current_user)):
     # Ensure notebook belongs to user
-    nb = (
-        supabase.table("notebooks")
-        .select("id, user_id")
-        .eq("id", payload.notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if not nb.data or nb.data[0]["user_id"] != user["id"]:
-        raise HTTPException(status_code=404, detail="Notebook not found")
+    await _get_owned_notebook(payload.notebook_id, user["id"])
 
-    # Upsert by notebook_id (simple strategy: one main note per notebook)
-    existing = (
-        supabase.table("notes")
-        .select("id")
-        .eq("notebook_id", payload.notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if existing.data:
-        note_id = existing.data[0]["id"]
-        resp = (
-            supabase.table("notes")
-            .update({"content": payload.content})
-            .eq("id", note_id)
-            .execute()
-        )
-    else:
-        resp = (
-            supabase.table("notes")
-            .insert(
-                {"notebook_id": payload.notebook_id, "content": payload.content}
-            )
-            .execute()
-        )
-    return resp.data[0]
+    note = await note_repo.upsert(payload.notebook_id, payload.content)
+    await document_changed(payload.notebook_id, NOTE_DOC_ID, payload.content)
+    return note
 
 
 @router.get("/notes/{notebook_id}", response_model=NoteOut | None)
 async def get_note(notebook_id: str, user=Depends(get_current_user)):
-    nb = (
-        supabase.table("notebooks")
-        .select("id, user_id")
-        .eq("id", notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if not nb.data or nb.data[0]["user_id"] != user["id"]:
+    bundle = await notebook_repo.get_bundle(notebook_id, user["id"])
+    if bundle is None:
         raise HTTPException(status_code=404, detail="Notebook not found")
-
-    resp = (
-        supabase.table("notes")
-        .select("*")
-        .eq("notebook_id", notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if not resp.data:
-        return None
-    return resp.data[0]
-
-
+    return bundle["note"]
@@ -1,95 +1,299 @@
+import hashlib
 import os
 import uuid
 from tempfile import NamedTemporaryFile
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-
-import docx2txt
-import pytesseract
-from PIL import Image
-from pypdf import PdfReader
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
 
+from services.content_events import document_changed
+from services.extraction import SUPPORTED_SUFFIXES, text_stats
+from services.ingestion import (
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_READY,
+    ingestion_queue,
+)
+from services.retrieval import file_doc_id
 from utils.auth import get_current_user
-from utils.database import supabase
+from utils.config import settings
+from utils.metrics import span
+from utils.repository import file_repo, notebook_repo
+from utils.text_response import etag_matches, not_modified, text_response
 
 
 router = APIRouter()
 
+# Room for the multipart boundaries and the notebook_id form field.
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def _too_large() -> HTTPException:
+    limit_mb = settings.max_upload_bytes / (1024 * 1024)
+    return HTTPException(
+        status_code=413, detail=f"File too large (limit {limit_mb:.0f} MB)"
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads from their Content-Length, before the body is read.
 
-def _extract_text_from_pdf(path: str) -> str:
-    reader = PdfReader(path)
-    texts: list[str] = []
-    for page in reader.pages:
-        texts.append(page.extract_text() or "")
-    return "\n".join(texts)
+    Requests without a Content-Length (chunked) are still capped while the
+    file is spooled in `upload_file`.
+    """
 
+    def __init__(self, app) -> None:
+        self.app = app
 
-def _extract_text_from_docx(path: str) -> str:
-    return docx2txt.process(path) or ""
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"].rstrip("/") == "/upload"
+        ):
+            length = Headers(scope=scope).get("content-length")
+            limit = settings.max_upload_bytes + _MULTIPART_OVERHEAD_BYTES
+            if length and length.isdigit() and int(length) > limit:
+                exc = _too_large()
+                response = JSONResponse(
+                    status_code=exc.status_code, content={"detail": exc.detail}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
 
 
-def _extract_text_from_image(path: str) -> str:
-    img = Image.open(path)
-    return pytesseract.image_to_string(img)
+async def _spool_to_disk(file: UploadFile, suffix: str) -> tuple[str, str]:
+    """Copy the upload to a temp file in chunks, hashing it on the way.
+
+    Returns the temp file path and the SHA-256 hex digest; the caller owns
+    the file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp = NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        while True:
+            chunk = await file.read(settings.upload_chunk_bytes)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > settings.max_upload_bytes:
+                raise _too_large()
+            digest.update(chunk)
+            tmp.write(chunk)
+        tmp.close()
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    return tmp.name, digest.hexdigest()
 
 
-@router.post("")
+async def _find_duplicate(content_hash: str, user_id: str) -> dict | None:
+    """Return an earlier upload of the same bytes, preferring one already extracted.
+
+    Only the user's own files are considered: matching other accounts would
+    tell the uploader that someone else has the same document, and hand
+    them that user's text and storage object.
+    """
+    ready = await file_repo.find_by_hash(
+        content_hash,
+        user_id,
+        "storage_path, status, extracted_text, page_offsets",
+        status=STATUS_READY,
+    )
+    if ready is not None:
+        return ready
+    # Still being extracted (or failed): the stored object can be reused anyway.
+    return await file_repo.find_by_hash(content_hash, user_id, "storage_path, status")
+
+
+@router.post("", status_code=202)
 async def upload_file(
     notebook_id: str = Form(...),
     file: UploadFile = File(...),
     user=Depends(get_current_user),
 ):
     # Check notebook ownership
-    nb = (
-        supabase.table("notebooks")
-        .select("id, user_id")
-        .eq("id", notebook_id)
-        .limit(1)
-        .execute()
-    )
-    if not nb.data or nb.data[0]["user_id"] != user["id"]:
+    notebook = await notebook_repo.get_owned(notebook_id, user["id"])
+    if notebook is None:
         raise HTTPException(status_code=404, detail="Notebook not found")
 
     suffix = os.path.splitext(file.filename or "")[1].lower()
-    tmp = NamedTemporaryFile(delete=False, suffix=suffix)
-    try:
-        content = await file.read()
-        tmp.write(content)
-        tmp.flush()
-        tmp.close()
-
-        if suffix in [".pdf"]:
-            extracted_text = _extract_text_from_pdf(tmp.name)
-        elif suffix in [".doc", ".docx"]:
-            extracted_text = _extract_text_from_docx(tmp.name)
-        elif suffix in [".png", ".jpg", ".jpeg"]:
-            extracted_text = _extract_text_from_image(tmp.name)
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+    if suffix not in SUPPORTED_SUFFIXES:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
 
-        # Upload to Supabase storage
-        storage_path = f"{notebook_id}/{uuid.uuid4()}{suffix}"
-        with open(tmp.name, "rb") as f:
-            supabase.storage.from_("notebook-files").upload(
-                file=f, path=storage_path
+    with span("upload_spool"):
+        tmp_path, content_hash = await _spool_to_disk(file, suffix)
+    try:
+        with span("upload_dedupe"):
+            duplicate = await _find_duplicate(content_hash, user["id"])
+        if duplicate is not None and duplicate["status"] == STATUS_READY:
+            # Same bytes were already stored and extracted: reuse both.
+            stats = text_stats(
+                duplicate["extracted_text"], duplicate.get("page_offsets")
             )
-
-        resp = (
-            supabase.table("files")
-            .insert(
+            row = await file_repo.create(
                 {
                     "notebook_id": notebook_id,
-                    "storage_path": storage_path,
-                    "extracted_text": extracted_text,
+                    "storage_path": duplicate["storage_path"],
+                    "content_hash": content_hash,
+                    "status": STATUS_READY,
+                    "extracted_text": duplicate["extracted_text"],
+                    "page_offsets": duplicate.get("page_offsets"),
+                    **stats,
                 }
             )
-            .execute()
+            file_id = row["id"]
+            await document_changed(
+                notebook_id, file_doc_id(file_id), duplicate["extracted_text"] or ""
+            )
+            os.unlink(tmp_path)
+            return {
+                "job_id": file_id,
+                "file_id": file_id,
+                "notebook_id": notebook_id,
+                "status": STATUS_READY,
+                "progress": 1.0,
+                "error": None,
+                "content_hash": content_hash,
+                **stats,
+                "deduplicated": True,
+            }
+
+        if duplicate is not None:
+            storage_path = duplicate["storage_path"]
+        else:
+            # Upload to Supabase storage
+            storage_path = f"{notebook_id}/{uuid.uuid4()}{suffix}"
+            with span("upload_store"):
+                await file_repo.upload_object(storage_path, tmp_path)
+
+        row = await file_repo.create(
+            {
+                "notebook_id": notebook_id,
+                "storage_path": storage_path,
+                "content_hash": content_hash,
+                "status": STATUS_PENDING,
+            }
         )
-        return {"id": resp.data[0]["id"], "extracted_text": extracted_text}
-    finally:
+    except BaseException:
         try:
-            os.unlink(tmp.name)
+            os.unlink(tmp_path)
         except OSError:
             pass
+        raise
+
+    # The job owns the temp file from here on and removes it when done.
+    job = ingestion_queue.submit(
+        row["id"], notebook_id, user["id"], tmp_path, suffix, content_hash
+    )
+    return {**job.public(), "deduplicated": False}
+
+
+@router.get("/jobs/{job_id}")
+async def get_upload_job(job_id: str, user=Depends(get_current_user)):
+    job = ingestion_queue.get(job_id)
+    if job is not None and job.user_id != user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Poll while in progress without touching the database.
+    if job is not None and job.status not in (STATUS_READY, STATUS_FAILED):
+        return job.public()
+
+    # Finished, or not known to this worker: the files row is the source of truth.
+    row = await file_repo.get_owned(
+        job_id,
+        user["id"],
+        "id, notebook_id, status, error, content_hash, page_count, char_count",
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    ready = row["status"] == STATUS_READY
+    return {
+        "job_id": row["id"],
+        "file_id": row["id"],
+        "notebook_id": row["notebook_id"],
+        "status": row["status"],
+        "progress": 1.0 if ready else 0.0,
+        "error": row.get("error"),
+        "content_hash": row.get("content_hash"),
+        "page_count": row.get("page_count"),
+        "char_count": row.get("char_count"),
+    }
+
+
+def _text_span(
+    row: dict,
+    page: int | None,
+    pages: int,
+    offset: int | None,
+    length: int | None,
+) -> tuple[int, int]:
+    """Resolve the requested pages or characters to [start, end) offsets."""
+    total = row["char_count"] or 0
+    if page is not None and offset is not None:
+        raise HTTPException(status_code=400, detail="Use either page or offset")
+    if page is not None:
+        starts = row.get("page_offsets") or [0]
+        if page > len(starts):
+            raise HTTPException(
+                status_code=400, detail=f"page must be between 1 and {len(starts)}"
+            )
+        last = page - 1 + pages
+        # Pages are joined with one newline; leave it out of the slice.
+        return starts[page - 1], starts[last] - 1 if last < len(starts) else total
+    start = min(offset or 0, total)
+    return start, total if length is None else min(total, start + length)
 
 
+@router.get("/{file_id}/text")
+async def get_file_text(
+    file_id: str,
+    request: Request,
+    page: int | None = Query(None, ge=1),
+    pages: int = Query(1, ge=1),
+    offset: int | None = Query(None, ge=0),
+    length: int | None = Query(None, ge=1),
+    user=Depends(get_current_user),
+):
+    """Serve a file's extracted text as text/plain.
+
+    Without parameters that is all of it; `page` (1-based, with `pages` for
+    more than one) or `offset`/`length` (in characters) select a part.
+    Conditional GETs get a 304, a `Range: bytes=` header a 206, and the body
+    is compressed when the client accepts gzip or br.
+    """
+    row = await file_repo.get_owned(
+        file_id, user["id"], "id, status, char_count, page_count, page_offsets"
+    )
+    if row is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if row["status"] != STATUS_READY:
+        raise HTTPException(status_code=409, detail=f"File is {row['status']}")
+    start, end = _text_span(row, page, pages, offset, length)
+    # A ready file's text never changes, so the id and span identify it.
+    etag = f'W/"{file_id}:{start}-{end}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    with span("upload_text"):
+        text = await file_repo.get_text(file_id, start, end - start)
+    return text_response(
+        request,
+        text,
+        etag,
+        {
+            "X-Char-Range": f"{start}-{end}/{row['char_count'] or 0}",
+            "X-Page-Count": str(row.get("page_count") or 1),
+        },
+    )
@@ -0,0 +1,131 @@
+"""Small PDF, DOCX and PNG documents generated on the fly for upload traffic.
+
+Each call returns different bytes (the text is drawn from `rng`), so
+uploads go through storage and extraction instead of hitting the
+duplicate-file shortcut.
+"""
+import io
+import random
+import zipfile
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageDraw
+
+
+WORDS = (
+    "cell membrane protein enzyme energy photosynthesis mitochondria osmosis "
+    "diffusion gradient equation velocity momentum force derivative integral "
+    "theorem proof history revolution treaty empire economy market supply "
+    "demand algorithm complexity recursion graph vertex edge memory cache"
+).split()
+
+
+def paragraphs(rng: random.Random, count: int, words: int = 60) -> List[str]:
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+        for _ in range(count)
+    ]
+
+
+def make_pdf(rng: random.Random, pages: int = 3) -> bytes:
+    """A text PDF with one paragraph per page, built by hand (no writer dependency)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b""]
+    kids = []
+    for text in paragraphs(rng, pages, words=40):
+        lines = [text[i : i + 80] for i in range(0, len(text), 80)]
+        ops = ["BT /F1 11 Tf 14 TL 50 780 Td"]
+        for line in lines:
+            safe = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({safe}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (3 + 2 * pages, len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return out.getvalue()
+
+
+def make_docx(rng: random.Random, count: int = 6) -> bytes:
+    """A minimal WordprocessingML package; enough for docx2txt."""
+    body = "".join(
+        f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+        for text in paragraphs(rng, count)
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/'
+        f'wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>'
+    )
+    parts = {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/'
+            'vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>"
+        ),
+        "word/document.xml": document,
+    }
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+def make_png(rng: random.Random) -> bytes:
+    """A white page with a few lines of black text, as a scanned note would be."""
+    image = Image.new("L", (800, 300), color=255)
+    draw = ImageDraw.Draw(image)
+    text = paragraphs(rng, 1, words=30)[0]
+    for row, start in enumerate(range(0, len(text), 60)):
+        draw.text((20, 20 + 24 * row), text[start : start + 60], fill=0)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+MAKERS = {"pdf": make_pdf, "docx": make_docx, "png": make_png}
+
+
+def make_file(kind: str, rng: random.Random) -> Tuple[str, bytes, str]:
+    """Return (filename, bytes, content type) for one generated document."""
+    content_types = {
+        "pdf": "application/pdf",
+        "docx": "application/vnd.openxmlformats-officedocument."
+        "wordprocessingml.document",
+        "png": "image/png",
+    }
+    return f"bench.{kind}", MAKERS[kind](rng), content_types[kind]
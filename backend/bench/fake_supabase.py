@@ -0,0 +1,315 @@
+"""In-process stand-in for the parts of the Supabase client the app uses.
+
+Supports `table(...)` queries (select with embedded relations, insert,
+update, delete, eq/in_/lt filters, or_ over eq/lt/gt, order, limit, range),
+`storage.from_(...).upload(...)` and the `search_documents`/`file_text`
+functions through `rpc(...)`, all in memory. It keeps the benchmark offline
+and makes database round trips cheap and stable, so timings reflect the API
+code rather than the network. `install()` makes it the client behind
+`utils.database.supabase`.
+"""
+import copy
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Column defaults the real schema (see SETUP.md) fills in on insert.
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "chat_messages": {"compacted": False},
+    "chat_sessions": {"summary": None},
+    "notes": {"ai_summary": None},
+    "files": {
+        "extracted_text": None,
+        "page_offsets": None,
+        "error": None,
+        "page_count": None,
+        "char_count": None,
+    },
+}
+
+# (table, embedded relation) -> foreign key. Parents are embedded as one row,
+# children as a list.
+PARENTS = {("files", "notebooks"): "notebook_id", ("notes", "notebooks"): "notebook_id"}
+CHILDREN = {("notebooks", "notes"): "notebook_id", ("notebooks", "files"): "notebook_id"}
+
+_SELECT_ITEM = re.compile(r"\s*(\w+)(?:!inner)?\(([^)]*)\)\s*|\s*([\w*]+)\s*")
+
+
+class Response:
+    def __init__(self, data: Any) -> None:
+        self.data = data
+
+
+def _columns(spec: str) -> List[tuple]:
+    """Parse "a, b, rel(c, d)" into [(name, None), ..., (rel, "c, d")]."""
+    items = []
+    for match in _SELECT_ITEM.finditer(spec):
+        if match.group(1):
+            items.append((match.group(1), match.group(2)))
+        elif match.group(3):
+            items.append((match.group(3), None))
+    return items
+
+
+_COMPARE = {
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "gt": lambda a, b: a > b,
+}
+
+
+def _split(expr: str) -> List[str]:
+    """Split a PostgREST logic list on the commas outside parentheses/quotes."""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in expr:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in "()":
+            depth += 1 if char == "(" else -1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    return parts + [current]
+
+
+def _condition(expr: str) -> Callable[[Dict[str, Any]], bool]:
+    """Compile "a.lt.1" or "and(a.eq.1,b.lt.2)" into a row predicate."""
+    for combine, prefix in ((all, "and("), (any, "or(")):
+        if expr.startswith(prefix):
+            checks = [_condition(part) for part in _split(expr[len(prefix) : -1])]
+            return lambda row: combine(check(row) for check in checks)
+    column, op, value = expr.split(".", 2)
+    value = value.strip('"')
+    compare = _COMPARE[op]
+    return lambda row: row.get(column) is not None and compare(str(row[column]), value)
+
+
+def _pick(row: Dict[str, Any], spec: str) -> Dict[str, Any]:
+    names = [c.strip() for c in spec.split(",") if c.strip()]
+    if names == ["*"]:
+        return dict(row)
+    return {name: row.get(name) for name in names}
+
+
+class Query:
+    def __init__(self, db: "FakeSupabase", table: str) -> None:
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.spec = "*"
+        self.payload: Any = None
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.count: Optional[int] = None
+        self.offset = 0
+
+    def select(self, spec: str = "*", **_: Any) -> "Query":
+        self.op, self.spec = "select", spec
+        return self
+
+    def insert(self, payload: Any) -> "Query":
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload: Dict[str, Any]) -> "Query":
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self) -> "Query":
+        self.op = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "Query":
+        if "." in column:
+            # Filter on an embedded parent ("notebooks.user_id").
+            relation, name = column.split(".", 1)
+            key = PARENTS[(self.table, relation)]
+            self.filters.append(
+                lambda row: (self.db.by_id(relation, row.get(key)) or {}).get(name)
+                == value
+            )
+            return self
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "Query":
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def lt(self, column: str, value: Any) -> "Query":
+        self.filters.append(
+            lambda row: row.get(column) is not None and row.get(column) < value
+        )
+        return self
+
+    def or_(self, filters: str) -> "Query":
+        self.filters.append(_condition(f"or({filters})"))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "Query":
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "Query":
+        self.count = count
+        return self
+
+    def range(self, start: int, end: int) -> "Query":
+        self.offset, self.count = start, end - start + 1
+        return self
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, sub in _columns(self.spec):
+            if sub is None:
+                out.update(row if name == "*" else {name: row.get(name)})
+            elif (self.table, name) in PARENTS:
+                key = row.get(PARENTS[(self.table, name)])
+                parent = self.db.by_id(name, key)
+                out[name] = _pick(parent, sub) if parent else None
+            else:
+                key = CHILDREN[(self.table, name)]
+                out[name] = [
+                    _pick(child, sub)
+                    for child in self.db.tables.get(name, [])
+                    if child.get(key) == row["id"]
+                ]
+        return copy.deepcopy(out)
+
+    def execute(self) -> Response:
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op == "insert":
+                items = self.payload if isinstance(self.payload, list) else [self.payload]
+                inserted = [self.db.insert(self.table, item) for item in items]
+                return Response(copy.deepcopy(inserted))
+            matched = [row for row in rows if all(f(row) for f in self.filters)]
+            if self.op == "update":
+                for row in matched:
+                    row.update(copy.deepcopy(self.payload))
+                return Response(copy.deepcopy(matched))
+            if self.op == "delete":
+                for row in matched:
+                    rows.remove(row)
+                    self.db.index.pop((self.table, row["id"]), None)
+                return Response(copy.deepcopy(matched))
+            # Stable sorts, last key first, give the multi-column order.
+            for column, desc in reversed(self.ordering):
+                matched.sort(key=lambda row: str(row.get(column)), reverse=desc)
+            if self.count is not None:
+                matched = matched[self.offset : self.offset + self.count]
+            return Response([self._project(row) for row in matched])
+
+
+class _Bucket:
+    def __init__(self, db: "FakeSupabase", name: str) -> None:
+        self.db = db
+        self.name = name
+
+    def upload(self, file: Any, path: str, file_options: Any = None) -> None:
+        data = file.read() if hasattr(file, "read") else file
+        with self.db.lock:
+            self.db.objects[(self.name, path)] = data
+
+
+class _Storage:
+    def __init__(self, db: "FakeSupabase") -> None:
+        self.db = db
+
+    def from_(self, bucket: str) -> _Bucket:
+        return _Bucket(self.db, bucket)
+
+
+class _Rpc:
+    def __init__(self, result: Any) -> None:
+        self.result = result
+
+    def execute(self) -> Response:
+        return Response(self.result)
+
+
+class FakeSupabase:
+    def __init__(self) -> None:
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.index: Dict[tuple, Dict[str, Any]] = {}
+        self.objects: Dict[tuple, bytes] = {}
+        self.lock = threading.RLock()
+        self.storage = _Storage(self)
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+    def by_id(self, table: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        return self.index.get((table, row_id))
+
+    def insert(self, table: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        row = {
+            "id": str(uuid.uuid4()),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **DEFAULTS.get(table, {}),
+            **copy.deepcopy(item),
+        }
+        self.tables.setdefault(table, []).append(row)
+        self.index[(table, row["id"])] = row
+        return row
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> _Rpc:
+        if name == "search_documents":
+            return _Rpc(self._search(params))
+        if name == "file_text":
+            with self.lock:
+                row = self.by_id("files", params["p_file_id"]) or {}
+                text = row.get("extracted_text") or ""
+            start = params["p_start"]
+            return _Rpc(text[start : start + params["p_length"]])
+        raise ValueError(f"Unknown function: {name}")
+
+    def _search(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Substring match scored by occurrence count; enough to exercise the
+        # endpoint's paging without Postgres full-text search.
+        words = [w.lower() for w in re.findall(r"\w+", params["p_query"])]
+        after = (params.get("p_after_score"), params.get("p_after_id"))
+        hits = []
+        with self.lock:
+            for kind, table, column in (
+                ("note", "notes", "content"),
+                ("file", "files", "extracted_text"),
+            ):
+                for row in self.tables.get(table, []):
+                    notebook = self.by_id("notebooks", row.get("notebook_id"))
+                    body = (row.get(column) or "").lower()
+                    if notebook is None or notebook["user_id"] != params["p_user_id"]:
+                        continue
+                    if not words or not all(w in body for w in words):
+                        continue
+                    score = -float(sum(body.count(w) for w in words))
+                    if after[0] is not None and (score, row["id"]) <= after:
+                        continue
+                    hits.append(
+                        {
+                            "type": kind,
+                            "id": row["id"],
+                            "notebook_id": row["notebook_id"],
+                            "notebook_title": notebook["title"],
+                            "storage_path": row.get("storage_path"),
+                            "snippet": (row.get(column) or "")[:120],
+                            "score": score,
+                        }
+                    )
+        hits.sort(key=lambda hit: (hit["score"], hit["id"]))
+        return hits[: params["p_limit"]]
+
+
+def install() -> FakeSupabase:
+    """Make a fresh fake the client behind `utils.database.supabase`."""
+    import utils.database
+
+    fake = FakeSupabase()
+    utils.database._supabase_client = fake
+    return fake
@@ -0,0 +1,490 @@
+"""Endpoint latency benchmark.
+
+Starts the Ollama stub (tools/ollama_stub.py) and the API backed by an
+in-process fake Supabase (bench.server), each in its own process on a free
+local port, then drives a weighted mix of login, notebook CRUD, search,
+upload and chat traffic from `--concurrency` closed-loop clients for
+`--duration` seconds. Prints (or writes with `--output`) JSON with the
+throughput, error count and p50/p95/p99 latency of every route. Pass
+`--baseline` an earlier result to compare p95s; with `--max-regression`
+the exit status is 1 when any route got slower than that.
+
+Run from backend/:
+
+    python -m bench.run --duration 30 --concurrency 16 --output bench.json
+    python -m bench.run --baseline bench.json --max-regression 20
+
+Everything runs offline. App settings can still be overridden through the
+environment (e.g. OLLAMA_MAX_CONCURRENCY=8 python -m bench.run).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.corpus import MAKERS, make_file, paragraphs
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+DEFAULT_MIX = "login=1,notebooks=4,search=2,upload=1,chat=2,chat_stream=1"
+QUESTIONS = (
+    "What is osmosis?",
+    "Summarize the part about market supply and demand.",
+    "Explain recursion with an example from the notes.",
+    "Which equations relate velocity and momentum?",
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _quantile(values: List[float], q: float) -> float:
+    # Nearest rank on sorted values.
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+
+def _is_error(status: str) -> bool:
+    # HTTP statuses, exception names, or upload job states.
+    if status.isdigit():
+        return int(status) >= 400
+    return status != "ready"
+
+
+class Recorder:
+    """Latencies and status codes per route, ignoring the warm-up period."""
+
+    def __init__(self, measure_from: float) -> None:
+        self.measure_from = measure_from
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route: str, started: float, seconds: float, status: Any) -> None:
+        if started < self.measure_from:
+            return
+        self.latencies[route].append(seconds)
+        self.statuses[route][str(status)] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        routes = {}
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            statuses = dict(self.statuses[route])
+            errors = sum(n for code, n in statuses.items() if _is_error(code))
+            routes[route] = {
+                "count": len(values),
+                "errors": errors,
+                "rps": round(len(values) / elapsed, 3),
+                "mean_ms": round(1000 * sum(values) / len(values), 2),
+                "p50_ms": round(1000 * _quantile(values, 0.50), 2),
+                "p95_ms": round(1000 * _quantile(values, 0.95), 2),
+                "p99_ms": round(1000 * _quantile(values, 0.99), 2),
+                "max_ms": round(1000 * values[-1], 2),
+                "status": statuses,
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "requests": total,
+            "errors": sum(r["errors"] for r in routes.values()),
+            "rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+class Client:
+    """One simulated user: an account, a notebook and a request loop."""
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, rng: random.Random):
+        self.http = http
+        self.recorder = recorder
+        self.rng = rng
+        self.email = ""
+        self.password = "bench-password"
+        self.token = ""
+        self.notebook_id = ""
+        self.upload_kinds = ["pdf", "docx", "png"]
+
+    async def call(self, route: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send one request, recording its latency under `route`."""
+        if self.token:
+            kwargs.setdefault("headers", {})["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            self.recorder.add(route, started, time.perf_counter() - started, type(exc).__name__)
+            raise
+        self.recorder.add(route, started, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def setup(self, index: int) -> None:
+        self.email = f"bench{index}@example.com"
+        await self.call(
+            "POST /auth/signup",
+            "POST",
+            "/auth/signup",
+            json={"email": self.email, "password": self.password},
+        )
+        await self.login()
+        notebook = await self.call(
+            "POST /notebooks/create",
+            "POST",
+            "/notebooks/create",
+            json={"title": f"Bench notebook {index}"},
+        )
+        self.notebook_id = notebook.json()["id"]
+        await self.save_note()
+
+    async def login(self) -> None:
+        self.token = ""
+        response = await self.call(
+            "POST /auth/login",
+            "POST",
+            "/auth/login",
+            json={"email": self.email, "password": self.password},
+        )
+        self.token = response.json()["access_token"]
+
+    async def save_note(self) -> None:
+        await self.call(
+            "POST /notebooks/notes",
+            "POST",
+            "/notebooks/notes",
+            json={
+                "notebook_id": self.notebook_id,
+                "content": "\n\n".join(paragraphs(self.rng, 8)),
+            },
+        )
+
+    async def notebooks(self) -> None:
+        await self.call(
+            "GET /notebooks/list",
+            "GET",
+            "/notebooks/list",
+            params={"fields": "id,title,description"},
+        )
+        await self.call(
+            "GET /notebooks/{notebook_id}", "GET", f"/notebooks/{self.notebook_id}"
+        )
+        await self.call(
+            "GET /notebooks/{notebook_id}/files",
+            "GET",
+            f"/notebooks/{self.notebook_id}/files",
+        )
+        await self.call(
+            "GET /notebooks/notes/{notebook_id}",
+            "GET",
+            f"/notebooks/notes/{self.notebook_id}",
+        )
+        await self.save_note()
+
+    async def search(self) -> None:
+        query = self.rng.choice(("osmosis", "market demand", "graph vertex", "proof"))
+        await self.call(
+            "GET /notebooks/search", "GET", "/notebooks/search", params={"q": query}
+        )
+
+    async def upload(self) -> None:
+        kind = self.rng.choice(self.upload_kinds)
+        name, data, content_type = make_file(kind, self.rng)
+        response = await self.call(
+            f"POST /upload ({kind})",
+            "POST",
+            "/upload",
+            data={"notebook_id": self.notebook_id},
+            files={"file": (name, data, content_type)},
+        )
+        if response.status_code != 202:
+            return
+        job_id = response.json()["job_id"]
+        started = time.perf_counter()
+        for _ in range(100):
+            job = await self.call(
+                "GET /upload/jobs/{job_id}", "GET", f"/upload/jobs/{job_id}"
+            )
+            if job.status_code != 200 or job.json()["status"] in ("ready", "failed"):
+                break
+            await asyncio.sleep(0.05)
+        # Time from accepted upload to extracted (or failed) text.
+        self.recorder.add(
+            f"upload -> processed ({kind})",
+            started,
+            time.perf_counter() - started,
+            job.json().get("status") if job.status_code == 200 else job.status_code,
+        )
+        if job.status_code == 200 and job.json()["status"] == "ready":
+            await self.call(
+                "GET /upload/{file_id}/text",
+                "GET",
+                f"/upload/{job_id}/text",
+                params={"page": 1},
+                headers={"Accept-Encoding": "gzip"},
+            )
+
+    def _chat_body(self) -> Dict[str, Any]:
+        return {
+            "notebook_id": self.notebook_id,
+            "messages": [{"role": "user", "content": self.rng.choice(QUESTIONS)}],
+        }
+
+    async def chat(self) -> None:
+        await self.call("POST /ai/chat", "POST", "/ai/chat", json=self._chat_body())
+
+    async def chat_stream(self) -> None:
+        route = "POST /ai/chat/stream"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        started = time.perf_counter()
+        first_token: Optional[float] = None
+        try:
+            async with self.http.stream(
+                "POST", "/ai/chat/stream", json=self._chat_body(), headers=headers
+            ) as response:
+                async for line in response.aiter_lines():
+                    if first_token is None and line.startswith("event: token"):
+                        first_token = time.perf_counter() - started
+                status = response.status_code
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        self.recorder.add(route, started, time.perf_counter() - started, status)
+        if first_token is not None:
+            self.recorder.add(f"{route} (first token)", started, first_token, status)
+
+
+async def _wait_for(url: str, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(process.args)} exited early")
+            try:
+                if (await http.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def _parse_mix(spec: str, available: List[str]) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in available:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(available)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="studymate-bench-"))
+    ollama_port, app_port = _free_port(), _free_port()
+    env = {
+        # Placeholders so settings validate; the fake client is never configured.
+        "SUPABASE_URL": "https://bench.invalid",
+        "SUPABASE_KEY": "bench",
+        "JWT_SECRET_KEY": "bench-secret",
+        **os.environ,
+        "USE_LOCAL_DB": "false",
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "OLLAMA_BASE_URLS": "",
+        "RESPONSE_CACHE_PATH": str(workdir / "llm_cache.db"),
+        "LOCAL_STORAGE_PATH": str(workdir / "storage"),
+    }
+    log = open(workdir / "bench.log", "wb")
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            str(BACKEND_DIR / "tools" / "ollama_stub.py"),
+            "--port", str(ollama_port),
+            "--delay", str(args.ollama_latency),
+            "--load-delay", "0",
+            "--tokens-per-second", str(args.ollama_tps),
+            "--tokens", str(args.ollama_tokens),
+            "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "bench.server", "--port", str(app_port)],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        await _wait_for(f"http://127.0.0.1:{ollama_port}/api/tags", 30, stub)
+        await _wait_for(f"http://127.0.0.1:{app_port}/ready", 60, server)
+
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{app_port}", timeout=120, limits=limits
+        ) as http:
+            setup_recorder = Recorder(measure_from=float("inf"))
+            clients = [
+                Client(http, setup_recorder, random.Random(rng.random()))
+                for _ in range(args.concurrency)
+            ]
+            await asyncio.gather(*(c.setup(i) for i, c in enumerate(clients)))
+
+            scenarios = {
+                "login": lambda c: c.login(),
+                "notebooks": lambda c: c.notebooks(),
+                "search": lambda c: c.search(),
+                "upload": lambda c: c.upload(),
+                "chat": lambda c: c.chat(),
+                "chat_stream": lambda c: c.chat_stream(),
+            }
+            mix = _parse_mix(args.mix, list(scenarios))
+            names, weights = list(mix), list(mix.values())
+
+            start = time.perf_counter()
+            recorder = Recorder(measure_from=start + args.warmup)
+            end = start + args.warmup + args.duration
+
+            async def loop(client: Client) -> None:
+                client.recorder = recorder
+                client.upload_kinds = args.upload_kinds.split(",")
+                while time.perf_counter() < end:
+                    name = client.rng.choices(names, weights)[0]
+                    try:
+                        await scenarios[name](client)
+                    except (httpx.HTTPError, KeyError, ValueError):
+                        pass  # already recorded as an error
+                    if args.think_time:
+                        await asyncio.sleep(client.rng.expovariate(1 / args.think_time))
+
+            await asyncio.gather(*(loop(c) for c in clients))
+            elapsed = time.perf_counter() - recorder.measure_from
+    finally:
+        for process in (server, stub):
+            process.terminate()
+        for process in (server, stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log.close()
+        print(f"Server logs: {workdir / 'bench.log'}", file=sys.stderr)
+
+    result = recorder.report(elapsed)
+    result["config"] = {
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "think_time": args.think_time,
+        "seed": args.seed,
+        "ollama_latency": args.ollama_latency,
+        "ollama_tps": args.ollama_tps,
+        "ollama_tokens": args.ollama_tokens,
+        "upload_kinds": args.upload_kinds,
+        # Without tesseract, PNG uploads are accepted but fail extraction.
+        "ocr_available": shutil.which("tesseract") is not None,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+    return result
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """p95 and throughput change per route, in percent of the baseline."""
+    changes = {}
+    for route, now in result["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before or not before["p95_ms"]:
+            continue
+        changes[route] = {
+            "p95_ms": [before["p95_ms"], now["p95_ms"]],
+            "p95_change_pct": round(100 * (now["p95_ms"] / before["p95_ms"] - 1), 1),
+            "rps": [before["rps"], now["rps"]],
+        }
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds first")
+    parser.add_argument("--concurrency", type=int, default=8, help="simulated users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="mean pause between scenarios (s)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--ollama-latency", type=float, default=0.2, help="stub time to first token (s)"
+    )
+    parser.add_argument(
+        "--ollama-tps", type=float, default=50.0, help="stub tokens per second"
+    )
+    parser.add_argument(
+        "--ollama-tokens", type=int, default=64, help="stub answer length (tokens)"
+    )
+    parser.add_argument(
+        "--upload-kinds", default="pdf,docx,png", help="documents to upload"
+    )
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="exit 1 if any route's p95 is this many percent above the baseline",
+    )
+    args = parser.parse_args()
+    unknown = set(args.upload_kinds.split(",")) - set(MAKERS)
+    if unknown:
+        parser.error(f"unknown upload kinds: {', '.join(sorted(unknown))}")
+
+    result = asyncio.run(run(args))
+    regressed = []
+    if args.baseline:
+        result["comparison"] = compare(result, json.loads(Path(args.baseline).read_text()))
+        if args.max_regression is not None:
+            regressed = [
+                route
+                for route, change in result["comparison"].items()
+                if change["p95_change_pct"] > args.max_regression
+            ]
+            result["regressed"] = regressed
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    if regressed:
+        print(f"p95 regressed on: {', '.join(regressed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Serve the API backed by the in-process fake Supabase (started by bench.run).
+
+Runs in its own process so the load generator doesn't share the app's
+event loop. Settings come from the environment `bench.run` prepares.
+"""
+import argparse
+
+import uvicorn
+
+from bench import fake_supabase
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, required=True)
+    args = parser.parse_args()
+
+    fake_supabase.install()
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
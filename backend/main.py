@@ -1,13 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from api import auth, notebooks, upload, ai
-from utils.database import get_supabase
+from services.ingestion import ingestion_queue
+from services.llm_scheduler import SchedulerSaturated, llm_scheduler
+from services.ollama_service import ollama_client
+from services.retrieval import retrieval_index
+from services.warmup import warmup
+from utils.database import check_supabase_settings
 from utils.config import settings
+from utils import metrics
 
 
 app = FastAPI(title="AI Study Notebook API")
 
+# Added before CORS so CORS stays outermost and 413s still carry its headers.
+app.add_middleware(upload.UploadSizeLimitMiddleware)
+app.add_middleware(metrics.TimingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173", "*"],
@@ -21,15 +32,15 @@ app.add_middleware(
 async def validate_startup():
     """Validate critical configuration at startup so failures are visible early.
 
-    This calls into `get_supabase()` which raises a ValueError when SUPABASE_URL
-    or SUPABASE_KEY are missing or left as placeholders. We also check the
-    JWT secret so authentication won't silently fail.
+    This checks SUPABASE_URL and SUPABASE_KEY (a ValueError when missing or
+    left as placeholders); the client itself is created during warm-up. We
+    also check the JWT secret so authentication won't silently fail.
     """
     # If configured to use the local DB for development, skip Supabase validation.
     if not settings.use_local_db:
         # Validate Supabase configuration (will raise ValueError with helpful text)
         try:
-            get_supabase()
+            check_supabase_settings()
         except Exception as exc:  # keep broad to convert to RuntimeError with context
             raise RuntimeError(f"Startup validation failed: {exc}")
 
@@ -40,11 +51,81 @@ async def validate_startup():
         )
 
 
+@app.on_event("startup")
+async def start_background_services():
+    ollama_client.start()
+    ingestion_queue.start()
+    ingestion_queue.recover()
+    warmup.start()
+
+
+@app.on_event("shutdown")
+async def close_background_services():
+    await warmup.close()
+    await ingestion_queue.close()
+    await retrieval_index.close()
+    await ollama_client.close()
+
+
+@app.exception_handler(SchedulerSaturated)
+async def scheduler_saturated_handler(request: Request, exc: SchedulerSaturated):
+    # Routes reserve their first queue place before they start (a 429 from
+    # the _llm_user dependency). This covers any further Ollama calls of a
+    # request, e.g. the map phase of a map-reduce summary, made before the
+    # response starts. In a stream, once the headers are sent, a failure
+    # like this can only reach the client as an `error` event.
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "The AI service is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def readiness():
+    """503 until startup warm-up has finished; use this for readiness probes."""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.stats())
+
+
+@app.get("/health/ollama")
+async def ollama_health():
+    """Per-backend health, circuit state, load and loaded models."""
+    return {"backends": ollama_client.pool.stats()}
+
+
+metrics.register_gauge(
+    "llm_queue_requests",
+    "LLM requests holding a generation slot (active) or waiting (queued).",
+    lambda: [({"state": s}, llm_scheduler.stats()[s]) for s in ("active", "queued")],
+)
+metrics.register_gauge(
+    "ollama_backend_outstanding",
+    "Requests in flight per Ollama backend.",
+    lambda: [
+        ({"backend": b["url"]}, b["outstanding"]) for b in ollama_client.pool.stats()
+    ],
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request, stage and Ollama token metrics in Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/metrics/llm-queue")
+async def llm_queue_metrics():
+    """Queue depth, rejections and queue-wait times per priority class."""
+    return llm_scheduler.stats()
+
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(notebooks.router, prefix="/notebooks", tags=["notebooks"])
 app.include_router(upload.router, prefix="/upload", tags=["upload"])
@@ -1,7 +1,7 @@
 from datetime import datetime, date
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict, Literal, Union
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, conint, conlist, constr
 
 
 class UserCreate(BaseModel):
@@ -49,9 +49,41 @@ class NoteOut(BaseModel):
     ai_summary: Optional[str] = None
 
 
+class SearchHit(BaseModel):
+    type: Literal["note", "file"]
+    id: str
+    notebook_id: str
+    notebook_title: str
+    storage_path: Optional[str] = None  # files only
+    # Matching excerpt; matched terms are wrapped in <mark>...</mark> and the
+    # rest is raw document text (escape it before rendering as HTML).
+    snippet: str
+    score: float  # higher is more relevant
+
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+
+class Page(BaseModel):
+    # Rows hold only the requested `fields`, so they aren't validated
+    # against the full row models.
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
 class AIRequest(BaseModel):
     notebook_id: Optional[str] = None
     text: str
+    # Skip the response cache lookup and regenerate (the fresh answer is cached).
+    no_cache: bool = False
+
+
+class SummaryRequest(AIRequest):
+    # "map_reduce" summarizes the notebook chunk by chunk and merges the
+    # results; "auto" does so only for notebooks too large for one prompt.
+    mode: Literal["auto", "single", "map_reduce"] = "auto"
 
 
 class QuizRequest(BaseModel):
@@ -59,12 +91,46 @@ class QuizRequest(BaseModel):
     text: str
     level: Optional[str] = "medium"
     qtype: Optional[str] = "mix"
+    no_cache: bool = False
 
 
 class StudyPlanRequest(BaseModel):
     notebook_id: Optional[str] = None
     text: str
     exam_date: Optional[date] = None
+    no_cache: bool = False
+
+
+# Items parsed out of model output; one row each in flashcards / quiz_questions.
+class FlashcardItem(BaseModel):
+    front: constr(strip_whitespace=True, min_length=1)
+    back: constr(strip_whitespace=True, min_length=1)
+
+
+class QuizQuestionItem(BaseModel):
+    type: Optional[str] = None
+    question: constr(strip_whitespace=True, min_length=1)
+    options: Optional[Union[List[str], Dict[str, str]]] = None
+    answer: Optional[Any] = None
+    explanation: Optional[str] = None
+
+
+StudyPackArtifact = Literal["summary", "flashcards", "quiz", "study_plan"]
+
+
+class StudyPackRequest(BaseModel):
+    notebook_id: Optional[str] = None
+    text: str
+    artifacts: conlist(StudyPackArtifact, min_items=1) = [
+        "summary",
+        "flashcards",
+        "quiz",
+        "study_plan",
+    ]
+    level: Optional[str] = "medium"
+    qtype: Optional[str] = "mix"
+    exam_date: Optional[date] = None
+    no_cache: bool = False
 
 
 class ChatMessage(BaseModel):
@@ -77,6 +143,18 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage]
 
 
+class ChatSessionCreate(BaseModel):
+    notebook_id: Optional[str] = None
+    title: Optional[str] = None
+    # Tokens of history kept verbatim before older turns are summarised;
+    # clamped to what the model's context window can hold.
+    token_budget: Optional[conint(ge=256)] = None
+
+
+class ChatSessionMessage(BaseModel):
+    content: constr(strip_whitespace=True, min_length=1, max_length=8000)
+
+
 class ExamCreate(BaseModel):
     subject: str
     exam_date: date
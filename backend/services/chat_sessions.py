@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import weakref
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.llm_scheduler import Priority, scheduled_as
+from services.ollama_service import generate_ollama_with_state
+from services.prompt_budget import count_tokens
+from utils.config import settings
+from utils.repository import chat_message_repo, chat_session_repo
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a study conversation between a student "
+    "and an AI assistant. Update the summary with the new exchanges below. Keep "
+    "facts, definitions, decisions and open questions; drop pleasantries. "
+    "Reply with the updated summary only.\n\n"
+    "Current summary:\n{summary}\n\nNew exchanges:\n{transcript}"
+)
+
+# One lock per session makes storing a compaction (summary + compacted
+# flags) atomic with respect to history reads, so a turn never sees
+# half-compacted history. It is never held across the summary generation.
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_tasks: set[asyncio.Task] = set()
+# Sessions with a compaction in flight; a second one would fold the same turns.
+_compacting: set[str] = set()
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[session_id] = lock
+    return lock
+
+
+def now() -> str:
+    """Timestamp for chat messages; take it when the question arrives."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _history_tokens(session: Dict[str, Any], history: List[Dict[str, Any]]) -> int:
+    return count_tokens(session.get("summary") or "") + sum(
+        m["tokens"] for m in history
+    )
+
+
+async def load_session(
+    session_id: str, user_id: str
+) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Return an owned session and its active (not compacted) messages.
+
+    Waits only while a finished compaction is being stored, so the summary
+    and history are read consistently.
+    """
+    async with _session_lock(session_id):
+        session, history = await asyncio.gather(
+            chat_session_repo.get_owned(session_id, user_id),
+            chat_message_repo.list_for_session(session_id),
+        )
+    if session is None:
+        return None, []
+    return session, history
+
+
+def build_messages(
+    session: Dict[str, Any],
+    history: List[Dict[str, Any]],
+    system_prompt: str,
+    context: str,
+    content: str,
+) -> List[Dict[str, str]]:
+    """Assemble /api/chat messages: system (+context, +summary), history, new turn.
+
+    If history is still over the session budget (compaction pending or
+    failed), the oldest turns are left out of the prompt.
+    """
+    system = system_prompt
+    if context:
+        system += f"\n\nNotebook context:\n{context}"
+    if session.get("summary"):
+        system += f"\n\nSummary of the earlier conversation:\n{session['summary']}"
+
+    budget = session["token_budget"]
+    kept: List[Dict[str, Any]] = []
+    used = count_tokens(session.get("summary") or "") + count_tokens(content)
+    for message in reversed(history):
+        if used + message["tokens"] > budget:
+            break
+        kept.append(message)
+        used += message["tokens"]
+    kept.reverse()
+
+    messages = [{"role": "system", "content": system}]
+    messages += [{"role": m["role"], "content": m["content"]} for m in kept]
+    messages.append({"role": "user", "content": content})
+    return messages
+
+
+async def record_turn(
+    session: Dict[str, Any], question: str, answer: str, asked_at: str
+) -> None:
+    """Persist a question/answer pair and compact the session in the background."""
+    await chat_message_repo.create_many(
+        session["id"],
+        [
+            {
+                "role": "user",
+                "content": question,
+                "tokens": count_tokens(question),
+                "created_at": asked_at,
+            },
+            {
+                "role": "assistant",
+                "content": answer,
+                "tokens": count_tokens(answer),
+                "created_at": now(),
+            },
+        ],
+    )
+    task = asyncio.create_task(compact_session(session["id"], session["user_id"]))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def compact_session(session_id: str, user_id: str) -> bool:
+    """Fold the oldest turns into the rolling summary if over budget.
+
+    Keeps at least `chat_keep_recent_messages` verbatim and folds until the
+    history is back to half the budget, so compaction doesn't run again on
+    the very next turn. Returns True if anything was compacted.
+    """
+    if session_id in _compacting:
+        return False
+    _compacting.add(session_id)
+    try:
+        return await _compact(session_id, user_id)
+    finally:
+        _compacting.discard(session_id)
+
+
+async def _compact(session_id: str, user_id: str) -> bool:
+    session, history = await load_session(session_id, user_id)
+    if session is None:
+        return False
+    budget = session["token_budget"]
+    if _history_tokens(session, history) <= budget:
+        return False
+
+    foldable = history[: max(0, len(history) - settings.chat_keep_recent_messages)]
+    remaining = _history_tokens(session, history)
+    fold: List[Dict[str, Any]] = []
+    for message in foldable:
+        if remaining <= budget // 2:
+            break
+        fold.append(message)
+        remaining -= message["tokens"]
+    if not fold:
+        return False
+
+    # Generate without the session lock: the next turn reads the current
+    # history (trimmed by build_messages) instead of waiting for this.
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in fold)
+    try:
+        # Runs after the turn was answered; don't compete with live chat.
+        with scheduled_as(Priority.BATCH, user_id):
+            summary, _ = await generate_ollama_with_state(
+                SUMMARY_PROMPT.format(
+                    summary=session.get("summary") or "(none yet)",
+                    transcript=transcript,
+                ),
+                options={"num_predict": settings.chat_summary_max_tokens},
+            )
+    except Exception:
+        # Keep the full history; build_messages still trims the prompt.
+        logger.exception("Compacting chat session %s failed", session_id)
+        return False
+
+    async with _session_lock(session_id):
+        current, active = await asyncio.gather(
+            chat_session_repo.get_owned(session_id, user_id),
+            chat_message_repo.list_for_session(session_id),
+        )
+        active_ids = {m["id"] for m in active}
+        if (
+            current is None
+            or current.get("summary") != session.get("summary")
+            or any(m["id"] not in active_ids for m in fold)
+        ):
+            # Summarised from a state that has changed since; drop it.
+            return False
+        await chat_session_repo.set_summary(session_id, summary)
+        await chat_message_repo.mark_compacted([m["id"] for m in fold])
+    return True
@@ -0,0 +1,12 @@
+from services.context_cache import context_cache
+from services.response_cache import response_cache
+from services.retrieval import retrieval_index
+
+
+# Routers call this after a note or file write has been committed, so every
+# structure derived from notebook content stays current without a refetch.
+async def document_changed(notebook_id: str, doc_id: str, text: str) -> None:
+    context_cache.write_document(notebook_id, doc_id, text)
+    await retrieval_index.index_document(notebook_id, doc_id, text)
+    # Cached answers for the old content can never be hit again; free the space.
+    await response_cache.apurge_notebook(notebook_id)
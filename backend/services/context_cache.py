@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import settings
+
+
+@dataclass(frozen=True)
+class NotebookSnapshot:
+    """Everything needed to build AI context for one notebook."""
+
+    notebook: Dict[str, Any]
+    documents: Dict[str, str]
+    size: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self, "size", sum(len(text) for text in self.documents.values())
+        )
+
+
+class NotebookContextCache:
+    """Size-bounded LRU of notebook snapshots keyed by (notebook_id, version).
+
+    Each notebook has a content version that is bumped on every write, so a
+    stale entry can never be served. Writes go through `write_document`,
+    which re-keys a cached snapshot under the new version with the changed
+    document applied instead of dropping it, so the next chat turn after a
+    note save is still a hit.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, int], NotebookSnapshot]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, notebook_id: str) -> Tuple[str, int]:
+        return (notebook_id, self._versions.get(notebook_id, 0))
+
+    def get(self, notebook_id: str) -> Optional[NotebookSnapshot]:
+        with self._lock:
+            key = self._key(notebook_id)
+            snapshot = self._entries.get(key)
+            if snapshot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return snapshot
+
+    def version(self, notebook_id: str) -> int:
+        with self._lock:
+            return self._versions.get(notebook_id, 0)
+
+    def put(self, notebook_id: str, version: int, snapshot: NotebookSnapshot) -> None:
+        """Cache a snapshot loaded while the notebook was at `version`.
+
+        If a write landed while the snapshot was being fetched the version has
+        moved on, and the possibly stale snapshot is discarded.
+        """
+        with self._lock:
+            if self._versions.get(notebook_id, 0) == version:
+                self._store((notebook_id, version), snapshot)
+
+    def write_document(self, notebook_id: str, doc_id: str, text: str) -> None:
+        with self._lock:
+            old = self._entries.pop(self._key(notebook_id), None)
+            if old is not None:
+                self._bytes -= old.size
+            self._versions[notebook_id] = self._versions.get(notebook_id, 0) + 1
+            self.invalidations += 1
+            if old is not None:
+                documents = dict(old.documents)
+                documents[doc_id] = text
+                self._store(
+                    self._key(notebook_id), NotebookSnapshot(old.notebook, documents)
+                )
+
+    def invalidate(self, notebook_id: str) -> None:
+        with self._lock:
+            old = self._entries.pop(self._key(notebook_id), None)
+            if old is not None:
+                self._bytes -= old.size
+            self._versions[notebook_id] = self._versions.get(notebook_id, 0) + 1
+            self.invalidations += 1
+
+    def _store(self, key: Tuple[str, int], snapshot: NotebookSnapshot) -> None:
+        if snapshot.size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = snapshot
+        self._bytes += snapshot.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+context_cache = NotebookContextCache(
+    settings.context_cache_max_entries, settings.context_cache_max_bytes
+)
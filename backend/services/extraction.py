@@ -0,0 +1,126 @@
+# Functions in this module run inside ingestion worker processes, so they take
+# plain paths/values and must stay importable without the web app. The
+# PDF/DOCX/OCR libraries are imported on first use: the API process only
+# needs the suffix lists, and skipping those imports shortens startup.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PDF_SUFFIXES = (".pdf",)
+DOCX_SUFFIXES = (".doc", ".docx")
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+SUPPORTED_SUFFIXES = PDF_SUFFIXES + DOCX_SUFFIXES + IMAGE_SUFFIXES
+
+
+# Pages with less extractable text than this are treated as scanned images.
+DEFAULT_OCR_MIN_CHARS = 20
+
+
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _ocr_page_images(page) -> str:
+    # Scanned PDFs carry each page as one or more embedded images; OCR those
+    # directly instead of rasterizing the page, which needs poppler/MuPDF.
+    import pytesseract
+
+    # OCR is only a fallback for PDFs: whatever goes wrong (no tesseract,
+    # an image pypdf can't decode such as JBIG2/CCITT, a Tesseract error),
+    # keep the text pypdf found and any images that did work.
+    texts = []
+    try:
+        images = list(page.images)
+    except Exception as exc:
+        logger.warning("Could not read images on PDF page: %s", exc)
+        return ""
+    for image_file in images:
+        try:
+            texts.append(pytesseract.image_to_string(image_file.image))
+        except pytesseract.TesseractNotFoundError:
+            return ""
+        except Exception as exc:
+            logger.warning("OCR of image %s failed: %s", image_file.name, exc)
+    return "\n".join(t.strip() for t in texts if t.strip())
+
+
+def extract_pdf_pages(
+    path: str, start: int, end: int, ocr_min_chars: int = DEFAULT_OCR_MIN_CHARS
+) -> list[str]:
+    """Extract pages [start, end) of a PDF, OCR-ing pages that are image-only.
+
+    Each worker opens its own reader, so page ranges can run in parallel
+    across processes.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    texts: list[str] = []
+    for index in range(start, min(end, len(reader.pages))):
+        page = reader.pages[index]
+        try:
+            text = page.extract_text() or ""
+        except Exception as exc:
+            # One unreadable page shouldn't lose the rest of the document.
+            logger.warning("Text extraction of PDF page %d failed: %s", index + 1, exc)
+            text = ""
+        if len(text.strip()) < ocr_min_chars:
+            ocr_text = _ocr_page_images(page)
+            if len(ocr_text) > len(text.strip()):
+                text = ocr_text
+        texts.append(text)
+    return texts
+
+
+def join_pages(pages: list[str]) -> tuple[str, list[int]]:
+    """Join page texts in order and return the start offset of each page."""
+    offsets: list[int] = []
+    position = 0
+    for text in pages:
+        offsets.append(position)
+        position += len(text) + 1
+    return "\n".join(pages), offsets
+
+
+def text_stats(text: str, page_offsets: list[int] | None = None) -> dict:
+    """`files` columns describing extracted text; non-PDFs count as one page."""
+    return {
+        "char_count": len(text or ""),
+        "page_count": len(page_offsets) if page_offsets is not None else 1,
+    }
+
+
+def extract_text_from_pdf(path: str) -> str:
+    return join_pages(extract_pdf_pages(path, 0, pdf_page_count(path)))[0]
+
+
+def extract_text_from_docx(path: str) -> str:
+    import docx2txt
+
+    return docx2txt.process(path) or ""
+
+
+def extract_text_from_image(path: str) -> str:
+    import pytesseract
+    from PIL import Image
+
+    img = Image.open(path)
+    try:
+        return pytesseract.image_to_string(img)
+    except pytesseract.TesseractNotFoundError:
+        # Re-raised as a plain error: this one can't be unpickled in the
+        # parent process, which would break the whole ingestion pool.
+        raise RuntimeError("OCR is unavailable: tesseract is not installed") from None
+
+
+def extract_text(path: str, suffix: str) -> str:
+    if suffix in PDF_SUFFIXES:
+        return extract_text_from_pdf(path)
+    if suffix in DOCX_SUFFIXES:
+        return extract_text_from_docx(path)
+    if suffix in IMAGE_SUFFIXES:
+        return extract_text_from_image(path)
+    raise ValueError(f"Unsupported file type: {suffix}")
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from services.content_events import document_changed
+from services.extraction import (
+    DOCX_SUFFIXES,
+    PDF_SUFFIXES,
+    extract_pdf_pages,
+    extract_text,
+    join_pages,
+    pdf_page_count,
+    text_stats,
+)
+from services.retrieval import file_doc_id
+from utils.config import settings
+from utils.metrics import span
+from utils.repository import file_repo
+
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle of a `files` row; it is persisted so status survives restarts.
+STATUS_PENDING = "pending"
+STATUS_EXTRACTING = "extracting"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    file_id: str
+    notebook_id: str
+    user_id: str
+    path: str = field(repr=False)
+    suffix: str
+    status: str = STATUS_PENDING
+    progress: float = 0.0
+    error: Optional[str] = None
+    # Set once extraction finishes; the text itself is at GET /upload/{id}/text.
+    content_hash: Optional[str] = None
+    page_count: Optional[int] = None
+    char_count: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def public(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for private in ("path", "suffix", "user_id"):
+            data.pop(private)
+        data["job_id"] = data.pop("id")
+        return data
+
+
+class IngestionQueue:
+    """Runs text extraction for uploads in a bounded process pool.
+
+    Uploads are stored and recorded as `pending` right away; the heavy
+    extraction (pypdf, docx2txt, Tesseract) then runs off the event loop and
+    moves the `files` row through extracting -> ready/failed. PDFs are split
+    into page ranges that run in parallel, which also drives `progress`.
+    Finished jobs are kept in memory for a while so clients can poll
+    progress; after that the status is read back from the `files` row.
+    If a worker dies (e.g. killed for memory on a huge PDF) the pool is
+    rebuilt and the job retried once.
+    """
+
+    def __init__(self, max_workers: int, retained_jobs: int) -> None:
+        self.max_workers = max_workers
+        self.retained_jobs = retained_jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._executor is None:
+            # spawn rather than fork: forking a process that is running an
+            # event loop and worker threads can deadlock the child.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        # Jobs sharing the broken pool all land here; only replace it once.
+        if self._executor is broken:
+            logger.warning("Extraction worker died; restarting the process pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self.start()
+
+    def recover(self) -> None:
+        """Fail uploads a previous run left pending or extracting.
+
+        Their temp files went with that process, so they can't be resumed;
+        the user has to upload again. Only rows created before this call are
+        touched, so jobs other workers start from now on are safe. Runs in
+        the background.
+        """
+        started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        task = asyncio.get_running_loop().create_task(self._fail_stale(started))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fail_stale(self, before: str) -> None:
+        try:
+            count = await file_repo.fail_stale(
+                [STATUS_PENDING, STATUS_EXTRACTING],
+                before,
+                "Extraction was interrupted by a server restart; upload the file again",
+            )
+        except Exception:
+            logger.exception("Could not recover interrupted uploads")
+            return
+        if count:
+            logger.warning("Marked %d interrupted upload(s) as failed", count)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(
+        self,
+        file_id: str,
+        notebook_id: str,
+        user_id: str,
+        path: str,
+        suffix: str,
+        content_hash: Optional[str] = None,
+    ) -> IngestionJob:
+        self.start()
+        job = IngestionJob(
+            id=file_id,
+            file_id=file_id,
+            notebook_id=notebook_id,
+            user_id=user_id,
+            path=path,
+            suffix=suffix,
+            content_hash=content_hash,
+        )
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.retained_jobs:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.status not in (STATUS_READY, STATUS_FAILED):
+                break
+            self._jobs.popitem(last=False)
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    async def _set_status(self, job: IngestionJob, status: str, **fields: Any) -> None:
+        # Persist first so a poll that sees the new status can read the row.
+        await file_repo.update(job.file_id, {"status": status, **fields})
+        job.status = status
+        job.updated_at = time.time()
+
+    async def _extract_pdf(
+        self, job: IngestionJob, executor: ProcessPoolExecutor
+    ) -> tuple[str, list[int]]:
+        """Fan page ranges out across the pool and reassemble them in order."""
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(executor, pdf_page_count, job.path)
+        if page_count == 0:
+            return "", []
+        batch = max(1, settings.ingest_pdf_pages_per_task)
+        done_pages = 0
+
+        async def run_range(start: int) -> list[str]:
+            nonlocal done_pages
+            pages = await loop.run_in_executor(
+                executor,
+                extract_pdf_pages,
+                job.path,
+                start,
+                start + batch,
+                settings.ingest_ocr_min_chars,
+            )
+            done_pages += len(pages)
+            job.progress = done_pages / page_count
+            job.updated_at = time.time()
+            return pages
+
+        ranges = await asyncio.gather(
+            *(run_range(start) for start in range(0, page_count, batch))
+        )
+        return join_pages([page for pages in ranges for page in pages])
+
+    async def _extract(self, job: IngestionJob) -> tuple[str, Dict[str, Any]]:
+        """Extract the job's text, retrying once on a fresh pool if a worker dies."""
+        loop = asyncio.get_running_loop()
+        retried = False
+        while True:
+            self.start()
+            executor = self._executor
+            job.progress = 0.0
+            fields: Dict[str, Any] = {}
+            try:
+                if job.suffix in PDF_SUFFIXES:
+                    with span("extract_pdf"):
+                        text, fields["page_offsets"] = await self._extract_pdf(
+                            job, executor
+                        )
+                else:
+                    kind = "docx" if job.suffix in DOCX_SUFFIXES else "image"
+                    with span(f"extract_{kind}"):
+                        text = await loop.run_in_executor(
+                            executor, extract_text, job.path, job.suffix
+                        )
+                return text, fields
+            except BrokenProcessPool:
+                self._restart(executor)
+                if retried:
+                    raise
+                retried = True
+                logger.warning("Retrying extraction of file %s", job.file_id)
+
+    async def _run(self, job: IngestionJob) -> None:
+        try:
+            await self._set_status(job, STATUS_EXTRACTING)
+            extracted_text, fields = await self._extract(job)
+            fields.update(text_stats(extracted_text, fields.get("page_offsets")))
+            job.progress = 1.0
+            job.page_count = fields["page_count"]
+            job.char_count = fields["char_count"]
+            await self._set_status(
+                job, STATUS_READY, extracted_text=extracted_text, **fields
+            )
+            await document_changed(
+                job.notebook_id, file_doc_id(job.file_id), extracted_text
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Extraction failed for file %s", job.file_id)
+            job.error = str(exc) or exc.__class__.__name__
+            try:
+                await self._set_status(job, STATUS_FAILED, error=job.error)
+            except Exception:
+                logger.exception("Could not record failure for file %s", job.file_id)
+        finally:
+            try:
+                os.unlink(job.path)
+            except OSError:
+                pass
+
+
+ingestion_queue = IngestionQueue(
+    settings.ingest_max_workers, settings.ingest_retained_jobs
+)
@@ -0,0 +1,271 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+
+from services.ollama_pool import backend_urls
+from utils.config import settings
+
+
+class Priority(IntEnum):
+    """Scheduling class of an LLM request; lower values are served first."""
+
+    INTERACTIVE = 0  # chat
+    STANDARD = 1  # summaries, flashcards, quizzes
+    BATCH = 2  # study plans, study packs, background work
+
+
+class SchedulerSaturated(Exception):
+    """Raised when a request can't be queued; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"LLM queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """A queue place taken at admission, before the request's first Ollama call."""
+
+    __slots__ = ("priority", "user_id", "held")
+
+    def __init__(self, priority: Priority, user_id: str) -> None:
+        self.priority = priority
+        self.user_id = user_id
+        self.held = True
+
+
+# (priority, user id) of the request being served. Set by the API layer
+# before any Ollama call; work outside a request (ingestion, compaction)
+# runs as BATCH.
+_current: ContextVar[Tuple[Priority, str]] = ContextVar(
+    "llm_request", default=(Priority.BATCH, "background")
+)
+_reservation: ContextVar[Optional[Reservation]] = ContextVar(
+    "llm_reservation", default=None
+)
+
+
+def set_request(
+    priority: Priority, user_id: str, reservation: Optional[Reservation] = None
+) -> None:
+    _current.set((priority, user_id))
+    _reservation.set(reservation)
+
+
+@contextmanager
+def scheduled_as(priority: Priority, user_id: str) -> Iterator[None]:
+    # Work started from a request (compaction, embeddings) must not use up
+    # that request's reservation.
+    token = _current.set((priority, user_id))
+    reservation_token = _reservation.set(None)
+    try:
+        yield
+    finally:
+        _reservation.reset(reservation_token)
+        _current.reset(token)
+
+
+class _WaitStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=1024)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def quantile(q: float) -> float:
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+        return {
+            "count": self.count,
+            "mean_seconds": self.total / self.count if self.count else 0.0,
+            "p50_seconds": quantile(0.5),
+            "p95_seconds": quantile(0.95),
+            "max_seconds": self.max,
+        }
+
+
+class LLMScheduler:
+    """Hands out Ollama generation slots by priority, fairly between users.
+
+    At most `slots` generations run at once. Waiting requests are kept per
+    priority class and, within a class, per user; a freed slot goes to the
+    highest class with waiters, rotating round-robin over its users so one
+    user's batch can't starve the others. Admission is bounded: the whole
+    queue holds `max_depth` waiters, lower classes may only fill part of it
+    (BATCH a third, STANDARD two thirds) so chat is still admitted when the
+    queue is busy, and each user may have `max_per_user` waiters. Beyond
+    that `SchedulerSaturated` is raised with an estimated retry delay.
+
+    The API admits a request with `reserve`, which holds its place (counted
+    like a waiter) until its first `slot()`. So a request admitted while
+    its 429 could still be sent, e.g. before a stream's headers, is never
+    turned away later. `release` frees a place that was never used.
+    """
+
+    def __init__(self, slots: int, max_depth: int, max_per_user: int) -> None:
+        self.slots = slots
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self._active = 0
+        self._waiting = 0
+        self._reserved = 0
+        self._per_user: Dict[str, int] = {}
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            p: OrderedDict() for p in Priority
+        }
+        self._service_seconds = 5.0  # moving average of slot hold time
+        self._waits = {p: _WaitStats() for p in Priority}
+        self._rejected = {p: 0 for p in Priority}
+
+    def _depth_limit(self, priority: Priority) -> int:
+        return max(1, self.max_depth * (len(Priority) - priority) // len(Priority))
+
+    def retry_after(self) -> int:
+        queued = self._waiting + self._reserved
+        backlog = (queued + 1) * self._service_seconds / self.slots
+        return max(1, min(300, math.ceil(backlog)))
+
+    def check_admission(self, priority: Priority, user_id: str) -> None:
+        """Raise `SchedulerSaturated` if this request would not be queued."""
+        if self._active + self._reserved < self.slots and not self._waiting:
+            return
+        if (
+            self._waiting + self._reserved >= self._depth_limit(priority)
+            or self._per_user.get(user_id, 0) >= self.max_per_user
+        ):
+            self._rejected[priority] += 1
+            raise SchedulerSaturated(self.retry_after())
+
+    def reserve(self, priority: Priority, user_id: str) -> Reservation:
+        """Admit a request and hold its place; raises `SchedulerSaturated`."""
+        self.check_admission(priority, user_id)
+        self._reserved += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return Reservation(priority, user_id)
+
+    def release(self, reservation: Reservation) -> None:
+        """Give back a reservation; no-op once `slot()` has used it."""
+        if not reservation.held:
+            return
+        reservation.held = False
+        self._reserved -= 1
+        self._per_user[reservation.user_id] -= 1
+        if not self._per_user[reservation.user_id]:
+            del self._per_user[reservation.user_id]
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a generation slot for the current request (see `set_request`)."""
+        priority, user_id = _current.get()
+        reservation = _reservation.get()
+        admitted = reservation is not None and reservation.held
+        if admitted:
+            self.release(reservation)
+        await self._acquire(priority, user_id, admitted)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held
+            self._active -= 1
+            self._dispatch()
+
+    async def _acquire(
+        self, priority: Priority, user_id: str, admitted: bool = False
+    ) -> None:
+        if self._active < self.slots and not self._waiting:
+            self._active += 1
+            self._waits[priority].add(0.0)
+            return
+        if not admitted:
+            self.check_admission(priority, user_id)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._waiting += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        queued_at = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled.
+                self._active -= 1
+                self._dispatch()
+            else:
+                self._remove(priority, user_id, waiter)
+            raise
+        self._waits[priority].add(time.monotonic() - queued_at)
+
+    def _forget(self, user_id: str) -> None:
+        self._waiting -= 1
+        self._per_user[user_id] -= 1
+        if not self._per_user[user_id]:
+            del self._per_user[user_id]
+
+    def _remove(self, priority: Priority, user_id: str, waiter: asyncio.Future) -> None:
+        queue = self._queues[priority].get(user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[priority][user_id]
+        self._forget(user_id)
+
+    def _dispatch(self) -> None:
+        while self._active < self.slots and self._waiting:
+            for priority in Priority:
+                users = self._queues[priority]
+                if users:
+                    break
+            user_id, queue = next(iter(users.items()))
+            waiter = queue.popleft()
+            if queue:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            self._forget(user_id)
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "active": self._active,
+            "queued": self._waiting,
+            "reserved": self._reserved,
+            "max_depth": self.max_depth,
+            "classes": {
+                p.name.lower(): {
+                    "queued": sum(len(q) for q in self._queues[p].values()),
+                    "rejected": self._rejected[p],
+                    "wait": self._waits[p].snapshot(),
+                }
+                for p in Priority
+            },
+        }
+
+
+# OLLAMA_MAX_CONCURRENCY generations per backend.
+llm_scheduler = LLMScheduler(
+    settings.ollama_max_concurrency * len(backend_urls()),
+    settings.llm_queue_max_depth,
+    settings.llm_queue_max_per_user,
+)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import httpx
+
+from utils.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def backend_urls() -> List[str]:
+    urls = [u.strip().rstrip("/") for u in settings.ollama_base_urls.split(",")]
+    return [u for u in urls if u] or [settings.ollama_base_url]
+
+
+def _model_names(name: str) -> Set[str]:
+    # Ollama reports "llama3.1:8b" or "nomic-embed-text:latest"; requests may
+    # leave out the ":latest" tag.
+    return {name, name[: -len(":latest")]} if name.endswith(":latest") else {name}
+
+
+class OllamaBackend:
+    """One Ollama host: its HTTP client, load and circuit-breaker state."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.client: Optional[httpx.AsyncClient] = None
+        self.outstanding = 0
+        self.healthy = True
+        self.models: Set[str] = set()
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        if not self.open_until:
+            return self.healthy
+        # Once the cooldown has passed, let a single trial request through.
+        return now >= self.open_until and not self.trial
+
+    def has_model(self, model: Optional[str]) -> bool:
+        return bool(model) and model in self.models
+
+    def record_success(self) -> None:
+        if self.open_until:
+            logger.info("Ollama backend %s recovered", self.url)
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.errors += 1
+        if self.trial or self.failures >= settings.ollama_breaker_failures:
+            if not self.open_until or self.trial:
+                logger.warning(
+                    "Ollama backend %s failing, skipping it for %.0fs",
+                    self.url,
+                    settings.ollama_breaker_cooldown,
+                )
+            self.open_until = time.monotonic() + settings.ollama_breaker_cooldown
+            self.trial = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_open": self.open_until > time.monotonic(),
+            "outstanding": self.outstanding,
+            "models": sorted(self.models),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class BackendPool:
+    """Routes Ollama requests over one or more backends.
+
+    Each request goes to the available backend with the fewest outstanding
+    requests, counting a backend that doesn't have the model loaded (per
+    the last /api/ps health check) as OLLAMA_MAX_CONCURRENCY requests
+    busier, so the model is only loaded on another host once the warm ones
+    are saturated. A background task refreshes health and loaded models
+    every OLLAMA_HEALTH_INTERVAL seconds; backends whose circuit is open are
+    skipped until their cooldown ends. If nothing is available the request
+    is still tried rather than failed outright.
+    """
+
+    def __init__(self, urls: List[str]) -> None:
+        self.backends = [OllamaBackend(url) for url in urls]
+        self._health_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        for backend in self.backends:
+            if backend.client is None:
+                backend.client = httpx.AsyncClient(
+                    base_url=backend.url,
+                    timeout=httpx.Timeout(
+                        settings.ollama_timeout, connect=settings.ollama_connect_timeout
+                    ),
+                    limits=httpx.Limits(
+                        max_connections=settings.ollama_max_connections,
+                        max_keepalive_connections=settings.ollama_max_connections,
+                    ),
+                )
+        if self._health_task is None and settings.ollama_health_interval > 0:
+            try:
+                self._health_task = asyncio.get_running_loop().create_task(
+                    self._health_loop()
+                )
+            except RuntimeError:
+                pass  # no loop yet; started again on first use
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            if backend.client is not None:
+                await backend.client.aclose()
+            backend.client = None
+
+    def pick(self, model: Optional[str], exclude: Set[OllamaBackend]) -> OllamaBackend:
+        now = time.monotonic()
+        candidates = [
+            b for b in self.backends if b not in exclude and b.available(now)
+        ] or [b for b in self.backends if b not in exclude] or self.backends
+        backend = min(
+            candidates,
+            key=lambda b: b.outstanding
+            + (0 if b.has_model(model) else settings.ollama_max_concurrency),
+        )
+        if backend.open_until and now >= backend.open_until:
+            backend.trial = True
+        return backend
+
+    @contextmanager
+    def track(self, backend: OllamaBackend, model: Optional[str]) -> Iterator[None]:
+        """Count a request as outstanding on `backend` and feed its breaker."""
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code >= 500:
+                backend.record_failure()
+            else:
+                # A 4xx (e.g. unknown model) is the request's fault; the
+                # backend answered, so it counts as up.
+                backend.record_success()
+            raise
+        except httpx.TransportError:
+            backend.record_failure()
+            raise
+        else:
+            backend.record_success()
+            if model:
+                backend.models |= _model_names(model)
+        finally:
+            backend.outstanding -= 1
+            # A trial that ended any other way (cancelled, e.g. the client
+            # went away mid-stream) decided nothing: let the next request be
+            # the trial instead of leaving the backend unavailable for good.
+            backend.trial = False
+
+    async def check(self, backend: OllamaBackend) -> None:
+        try:
+            response = await backend.client.get(
+                "/api/ps", timeout=settings.ollama_health_timeout
+            )
+            response.raise_for_status()
+            models = response.json().get("models") or []
+        except Exception as exc:
+            if backend.healthy:
+                logger.warning(
+                    "Ollama backend %s health check failed: %s", backend.url, exc
+                )
+            backend.healthy = False
+            backend.record_failure()
+            return
+        backend.healthy = True
+        if backend.open_until:
+            backend.record_success()
+        backend.models = set()
+        for entry in models:
+            for key in ("name", "model"):
+                if entry.get(key):
+                    backend.models |= _model_names(entry[key])
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(b) for b in self.backends))
+            await asyncio.sleep(settings.ollama_health_interval)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [backend.stats() for backend in self.backends]
@@ -1,22 +1,322 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
 import httpx
 
+from services.llm_scheduler import llm_scheduler
+from services.ollama_pool import BackendPool, OllamaBackend, backend_urls
+from services.response_cache import cache_key, response_cache
 from utils.config import settings
+from utils.metrics import ollama_tokens, record, span
+
+
+# Errors raised before Ollama has accepted the request, so retrying cannot
+# start a duplicate generation.
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Ollama's own timings (nanoseconds) on a final response, as request stages.
+_OLLAMA_STAGES = (
+    ("load_duration", "ollama_load"),
+    ("prompt_eval_duration", "ollama_prefill"),
+    ("eval_duration", "ollama_generate"),
+)
+
+
+def _record_ollama_timings(data: Dict[str, Any]) -> None:
+    for field, stage in _OLLAMA_STAGES:
+        if data.get(field):
+            record(stage, data[field] / 1e9)
+    if data.get("prompt_eval_count"):
+        ollama_tokens.inc(data["prompt_eval_count"], "prompt")
+    if data.get("eval_count"):
+        ollama_tokens.inc(data["eval_count"], "completion")
+
+
+class OllamaClient:
+    """App-scoped Ollama client.
+
+    Keeps pooled `httpx.AsyncClient`s alive between requests, one per
+    backend in `BackendPool`, which picks the backend for each call. Every
+    call first takes a generation slot from `llm_scheduler`, which caps
+    in-flight generations and orders the waiters by priority and user.
+    Connection errors fail over to the next backend at once; only when all
+    have been tried is the round retried after a backoff. The queue wait,
+    the round trip and Ollama's reported load/prefill/generation times are
+    recorded as request stages (utils.metrics). `main.py` calls `start()` at
+    startup and `close()` at shutdown.
+    """
+
+    def __init__(self) -> None:
+        self.pool = BackendPool(backend_urls())
 
+    def start(self) -> None:
+        self.pool.start()
 
-async def generate_ollama(prompt: str) -> str:
-    async with httpx.AsyncClient(base_url=settings.ollama_base_url, timeout=120) as client:
-        response = await client.post(
-            "/api/generate",
-            json={"model": settings.ollama_model, "prompt": prompt, "stream": False},
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def post(
+        self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """POST to Ollama once a generation slot is free and return the JSON body."""
+        # Allow use outside the app lifecycle (scripts, a REPL) by starting lazily.
+        self.start()
+        model = payload.get("model")
+        request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        queued = time.perf_counter()
+        async with llm_scheduler.slot():
+            record("llm_queue", time.perf_counter() - queued)
+            tried: Set[OllamaBackend] = set()
+            attempt = 0
+            while True:
+                backend = self.pool.pick(model, tried)
+                try:
+                    with self.pool.track(backend, model), span("ollama"):
+                        response = await backend.client.post(
+                            path, json=payload, timeout=request_timeout
+                        )
+                        response.raise_for_status()
+                    data = response.json()
+                    _record_ollama_timings(data)
+                    return data
+                except _RETRYABLE_ERRORS:
+                    tried.add(backend)
+                    if len(tried) < len(self.pool.backends):
+                        continue
+                    if attempt >= settings.ollama_max_retries:
+                        raise
+                    await asyncio.sleep(settings.ollama_retry_backoff * (2**attempt))
+                    attempt += 1
+                    tried.clear()
+
+    async def warm_up(self, model: str, path: str = "/api/generate") -> int:
+        """Have every backend load `model` now; return how many did.
+
+        Sends an empty prompt with `keep_alive`, which makes Ollama load the
+        model without generating anything. Bypasses the scheduler: this runs
+        at startup, before there is traffic to be fair to.
+        """
+        self.start()
+        payload = {
+            "model": model,
+            "prompt": "",
+            "stream": False,
+            "keep_alive": settings.ollama_keep_alive,
+        }
+
+        async def load(backend: OllamaBackend) -> None:
+            with self.pool.track(backend, model):
+                response = await backend.client.post(path, json=payload)
+                response.raise_for_status()
+
+        results = await asyncio.gather(
+            *(load(b) for b in self.pool.backends), return_exceptions=True
         )
-        response.raise_for_status()
-        data = response.json()
-        # Ollama returns {"response": "..."} for non-streaming
-        return data.get("response", "").strip()
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return len(results) - len(errors)
+
+    async def stream(
+        self, path: str, payload: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """POST a streaming request and yield each NDJSON object Ollama sends.
+
+        The generation slot is held until the stream is exhausted or closed.
+        Closing the generator early (e.g. the client disconnected) closes the
+        upstream connection, which makes Ollama abort the generation.
+        """
+        self.start()
+        model = payload.get("model")
+        queued = time.perf_counter()
+        async with llm_scheduler.slot():
+            record("llm_queue", time.perf_counter() - queued)
+            tried: Set[OllamaBackend] = set()
+            attempt = 0
+            while True:
+                backend = self.pool.pick(model, tried)
+                try:
+                    with self.pool.track(backend, model), span("ollama"):
+                        async with backend.client.stream(
+                            "POST", path, json=payload
+                        ) as response:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if line.strip():
+                                    chunk = json.loads(line)
+                                    if chunk.get("done"):
+                                        _record_ollama_timings(chunk)
+                                    yield chunk
+                    return
+                except _RETRYABLE_ERRORS:
+                    tried.add(backend)
+                    if len(tried) < len(self.pool.backends):
+                        continue
+                    if attempt >= settings.ollama_max_retries:
+                        raise
+                    await asyncio.sleep(settings.ollama_retry_backoff * (2**attempt))
+                    attempt += 1
+                    tried.clear()
+
+
+ollama_client = OllamaClient()
+
+
+async def generate_ollama(
+    prompt: str,
+    timeout: Optional[float] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> str:
+    payload: Dict[str, Any] = {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if options:
+        payload["options"] = options
+    data = await ollama_client.post("/api/generate", payload, timeout=timeout)
+    # Ollama returns {"response": "..."} for non-streaming
+    return data.get("response", "").strip()
+
+
+async def generate_ollama_with_state(
+    prompt: str,
+    *,
+    context: Optional[List[int]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    keep_alive: Optional[str] = None,
+) -> Tuple[str, List[int]]:
+    """Generate and also return Ollama's `context` (the evaluated token state).
+
+    Passing that context back on the next call continues from it, so a long
+    shared prefix is only prefilled once. `keep_alive` keeps the model
+    loaded between such calls.
+    """
+    payload: Dict[str, Any] = {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if context:
+        payload["context"] = context
+    if options:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    data = await ollama_client.post("/api/generate", payload)
+    return data.get("response", "").strip(), data.get("context") or []
+
+
+async def stream_ollama(
+    prompt: str, options: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    payload: Dict[str, Any] = {
+        "model": settings.ollama_model,
+        "prompt": prompt,
+        "stream": True,
+    }
+    if options:
+        payload["options"] = options
+    async for chunk in ollama_client.stream("/api/generate", payload):
+        token = chunk.get("response", "")
+        if token:
+            yield token
+
+
+async def chat_ollama(
+    messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None
+) -> str:
+    """Answer a conversation given in Ollama's /api/chat message format."""
+    payload: Dict[str, Any] = {
+        "model": settings.ollama_model,
+        "messages": messages,
+        "stream": False,
+    }
+    if options:
+        payload["options"] = options
+    data = await ollama_client.post("/api/chat", payload)
+    return (data.get("message") or {}).get("content", "").strip()
+
+
+async def stream_chat_ollama(
+    messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    payload: Dict[str, Any] = {
+        "model": settings.ollama_model,
+        "messages": messages,
+        "stream": True,
+    }
+    if options:
+        payload["options"] = options
+    async for chunk in ollama_client.stream("/api/chat", payload):
+        token = (chunk.get("message") or {}).get("content", "")
+        if token:
+            yield token
+
+
+def _render_prompt(system_prompt: str, user_message: str) -> str:
+    return f"{system_prompt}\n\nUser:\n{user_message}"
+
+
+def _response_cache_key(
+    system_prompt: str, prompt: str, options: Optional[Dict[str, Any]] = None
+) -> str:
+    return cache_key(settings.ollama_model, system_prompt, prompt, options)
+
+
+async def chat_with_context(
+    system_prompt: str,
+    user_message: str,
+    *,
+    use_cache: bool = False,
+    refresh_cache: bool = False,
+    notebook_id: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Generate an answer, optionally through the response cache.
+
+    `use_cache` enables caching for deterministic prompts; `refresh_cache`
+    skips the lookup but still stores the fresh answer. `notebook_id` tags
+    the entry so it can be purged when that notebook changes. `options`
+    (num_ctx, num_predict, ...) go to Ollama and are part of the cache key.
+    """
+    prompt = _render_prompt(system_prompt, user_message)
+    if not (use_cache and settings.response_cache_enabled):
+        return await generate_ollama(prompt, options=options)
 
+    key = _response_cache_key(system_prompt, prompt, options)
+    if not refresh_cache:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            return cached
+    answer = await generate_ollama(prompt, options=options)
+    await response_cache.aput(key, answer, notebook_id)
+    return answer
 
-async def chat_with_context(system_prompt: str, user_message: str) -> str:
-    prompt = f"{system_prompt}\n\nUser:\n{user_message}"
-    return await generate_ollama(prompt)
 
+async def stream_chat_with_context(
+    system_prompt: str,
+    user_message: str,
+    *,
+    use_cache: bool = False,
+    refresh_cache: bool = False,
+    notebook_id: Optional[str] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    prompt = _render_prompt(system_prompt, user_message)
+    caching = use_cache and settings.response_cache_enabled
+    key = _response_cache_key(system_prompt, prompt, options) if caching else None
+    if key is not None and not refresh_cache:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            yield cached
+            return
 
+    parts: list[str] = []
+    async for token in stream_ollama(prompt, options):
+        parts.append(token)
+        yield token
+    if key is not None:
+        await response_cache.aput(key, "".join(parts).strip(), notebook_id)
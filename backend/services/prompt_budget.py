@@ -0,0 +1,181 @@
+import logging
+from string import Template
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from services.retrieval import CHARS_PER_TOKEN
+from utils.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class HeuristicTokenizer:
+    """Character-based estimate (~4 chars per token), used when no model
+    tokenizer is configured. Same ratio the retrieval chunker assumes."""
+
+    def count(self, text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def truncate(self, text: str, max_tokens: int, keep: str) -> str:
+        max_chars = max(0, max_tokens) * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] if keep == "head" else text[len(text) - max_chars :]
+
+
+class ModelTokenizer:
+    """Exact counts from the served model's Hugging Face `tokenizer.json`."""
+
+    def __init__(self, path: str) -> None:
+        from tokenizers import Tokenizer  # optional dependency
+
+        self._tokenizer = Tokenizer.from_file(path)
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, max_tokens: int, keep: str) -> str:
+        encoding = self._tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        if keep == "head":
+            return text[: encoding.offsets[max_tokens - 1][1]]
+        return text[encoding.offsets[len(encoding.ids) - max_tokens][0] :]
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    if settings.prompt_tokenizer_path:
+        try:
+            return ModelTokenizer(settings.prompt_tokenizer_path)
+        except Exception:
+            logger.exception(
+                "Could not load tokenizer %s; using the character estimate",
+                settings.prompt_tokenizer_path,
+            )
+    return HeuristicTokenizer()
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
+
+
+@dataclass
+class Section:
+    """A variable part of a prompt.
+
+    Sections with a higher `priority` are truncated first; `keep` says which
+    end survives ("head" for ranked context, "tail" for conversation history).
+    """
+
+    name: str
+    text: str
+    priority: int = 1
+    keep: str = "head"
+
+
+@dataclass
+class PromptPlan:
+    prompt: str
+    sections: Dict[str, str]
+    tokens: Dict[str, int]
+    prompt_tokens: int
+    num_ctx: int
+    num_predict: int
+    truncated: List[str] = field(default_factory=list)
+
+    def options(self) -> Dict[str, Any]:
+        """Ollama options that make the context window explicit."""
+        return {"num_ctx": self.num_ctx, "num_predict": self.num_predict}
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "sections": self.tokens,
+            "truncated": self.truncated,
+            "num_ctx": self.num_ctx,
+            "num_predict": self.num_predict,
+        }
+
+
+def escape_template(value: str) -> str:
+    """Quote `$` in a value interpolated into a fit_prompt template, so user
+    text like "$context" stays literal instead of becoming a placeholder."""
+    return value.replace("$", "$$")
+
+
+def _placeholder_uses(template: Template) -> Dict[str, int]:
+    uses: Dict[str, int] = {}
+    for match in template.pattern.finditer(template.template):
+        name = match.group("named") or match.group("braced")
+        if name:
+            uses[name] = uses.get(name, 0) + 1
+    return uses
+
+
+def fit_prompt(
+    template: str,
+    sections: List[Section],
+    num_predict: int,
+    system: str = "",
+    reserved: int = 0,
+    num_ctx: Optional[int] = None,
+) -> PromptPlan:
+    """Fill `template` ($name placeholders) with `sections`, truncating them
+    to fit the context window.
+
+    The window (`num_ctx`, default OLLAMA_NUM_CTX) must hold the system
+    prompt, the template's fixed text, the sections, `reserved` tokens used
+    elsewhere (e.g. chat history sent as separate messages), the chat
+    template overhead and `num_predict` tokens of answer. When it doesn't,
+    sections are cut in priority order, highest first, each only as much as
+    needed, so Ollama never silently drops the start of the prompt. A
+    section whose placeholder appears more than once is counted once per
+    use. Values interpolated into `template` itself must go through
+    `escape_template`.
+    """
+    tokenizer = get_tokenizer()
+    num_ctx = num_ctx or settings.ollama_num_ctx
+    template = Template(template)
+    fixed_text = template.safe_substitute({s.name: "" for s in sections})
+    fixed = (
+        tokenizer.count(system)
+        + tokenizer.count(fixed_text)
+        + reserved
+        + settings.prompt_overhead_tokens
+    )
+    uses = _placeholder_uses(template)
+    texts = {s.name: s.text for s in sections}
+    tokens = {s.name: tokenizer.count(s.text) for s in sections}
+    available = max(0, num_ctx - num_predict - fixed)
+    truncated: List[str] = []
+
+    excess = sum(tokens[n] * uses.get(n, 0) for n in tokens) - available
+    for section in sorted(sections, key=lambda s: s.priority, reverse=True):
+        if excess <= 0:
+            break
+        count = uses.get(section.name, 0)
+        if not count:
+            continue
+        # Each token cut from a section saves `count` tokens of prompt.
+        target = max(0, tokens[section.name] - -(-excess // count))
+        texts[section.name] = tokenizer.truncate(section.text, target, section.keep)
+        excess -= (tokens[section.name] - target) * count
+        tokens[section.name] = tokenizer.count(texts[section.name])
+        truncated.append(section.name)
+
+    prompt = template.safe_substitute(texts)
+    system_tokens = tokenizer.count(system)
+    return PromptPlan(
+        prompt=prompt,
+        sections=texts,
+        tokens={"system": system_tokens, **tokens},
+        prompt_tokens=system_tokens + tokenizer.count(prompt) + reserved,
+        num_ctx=num_ctx,
+        num_predict=num_predict,
+        truncated=truncated,
+    )
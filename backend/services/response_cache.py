@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import settings
+
+
+def cache_key(
+    model: str, system_prompt: str, prompt: str, options: Optional[Dict[str, Any]] = None
+) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "system": system_prompt,
+            "prompt": prompt,
+            "options": options or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of LLM responses: in-memory LRU in front of SQLite.
+
+    Entries expire after `ttl_seconds`; expired rows are deleted every
+    `expire_every` puts. The disk tier is trimmed by last access once its
+    total size, tracked in memory from the first open, passes `max_bytes`. Each entry records the
+    notebook it was generated from so `purge_notebook` can drop them when
+    that notebook's content changes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        memory_entries: int,
+        max_bytes: int,
+        ttl_seconds: float,
+        expire_every: int = 100,
+    ) -> None:
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.expire_every = expire_every
+        self._bytes = 0
+        self._puts = 0
+        self._memory: "OrderedDict[str, Tuple[str, Optional[str], float]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    notebook_id TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_notebook ON responses(notebook_id)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses(created_at)"
+            )
+            conn.commit()
+            self._bytes = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _remember(
+        self, key: str, response: str, notebook_id: Optional[str], created_at: float
+    ) -> None:
+        self._memory[key] = (response, notebook_id, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[2] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+
+            db = self._db()
+            row = db.execute(
+                "SELECT response, notebook_id, size, created_at FROM responses "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            response, notebook_id, size, created_at = row
+            if now - created_at >= self.ttl_seconds:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                self._bytes -= size
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self._remember(key, response, notebook_id, created_at)
+            return response
+
+    def put(self, key: str, response: str, notebook_id: Optional[str] = None) -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._remember(key, response, notebook_id, now)
+            if size > self.max_bytes:
+                return
+            db = self._db()
+            old = db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO responses(key, notebook_id, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, notebook_id, response, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            self._puts += 1
+            if self._puts % self.expire_every == 0:
+                self._expire(db, now)
+            total = self._bytes
+            if total > self.max_bytes:
+                # Evict least recently used rows until back under the limit.
+                rows = db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ).fetchall()
+                evict = []
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    total -= old_size
+                db.executemany("DELETE FROM responses WHERE key = ?", evict)
+                for (old_key,) in evict:
+                    self._memory.pop(old_key, None)
+                self._bytes = total
+            db.commit()
+
+    def _expire(self, db: sqlite3.Connection, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        expired = db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses WHERE created_at < ?",
+            (cutoff,),
+        ).fetchone()[0]
+        db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+        self._bytes -= expired
+
+    def purge_notebook(self, notebook_id: str) -> int:
+        with self._lock:
+            for key in [k for k, v in self._memory.items() if v[1] == notebook_id]:
+                del self._memory[key]
+            db = self._db()
+            purged = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses WHERE notebook_id = ?",
+                (notebook_id,),
+            ).fetchone()[0]
+            cur = db.execute("DELETE FROM responses WHERE notebook_id = ?", (notebook_id,))
+            db.commit()
+            self._bytes -= purged
+            return cur.rowcount
+
+    # SQLite work is quick but still blocking, so async callers go through a thread.
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, response: str, notebook_id: Optional[str] = None) -> None:
+        await asyncio.to_thread(self.put, key, response, notebook_id)
+
+    async def apurge_notebook(self, notebook_id: str) -> int:
+        return await asyncio.to_thread(self.purge_notebook, notebook_id)
+
+
+response_cache = ResponseCache(
+    Path(settings.response_cache_path),
+    settings.response_cache_memory_entries,
+    settings.response_cache_max_bytes,
+    settings.response_cache_ttl_seconds,
+    settings.response_cache_expire_every,
+)
@@ -0,0 +1,462 @@
+import asyncio
+import hashlib
+import logging
+import math
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from services.context_cache import context_cache
+from services.llm_scheduler import Priority, scheduled_as
+from services.ollama_service import ollama_client
+from utils.config import settings
+from utils.repository import chunk_repo
+
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English prose with Llama-family tokenizers.
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with what which who how why when".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _terms(text: str) -> List[str]:
+    return [
+        t for t in (w.lower() for w in _WORD_RE.findall(text)) if t not in _STOPWORDS
+    ]
+
+
+def split_long(paragraph: str, max_tokens: int, overlap_tokens: int) -> List[str]:
+    """Window a paragraph that is too long for one chunk, by sentence where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    pieces: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            # A single sentence longer than a chunk (tables, OCR noise): hard cut.
+            head, sentence = sentence[:max_chars], sentence[max_chars - overlap_chars :]
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(head)
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = current[-overlap_chars:] if overlap_chars else ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> List[str]:
+    """Split text into retrieval chunks, packing whole paragraphs where they fit."""
+    max_tokens = max_tokens or settings.retrieval_chunk_tokens
+    if overlap_tokens is None:
+        overlap_tokens = settings.retrieval_chunk_overlap_tokens
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(split_long(paragraph, max_tokens, overlap_tokens))
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass
+class Chunk:
+    doc_id: str
+    position: int
+    text: str
+    terms: Counter = field(repr=False)
+    embedding: Optional[List[float]] = field(default=None, repr=False)
+    length: int = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.length = sum(self.terms.values())
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return (self.doc_id, self.position)
+
+
+class NotebookIndex:
+    """BM25 index (plus optional embeddings) over one notebook's chunks."""
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self) -> None:
+        self.chunks: Dict[Tuple[str, int], Chunk] = {}
+        self._postings: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self._total_length = 0
+
+    def add_document(self, doc_id: str, chunks: List[Chunk]) -> None:
+        self.remove_document(doc_id)
+        for chunk in chunks:
+            self.chunks[chunk.key] = chunk
+            self._total_length += chunk.length
+            for term, tf in chunk.terms.items():
+                self._postings.setdefault(term, {})[chunk.key] = tf
+
+    def remove_document(self, doc_id: str) -> None:
+        for key in [k for k in self.chunks if k[0] == doc_id]:
+            chunk = self.chunks.pop(key)
+            self._total_length -= chunk.length
+            for term in chunk.terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def bm25(self, query: str, top_k: int) -> List[Chunk]:
+        n = len(self.chunks)
+        if not n:
+            return []
+        avgdl = self._total_length / n or 1.0
+        scores: Dict[Tuple[str, int], float] = {}
+        for term in set(_terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                dl = self.chunks[key].length
+                denom = tf + self.k1 * (1 - self.b + self.b * dl / avgdl)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / denom
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [self.chunks[key] for key, _ in ranked]
+
+    def vector(self, query_embedding: List[float], top_k: int) -> List[Chunk]:
+        scored = [
+            (_cosine(query_embedding, c.embedding), c)
+            for c in self.chunks.values()
+            if c.embedding is not None
+        ]
+        scored.sort(key=lambda sc: sc[0], reverse=True)
+        return [c for _, c in scored[:top_k]]
+
+    @property
+    def has_embeddings(self) -> bool:
+        return bool(self.chunks) and all(
+            c.embedding is not None for c in self.chunks.values()
+        )
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+async def _embed_many(texts: List[str]) -> Optional[List[List[float]]]:
+    """Embed `texts` in batches (Ollama's /api/embed); None if any batch fails."""
+    embeddings: List[List[float]] = []
+    batch = settings.retrieval_embed_batch_size
+    for start in range(0, len(texts), batch):
+        try:
+            data = await ollama_client.post(
+                "/api/embed",
+                {
+                    "model": settings.ollama_embedding_model,
+                    "input": texts[start : start + batch],
+                },
+            )
+        except Exception as exc:
+            logger.warning("Embedding request failed, falling back to BM25: %s", exc)
+            return None
+        vectors = data.get("embeddings") or []
+        if len(vectors) != len(texts[start : start + batch]):
+            logger.warning("Embedding response was incomplete, falling back to BM25")
+            return None
+        embeddings.extend(vectors)
+    return embeddings
+
+
+async def _embed(text: str) -> Optional[List[float]]:
+    embeddings = await _embed_many([text])
+    return embeddings[0] if embeddings else None
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _make_chunks(doc_id: str, text: str) -> List[Chunk]:
+    return [
+        Chunk(doc_id=doc_id, position=i, text=t, terms=Counter(_terms(t)))
+        for i, t in enumerate(chunk_text(text or ""))
+    ]
+
+
+def _chunk_rows(chunks: List[Chunk], source_hash: str) -> List[Dict]:
+    return [
+        {
+            "position": c.position,
+            "content": c.text,
+            "source_hash": source_hash,
+            "embedding": c.embedding,
+        }
+        for c in chunks
+    ]
+
+
+class RetrievalIndex:
+    """Per-notebook chunk indexes, kept in process and bounded by notebook count.
+
+    Documents are chunked when they are written (`index_document`, called
+    for note saves and finished uploads) and the chunks are stored in
+    `document_chunks`; with the ollama backend they are then embedded in
+    batches in the background, at BATCH priority, and stored again with
+    their embeddings. Loading a notebook (`ensure_loaded`) reads the stored
+    chunks back, so queries never chunk or embed documents. Only documents
+    whose stored chunks are missing or stale (older rows, a failed write)
+    are chunked at load, and stored for next time.
+
+    Each notebook has a lock while it is loading or loaded, so a write that
+    lands during a load is applied after it; a write to a notebook that
+    isn't loaded only stores its chunks.
+    """
+
+    def __init__(self, max_notebooks: int) -> None:
+        self.max_notebooks = max_notebooks
+        self._indexes: "OrderedDict[str, NotebookIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def _lock(self, notebook_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(notebook_id, asyncio.Lock())
+
+    def is_loaded(self, notebook_id: str) -> bool:
+        return notebook_id in self._indexes
+
+    def _store_later(
+        self,
+        notebook_id: str,
+        doc_id: str,
+        source_hash: str,
+        chunks: List[Chunk],
+        stored: bool,
+    ) -> None:
+        """Embed (ollama backend) and store `chunks` in the background.
+
+        A newer version of the same document cancels the pending one.
+        """
+        key = (notebook_id, doc_id)
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        embed = settings.retrieval_backend == "ollama" and any(
+            c.embedding is None for c in chunks
+        )
+        if stored and not embed:
+            return
+        task = asyncio.get_running_loop().create_task(
+            self._store(notebook_id, doc_id, source_hash, chunks, stored, embed)
+        )
+        self._pending[key] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if self._pending.get(key) is done:
+                del self._pending[key]
+
+        task.add_done_callback(forget)
+
+    async def _store(
+        self,
+        notebook_id: str,
+        doc_id: str,
+        source_hash: str,
+        chunks: List[Chunk],
+        stored: bool,
+        embed: bool,
+    ) -> None:
+        # Background work: don't queue as (or count against) the request
+        # that happened to trigger it.
+        with scheduled_as(Priority.BATCH, "background"):
+            try:
+                if embed:
+                    embeddings = await _embed_many([c.text for c in chunks])
+                    if embeddings is None and stored:
+                        return
+                    # Same objects the loaded index holds, so it picks them
+                    # up without a reload.
+                    for chunk, embedding in zip(chunks, embeddings or []):
+                        chunk.embedding = embedding
+                await chunk_repo.replace_document(
+                    notebook_id, doc_id, _chunk_rows(chunks, source_hash)
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not store chunks of %s/%s", notebook_id, doc_id)
+
+    async def close(self) -> None:
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def ensure_loaded(
+        self, notebook_id: str, documents: Dict[str, str], version: int
+    ) -> None:
+        """Load a notebook's index from `documents`, a snapshot read while the
+        notebook's context_cache version was `version`.
+
+        If a write landed since, the snapshot may be older than the stored
+        chunks: those are used as they are, and the snapshot is not chunked
+        and stored over them.
+        """
+        async with self._lock(notebook_id):
+            if notebook_id in self._indexes:
+                self._indexes.move_to_end(notebook_id)
+                return
+            moved = context_cache.version(notebook_id) != version
+            stored: Dict[str, List[Dict]] = {}
+            for row in await chunk_repo.list_for_notebook(notebook_id):
+                stored.setdefault(row["doc_id"], []).append(row)
+            index = NotebookIndex()
+            for doc_id, text in documents.items():
+                source_hash = _digest(text or "")
+                rows = stored.get(doc_id, [])
+                fresh = bool(rows) and (
+                    moved or all(r["source_hash"] == source_hash for r in rows)
+                )
+                if fresh:
+                    source_hash = rows[0]["source_hash"]
+                    chunks = [
+                        Chunk(
+                            doc_id=doc_id,
+                            position=r["position"],
+                            text=r["content"],
+                            terms=Counter(_terms(r["content"])),
+                            embedding=r["embedding"],
+                        )
+                        for r in rows
+                    ]
+                else:
+                    chunks = _make_chunks(doc_id, text)
+                index.add_document(doc_id, chunks)
+                if chunks and (fresh or not moved):
+                    self._store_later(notebook_id, doc_id, source_hash, chunks, fresh)
+            self._indexes[notebook_id] = index
+            while len(self._indexes) > self.max_notebooks:
+                evicted, _ = self._indexes.popitem(last=False)
+                self._locks.pop(evicted, None)
+
+    async def index_document(self, notebook_id: str, doc_id: str, text: str) -> None:
+        """Chunk and store one document, updating its notebook's index if loaded."""
+        source_hash = _digest(text or "")
+        chunks = _make_chunks(doc_id, text)
+        # Stored now (without embeddings) so a notebook loaded before the
+        # embeddings land still finds the current text. The document itself
+        # is already saved: on failure, retry in the background instead.
+        try:
+            await chunk_repo.replace_document(
+                notebook_id, doc_id, _chunk_rows(chunks, source_hash)
+            )
+            stored = True
+        except Exception:
+            logger.exception("Could not store chunks of %s/%s", notebook_id, doc_id)
+            stored = False
+        lock = self._locks.get(notebook_id)
+        if lock is not None:
+            async with lock:
+                index = self._indexes.get(notebook_id)
+                if index is not None:
+                    index.add_document(doc_id, chunks)
+        self._store_later(notebook_id, doc_id, source_hash, chunks, stored)
+
+    def drop(self, notebook_id: str) -> None:
+        self._indexes.pop(notebook_id, None)
+        lock = self._locks.get(notebook_id)
+        if lock is not None and not lock.locked():
+            del self._locks[notebook_id]
+
+    async def search(self, notebook_id: str, query: str, top_k: int) -> List[Chunk]:
+        index = self._indexes.get(notebook_id)
+        if index is None:
+            return []
+        self._indexes.move_to_end(notebook_id)
+        # Long "queries" (e.g. a whole note pasted as text) only need their head.
+        query = query[: settings.retrieval_query_tokens * CHARS_PER_TOKEN]
+        if settings.retrieval_backend == "ollama" and index.has_embeddings and query.strip():
+            query_embedding = await _embed(query)
+            if query_embedding is not None:
+                return index.vector(query_embedding, top_k)
+        return index.bm25(query, top_k)
+
+    async def build_context(
+        self,
+        notebook_id: str,
+        query: str,
+        budget_tokens: Optional[int] = None,
+        top_k: Optional[int] = None,
+    ) -> str:
+        """Assemble the best-matching chunks that fit in `budget_tokens`.
+
+        Without a usable query, chunks are taken in document order instead.
+        Selected chunks are emitted in document order so passages read
+        naturally.
+        """
+        budget_tokens = budget_tokens or settings.retrieval_context_tokens
+        top_k = top_k or settings.retrieval_top_k
+        ranked = await self.search(notebook_id, query, top_k) if query.strip() else []
+        if not ranked:
+            index = self._indexes.get(notebook_id)
+            ranked = sorted(index.chunks.values(), key=lambda c: c.key) if index else []
+
+        selected: List[Chunk] = []
+        used = 0
+        for chunk in ranked:
+            cost = estimate_tokens(chunk.text)
+            if used + cost > budget_tokens:
+                continue
+            selected.append(chunk)
+            used += cost
+        selected.sort(key=lambda c: c.key)
+        return "\n\n".join(f"[{_source_label(c.doc_id)}]\n{c.text}" for c in selected)
+
+
+NOTE_DOC_ID = "note"
+
+
+def _source_label(doc_id: str) -> str:
+    return "Notes" if doc_id == NOTE_DOC_ID else "File"
+
+
+def file_doc_id(file_id: str) -> str:
+    return f"file:{file_id}"
+
+
+retrieval_index = RetrievalIndex(settings.retrieval_max_notebooks)
@@ -0,0 +1,123 @@
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+
+logger = logging.getLogger(__name__)
+
+# Models often leave a trailing comma before a closing bracket.
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _loads_tolerant(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+    except ValueError:
+        return None
+
+
+class JsonObjectExtractor:
+    """Pull complete JSON objects out of text that arrives in pieces.
+
+    Scans each chunk once, tracking string/escape state and brace depth, and
+    returns every `{...}` as soon as its closing brace arrives, at any
+    nesting level (inner objects before the object containing them). Prose,
+    code fences and a wrapping array or object around the items are
+    skipped, and objects that still don't parse are dropped, so a sloppy
+    model answer yields whatever well-formed objects it contains.
+    """
+
+    def __init__(self) -> None:
+        self._buffer: List[str] = []
+        self._starts: List[int] = []  # buffer offsets of currently open objects
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        objects: List[Dict[str, Any]] = []
+        for ch in chunk:
+            if self._starts:
+                self._buffer.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = bool(self._starts)
+            elif ch == "{":
+                if not self._starts:
+                    self._buffer = ["{"]
+                self._starts.append(len(self._buffer) - 1)
+            elif ch == "}" and self._starts:
+                start = self._starts.pop()
+                parsed = _loads_tolerant("".join(self._buffer[start:]))
+                if isinstance(parsed, dict):
+                    objects.append(parsed)
+                if not self._starts:
+                    self._buffer = []
+        return objects
+
+
+def parse_items(text: str, schema: Type[BaseModel]) -> List[Dict[str, Any]]:
+    """Return every object in `text` that validates against `schema`."""
+    items = []
+    for obj in JsonObjectExtractor().feed(text):
+        try:
+            items.append(schema.parse_obj(obj).dict())
+        except ValidationError:
+            continue
+    return items
+
+
+class ItemBatcher:
+    """Validate objects from a token stream and persist them in batches.
+
+    `feed` returns the items completed by a chunk so callers can forward
+    them right away; every `batch_size` items (and on `close`) the pending
+    ones are handed to `flush(batch, start_position)`.
+    """
+
+    def __init__(
+        self,
+        schema: Type[BaseModel],
+        flush: Optional[Callable[[List[Dict[str, Any]], int], Awaitable[None]]],
+        batch_size: int,
+    ) -> None:
+        self.schema = schema
+        self._flush = flush
+        self.batch_size = max(1, batch_size)
+        self.items: List[Dict[str, Any]] = []
+        self._flushed = 0
+        self._extractor = JsonObjectExtractor()
+
+    async def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        new_items = []
+        for obj in self._extractor.feed(chunk):
+            try:
+                new_items.append(self.schema.parse_obj(obj).dict())
+            except ValidationError:
+                logger.debug("Dropping %s that failed validation", self.schema.__name__)
+        self.items.extend(new_items)
+        if len(self.items) - self._flushed >= self.batch_size:
+            await self.flush()
+        return new_items
+
+    async def flush(self) -> None:
+        pending = self.items[self._flushed :]
+        if pending and self._flush is not None:
+            await self._flush(pending, self._flushed)
+        self._flushed = len(self.items)
+
+    async def close(self) -> List[Dict[str, Any]]:
+        await self.flush()
+        return self.items
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from services.ollama_service import generate_ollama
+from services.prompt_budget import Section, count_tokens, fit_prompt
+from services.response_cache import cache_key, response_cache
+from services.retrieval import CHARS_PER_TOKEN, split_long
+from utils.config import settings
+
+
+CHUNK_PROMPT = (
+    "Summarize this section of a student's study material for exam revision. "
+    "Keep definitions, formulas, key facts, dates and worked examples; drop "
+    "filler. Reply with the summary only.\n\nSection:\n$chunk"
+)
+COMBINE_PROMPT = (
+    "Merge these partial summaries of consecutive sections of a student's "
+    "study material into one summary. Keep every distinct fact; remove "
+    "repetition. Reply with the summary only.\n\nPartial summaries:\n$parts"
+)
+
+
+def content_chunks(text: str, target_tokens: Optional[int] = None) -> List[str]:
+    """Split text into chunks whose boundaries depend only on nearby content.
+
+    A chunk ends after a paragraph whose hash picks it as a boundary (once
+    the chunk has half the target size), or before a paragraph that would
+    push it over the target. Editing one paragraph therefore only changes
+    the chunk(s) around it; the rest keep their exact text and hash, so
+    their cached summaries stay valid.
+    """
+    target_tokens = target_tokens or settings.summary_chunk_tokens
+    max_chars = target_tokens * CHARS_PER_TOKEN
+    min_chars = max_chars // 2
+
+    paragraphs: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if len(paragraph) > max_chars:
+            paragraphs.extend(split_long(paragraph, target_tokens, 0))
+        elif paragraph:
+            paragraphs.append(paragraph)
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        if current and size + len(paragraph) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+        digest = hashlib.sha1(paragraph.encode("utf-8")).digest()
+        if size >= min_chars and digest[0] % 4 == 0:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+@dataclass
+class MapReduceResult:
+    """Chunk summaries reduced to fit one final prompt."""
+
+    summaries: List[str]
+    chunks: int = 0
+    cached: int = 0
+    levels: int = 0
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "chunks": self.chunks,
+            "chunks_cached": self.cached,
+            "combine_levels": self.levels,
+        }
+
+
+async def _summarize(
+    template: str, name: str, text: str, result: MapReduceResult
+) -> str:
+    """Summarize one piece, cached by its content (not tied to a notebook)."""
+    plan = fit_prompt(template, [Section(name, text)], settings.summary_chunk_max_tokens)
+    options = plan.options()
+    key = cache_key(settings.ollama_model, f"summary-map:{name}", plan.prompt, options)
+    if settings.response_cache_enabled:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            if name == "chunk":
+                result.cached += 1
+            return cached
+    summary = await generate_ollama(plan.prompt, options=options)
+    if settings.response_cache_enabled:
+        # Untagged, so notebook edits don't purge it: unchanged chunks hit.
+        await response_cache.aput(key, summary)
+    return summary
+
+
+async def map_reduce_summary(documents: List[str], budget_tokens: int) -> MapReduceResult:
+    """Summarize `documents` chunk by chunk, then merge until it fits.
+
+    Chunk summaries run concurrently, at most SUMMARY_MAP_CONCURRENCY at a
+    time so a large notebook doesn't flood the LLM queue; they still go
+    through the scheduler like every other call. Partial summaries are then
+    merged in groups until together they fit in `budget_tokens`.
+    """
+    chunks = [c for text in documents for c in content_chunks(text)]
+    result = MapReduceResult(summaries=[], chunks=len(chunks))
+    limit = asyncio.Semaphore(settings.summary_map_concurrency)
+
+    async def run(template: str, name: str, text: str) -> str:
+        async with limit:
+            return await _summarize(template, name, text, result)
+
+    summaries = await asyncio.gather(*(run(CHUNK_PROMPT, "chunk", c) for c in chunks))
+    while len(summaries) > 1 and count_tokens("\n\n".join(summaries)) > budget_tokens:
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for summary in summaries:
+            tokens = count_tokens(summary)
+            if groups[-1] and group_tokens + tokens > settings.summary_chunk_tokens:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(summary)
+            group_tokens += tokens
+        if len(groups) == len(summaries):
+            break  # every summary is already chunk-sized; let fit_prompt trim
+        summaries = await asyncio.gather(
+            *(run(COMBINE_PROMPT, "parts", "\n\n".join(g)) for g in groups)
+        )
+        result.levels += 1
+    result.summaries = list(summaries)
+    return result
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.ollama_service import ollama_client
+from utils.config import settings
+from utils.database import get_supabase
+
+
+logger = logging.getLogger(__name__)
+
+_MAX_RETRY_DELAY = 30.0
+
+Step = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+async def _create_supabase_client() -> None:
+    await asyncio.get_running_loop().run_in_executor(None, get_supabase)
+
+
+def _load_model(model: str, path: str = "/api/generate") -> Step:
+    async def run() -> Dict[str, Any]:
+        loaded = await ollama_client.warm_up(model, path)
+        # Backends that failed load the model on first use instead.
+        return {"model": model, "backends_loaded": loaded}
+
+    return run
+
+
+class Warmup:
+    """Startup work that has to finish before a worker takes traffic.
+
+    Runs in the background after startup so the server accepts connections
+    (and answers /health) at once: creates the Supabase client outside
+    local mode, which also imports the storage stack, and with
+    OLLAMA_WARMUP asks the Ollama backends to load OLLAMA_MODEL (and the
+    embedding model when retrieval uses it) so the first AI request doesn't
+    pay for the load. Failed steps are retried with backoff; `ready` turns
+    true once every step has succeeded.
+    """
+
+    def __init__(self) -> None:
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished is not None
+
+    def _plan(self) -> List[Tuple[str, Step]]:
+        steps: List[Tuple[str, Step]] = []
+        if not settings.use_local_db:
+            steps.append(("supabase", _create_supabase_client))
+        if settings.ollama_warmup:
+            steps.append(("model", _load_model(settings.ollama_model)))
+            if settings.retrieval_backend == "ollama":
+                steps.append(
+                    (
+                        "embedding_model",
+                        _load_model(settings.ollama_embedding_model, "/api/embeddings"),
+                    )
+                )
+        return steps
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self.started = time.monotonic()
+        plan = self._plan()
+        self.steps = {name: {"state": "pending"} for name, _ in plan}
+        self._task = asyncio.get_running_loop().create_task(self._run(plan))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, plan: List[Tuple[str, Step]]) -> None:
+        await asyncio.gather(*(self._step(name, run) for name, run in plan))
+        self.finished = time.monotonic()
+        logger.info("Warm-up finished in %.1fs", self.finished - self.started)
+
+    async def _step(self, name: str, run: Step) -> None:
+        delay = 1.0
+        attempts = 0
+        while True:
+            started = time.monotonic()
+            attempts += 1
+            try:
+                result = await run()
+            except Exception as exc:
+                error = str(exc) or exc.__class__.__name__
+                self.steps[name] = {"state": "retrying", "attempts": attempts, "error": error}
+                # Warn once; a missing Ollama in development would flood the log.
+                logger.log(
+                    logging.WARNING if attempts == 1 else logging.DEBUG,
+                    "Warm-up step %s failed, retrying: %s",
+                    name,
+                    error,
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RETRY_DELAY)
+                continue
+            self.steps[name] = {
+                "state": "done",
+                "seconds": round(time.monotonic() - started, 3),
+                **(result or {}),
+            }
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {
+            "ready": self.ready,
+            "seconds": round(end - self.started, 3),
+            "steps": self.steps,
+        }
+
+
+warmup = Warmup()
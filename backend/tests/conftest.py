@@ -0,0 +1,43 @@
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+# Settings are read when utils.config is first imported, so the test
+# environment is set up before any app module is. Everything runs against a
+# throwaway SQLite database (USE_LOCAL_DB); Supabase and Ollama are never
+# contacted.
+_tmp = Path(tempfile.mkdtemp(prefix="studymate-tests-"))
+os.environ.update(
+    {
+        "SUPABASE_URL": "https://example.supabase.co",
+        "SUPABASE_KEY": "test",
+        "JWT_SECRET_KEY": "test-secret",
+        "USE_LOCAL_DB": "true",
+        "LOCAL_DB_PATH": str(_tmp / "local.db"),
+        "LOCAL_STORAGE_PATH": str(_tmp / "storage"),
+        "RESPONSE_CACHE_PATH": str(_tmp / "llm_cache.db"),
+        "OLLAMA_WARMUP": "false",
+    }
+)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Sign up a fresh user and return its Authorization header."""
+    credentials = {"email": f"{uuid.uuid4().hex}@example.com", "password": "secret123"}
+    assert client.post("/auth/signup", json=credentials).status_code == 200
+    token = client.post("/auth/login", json=credentials).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
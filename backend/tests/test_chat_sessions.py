@@ -0,0 +1,42 @@
+from api.ai import _max_session_budget
+from utils.config import settings
+
+
+def _create_session(client, auth_headers, **payload):
+    response = client.post("/ai/chat/sessions", json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_oversized_budget_is_clamped_to_the_window(client, auth_headers):
+    session = _create_session(client, auth_headers, token_budget=10**9)
+
+    assert session["token_budget"] == _max_session_budget()
+    assert session["token_budget"] < settings.ollama_num_ctx
+
+
+def test_overlong_message_is_rejected(client, auth_headers):
+    session = _create_session(client, auth_headers)
+
+    response = client.post(
+        f"/ai/chat/sessions/{session['id']}/messages",
+        json={"content": "x" * 8001},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 422
+
+
+def test_turn_that_cannot_fit_the_window_is_rejected(
+    client, auth_headers, monkeypatch
+):
+    session = _create_session(client, auth_headers, token_budget=256)
+    monkeypatch.setattr(settings, "ollama_num_ctx", 1024)
+
+    response = client.post(
+        f"/ai/chat/sessions/{session['id']}/messages",
+        json={"content": "word " * 800},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 413
@@ -0,0 +1,94 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from utils import local_db
+from utils.pagination import decode_keyset_cursor, encode_cursor
+
+
+def _pages(client, headers, url, limit):
+    """Follow next_cursor from the first page to the last; return all pages."""
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        pages.append(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_notebook_list_pages_through_every_row_once(client, auth_headers):
+    created = [
+        client.post("/notebooks/create", json={"title": f"nb {i}"}, headers=auth_headers)
+        .json()["id"]
+        for i in range(7)
+    ]
+
+    pages = _pages(client, auth_headers, "/notebooks/list", limit=3)
+
+    assert [len(p) for p in pages] == [3, 3, 1]
+    ids = [row["id"] for page in pages for row in page]
+    assert sorted(ids) == sorted(created)
+    keys = [(row["created_at"], row["id"]) for page in pages for row in page]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_rows_sharing_created_at_are_split_by_id(client, auth_headers):
+    notebook_id = client.post(
+        "/notebooks/create", json={"title": "cards"}, headers=auth_headers
+    ).json()["id"]
+    # Same timestamp for every row: only the id tie-break orders them.
+    stamp = "2026-01-01T00:00:00.000Z"
+    card_ids = sorted(str(uuid.uuid4()) for _ in range(5))
+    for card_id in card_ids:
+        local_db.execute(
+            "INSERT INTO flashcards(id, notebook_id, front, back, created_at) "
+            "VALUES (?, ?, 'f', 'b', ?)",
+            (card_id, notebook_id, stamp),
+        )
+
+    pages = _pages(
+        client, auth_headers, f"/notebooks/{notebook_id}/flashcards", limit=2
+    )
+
+    assert [row["id"] for page in pages for row in page] == card_ids[::-1]
+
+
+def test_fields_limit_columns_but_keep_the_cursor_keys(client, auth_headers):
+    client.post("/notebooks/create", json={"title": "only"}, headers=auth_headers)
+
+    response = client.get(
+        "/notebooks/list", params={"fields": "title"}, headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    assert set(response.json()["items"][0]) == {"id", "created_at", "title"}
+    unknown = client.get(
+        "/notebooks/list", params={"fields": "password_hash"}, headers=auth_headers
+    )
+    assert unknown.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-base64!",
+        encode_cursor("2026-01-01T00:00:00Z"),
+        encode_cursor("yesterday", "abc"),
+        encode_cursor("2026-01-01T00:00:00Z", "x),id.gt.0"),
+    ],
+)
+def test_malformed_keyset_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_keyset_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_keyset_cursor_round_trip():
+    after = ["2026-01-01T00:00:00.000Z", str(uuid.uuid4())]
+    assert decode_keyset_cursor(encode_cursor(*after)) == after
+    assert decode_keyset_cursor(None) is None
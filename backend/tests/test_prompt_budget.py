@@ -0,0 +1,32 @@
+from api.ai import _quiz_prompt
+from models.schemas import QuizRequest
+from services.prompt_budget import Section, count_tokens, fit_prompt
+
+
+def test_placeholder_in_user_value_stays_literal():
+    req = QuizRequest(text="the notes", level="$text", qtype="${context}")
+
+    plan = _quiz_prompt(req, "the context")
+
+    assert "Level: $text. Type: ${context}." in plan.prompt
+    assert plan.prompt.count("the notes") == 1
+    assert plan.prompt.count("the context") == 1
+
+
+def test_repeated_placeholder_is_counted_per_use():
+    text = "word " * 6000
+
+    plan = fit_prompt("Level: $text\n$text", [Section("text", text)], 512, num_ctx=4096)
+
+    assert plan.truncated == ["text"]
+    assert plan.prompt_tokens == count_tokens(plan.prompt)
+    assert plan.prompt_tokens + 512 <= 4096
+
+
+def test_prompt_tokens_match_the_rendered_prompt():
+    plan = fit_prompt(
+        "$a and $a", [Section("a", "x" * 400)], 128, system="be brief", num_ctx=4096
+    )
+
+    assert plan.truncated == []
+    assert plan.prompt_tokens == count_tokens("be brief") + count_tokens(plan.prompt)
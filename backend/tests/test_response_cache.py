@@ -0,0 +1,46 @@
+import time
+
+from services.response_cache import ResponseCache
+
+
+def _cache(tmp_path, **kwargs):
+    options = {"memory_entries": 4, "max_bytes": 10_000, "ttl_seconds": 60}
+    return ResponseCache(tmp_path / "cache.db", **{**options, **kwargs})
+
+
+def _disk_bytes(cache):
+    return cache._db().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_byte_total_tracks_replace_purge_and_eviction(tmp_path):
+    cache = _cache(tmp_path, max_bytes=250)
+    cache.put("a", "x" * 100, "nb1")
+    cache.put("a", "x" * 50, "nb1")
+    cache.put("b", "y" * 100, "nb2")
+    assert cache._bytes == _disk_bytes(cache) == 150
+
+    cache.put("c", "z" * 150)
+    assert cache._bytes == _disk_bytes(cache) <= 250
+
+    cache.purge_notebook("nb2")
+    assert cache._bytes == _disk_bytes(cache)
+
+
+def test_total_is_seeded_from_disk_at_open(tmp_path):
+    _cache(tmp_path).put("a", "x" * 120)
+
+    reopened = _cache(tmp_path)
+    reopened.put("b", "y" * 30)
+
+    assert reopened._bytes == 150
+
+
+def test_expired_rows_are_deleted_every_n_puts(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=1, expire_every=3)
+    cache.put("old", "x" * 10)
+    cache._db().execute("UPDATE responses SET created_at = ?", (time.time() - 10,))
+
+    cache.put("b", "y")
+    assert _disk_bytes(cache) == 11
+    cache.put("c", "z")
+    assert _disk_bytes(cache) == cache._bytes == 2
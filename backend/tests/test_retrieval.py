@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from services.context_cache import context_cache
+from services.retrieval import RetrievalIndex, _digest
+from utils.repository import chunk_repo
+
+
+@pytest.fixture
+def notebook_id(client, auth_headers):
+    return client.post(
+        "/notebooks/create", json={"title": "retrieval"}, headers=auth_headers
+    ).json()["id"]
+
+
+def test_stale_snapshot_does_not_overwrite_newer_chunks(notebook_id):
+    async def scenario():
+        index = RetrievalIndex(max_notebooks=4)
+        # The snapshot is read, then a write lands before the index loads.
+        version = context_cache.version(notebook_id)
+        snapshot = {"note": "old text about mitochondria"}
+        context_cache.write_document(notebook_id, "note", "new text about ribosomes")
+        await index.index_document(notebook_id, "note", "new text about ribosomes")
+
+        await index.ensure_loaded(notebook_id, snapshot, version)
+        await asyncio.gather(*index._pending.values())
+        context = await index.build_context(notebook_id, "ribosomes")
+        rows = await chunk_repo.list_for_notebook(notebook_id)
+        return context, rows
+
+    context, rows = asyncio.run(scenario())
+
+    assert "ribosomes" in context
+    assert "mitochondria" not in context
+    assert {r["source_hash"] for r in rows} == {_digest("new text about ribosomes")}
+
+
+def test_locks_are_only_kept_for_loaded_notebooks(notebook_id):
+    async def scenario():
+        index = RetrievalIndex(max_notebooks=4)
+        await index.index_document(notebook_id, "note", "some text")
+        unloaded = notebook_id in index._locks
+        await index.ensure_loaded(
+            notebook_id, {"note": "some text"}, context_cache.version(notebook_id)
+        )
+        loaded = notebook_id in index._locks
+        index.drop(notebook_id)
+        await index.close()
+        return unloaded, loaded, notebook_id in index._locks
+
+    assert asyncio.run(scenario()) == (False, True, False)
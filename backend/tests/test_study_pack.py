@@ -0,0 +1,19 @@
+from models.schemas import StudyPackRequest
+
+
+def test_empty_artifact_list_is_rejected(client, auth_headers):
+    response = client.post(
+        "/ai/study-pack", json={"text": "notes", "artifacts": []}, headers=auth_headers
+    )
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][-1] == "artifacts"
+
+
+def test_artifacts_default_to_the_whole_pack():
+    assert StudyPackRequest(text="notes").artifacts == [
+        "summary",
+        "flashcards",
+        "quiz",
+        "study_plan",
+    ]
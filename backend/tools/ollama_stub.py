@@ -0,0 +1,159 @@
+"""Minimal stand-in for an Ollama server, for trying out multi-backend routing.
+
+Run several on different ports and point OLLAMA_BASE_URLS at them:
+
+    python tools/ollama_stub.py --port 11435 &
+    python tools/ollama_stub.py --port 11436 --delay 2 &
+    OLLAMA_BASE_URLS=http://localhost:11435,http://localhost:11436 uvicorn main:app
+
+Generations echo the start of the prompt after `--delay` seconds (the time to
+first token), padded to `--tokens` words if given, and then produce one word
+per token at `--tokens-per-second`; non-streaming replies wait for the whole
+answer. The first request for a model "loads" it (`--load-delay`), and
+/api/ps then lists it, like a real server. Every response carries the port
+in `X-Stub-Port`. `bench/run.py` starts one of these for its load tests.
+"""
+import argparse
+import asyncio
+import json
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def _vector(text: str) -> list:
+    return [float(len(text) % 7), float(len(text) % 11), 1.0]
+
+
+def create_app(
+    port: int,
+    delay: float,
+    load_delay: float,
+    tokens_per_second: float = 100.0,
+    tokens: int = 0,
+) -> FastAPI:
+    app = FastAPI(title=f"Ollama stub :{port}")
+    loaded: set = set()
+    per_token = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    async def run(model: str) -> float:
+        """Wait for the model load (first use only) and the prompt; return the load time."""
+        load = 0.0
+        if model not in loaded:
+            load = load_delay
+            await asyncio.sleep(load_delay)
+            loaded.add(model)
+        await asyncio.sleep(delay)
+        return load
+
+    @app.middleware("http")
+    async def tag_port(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Stub-Port"] = str(port)
+        return response
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": m, "model": m} for m in sorted(loaded)]}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": m, "model": m} for m in sorted(loaded)]}
+
+    def answer(echo: str) -> list:
+        words = echo.split(" ")
+        filler = ("lorem", "ipsum", "dolor", "sit", "amet")
+        while len(words) < tokens:
+            words.append(filler[len(words) % len(filler)])
+        return words
+
+    async def reply(echo: str, stream: bool, wrap, load: float, prompt: str):
+        words = answer(echo)
+        # The timing fields Ollama puts on its final response, in nanoseconds.
+        stats = {
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": int(delay * 1e9),
+            "eval_count": len(words),
+            "eval_duration": int(per_token * len(words) * 1e9),
+        }
+        stats["total_duration"] = sum(v for k, v in stats.items() if "duration" in k)
+        if not stream:
+            await asyncio.sleep(per_token * len(words))
+            return {**wrap(" ".join(words), True), **stats}
+
+        async def chunks():
+            for word in words:
+                yield json.dumps(wrap(word + " ", False)) + "\n"
+                await asyncio.sleep(per_token)
+            yield json.dumps({**wrap("", True), **stats}) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        load = await run(body["model"])
+        text = f"[{port}] {body['prompt'][:80]}"
+        return await reply(
+            text,
+            body.get("stream", True),
+            lambda t, done: {"response": t, "done": done, "context": [1, 2, 3]},
+            load,
+            body["prompt"],
+        )
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        load = await run(body["model"])
+        text = f"[{port}] {body['messages'][-1]['content'][:80]}"
+        return await reply(
+            text,
+            body.get("stream", True),
+            lambda t, done: {"message": {"role": "assistant", "content": t}, "done": done},
+            load,
+            "".join(m["content"] for m in body["messages"]),
+        )
+
+    @app.post("/api/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        await run(body["model"])
+        prompt = body.get("prompt", "")
+        return {"embedding": _vector(prompt)}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        await run(body["model"])
+        texts = body.get("input", "")
+        if isinstance(texts, str):
+            texts = [texts]
+        return {"embeddings": [_vector(t) for t in texts]}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument(
+        "--delay", type=float, default=0.2, help="seconds before the first token"
+    )
+    parser.add_argument(
+        "--load-delay", type=float, default=1.0, help="seconds to 'load' a new model"
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=100.0, help="0 for no limit"
+    )
+    parser.add_argument(
+        "--tokens", type=int, default=0, help="pad answers to this many words"
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    app = create_app(
+        args.port, args.delay, args.load_delay, args.tokens_per_second, args.tokens
+    )
+    uvicorn.run(app, port=args.port, log_level=args.log_level)
@@ -1,13 +1,17 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
-from utils.database import supabase
 from utils.config import settings
+from utils.metrics import span
+from utils.repository import user_repo
 
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -15,7 +19,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with span("password_verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
@@ -32,31 +37,81 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+class PrincipalCache:
+    """TTL cache of authenticated users keyed by token subject.
+
+    Missing users are cached too (for a shorter time) so a token for a
+    deleted account doesn't hit the database on every request. Entries
+    only expire: the app never updates or deletes users, so a change made
+    directly in the database shows up within the TTL.
+    """
+
+    def __init__(
+        self, ttl_seconds: float, negative_ttl_seconds: float, max_entries: int
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Return (found, user); `user` is None for a cached miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return False, None
+            user, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[user_id]
+                return False, None
+            self._entries.move_to_end(user_id)
+            return True, user
+
+    def put(self, user_id: str, user: Optional[Dict[str, Any]]) -> None:
+        ttl = self.ttl_seconds if user is not None else self.negative_ttl_seconds
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+principal_cache = PrincipalCache(
+    settings.auth_user_cache_ttl_seconds,
+    settings.auth_user_negative_ttl_seconds,
+    settings.auth_user_cache_max_entries,
+)
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(
-            token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
+    with span("auth"):
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        user_id: str = payload.get("sub")
-        if user_id is None:
+        try:
+            payload = jwt.decode(
+                token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm]
+            )
+            user_id: str = payload.get("sub")
+            if user_id is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    resp = (
-        supabase.table("users")
-        .select("id, email")
-        .eq("id", user_id)
-        .limit(1)
-        .execute()
-    )
-    if not resp.data:
-        raise credentials_exception
-    return resp.data[0]
 
+        # Tokens carry the email since login; trusting the signature alone skips
+        # the lookup entirely, at the cost of honouring deleted users until expiry.
+        if settings.auth_trust_token_claims and payload.get("email"):
+            return {"id": user_id, "email": payload["email"]}
 
+        found, user = principal_cache.get(user_id)
+        if not found:
+            user = await user_repo.get(user_id)
+            principal_cache.put(user_id, user)
+        if user is None:
+            raise credentials_exception
+        return user
@@ -0,0 +1,10 @@
+# Column lists shared by the Supabase and SQLite repositories (and the
+# routers that validate `fields=` against them). Kept apart from
+# utils.repository, which imports utils.local_repository at its bottom.
+
+# Columns fetched for the embedded resources of a notebook bundle.
+NOTE_COLUMNS = "id, notebook_id, content, ai_summary"
+FILE_META_COLUMNS = (
+    "id, notebook_id, storage_path, status, error, content_hash, "
+    "page_count, char_count, created_at"
+)
@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 from pydantic import BaseSettings
 
 
@@ -5,10 +8,118 @@ class Settings(BaseSettings):
     supabase_url: str
     supabase_key: str
     use_local_db: bool = False
+    # Threads used to run blocking database calls off the event loop.
+    db_max_workers: int = 16
+    # Local SQLite backend (USE_LOCAL_DB): database file, pooled connections,
+    # and where uploaded files are kept instead of Supabase storage.
+    local_db_path: str = str(Path(__file__).resolve().parents[1] / "local.db")
+    local_db_pool_size: int = 8
+    local_storage_path: str = str(Path(__file__).resolve().parents[1] / "local_storage")
     jwt_secret_key: str
     jwt_algorithm: str = "HS256"
+    # Authenticated-user cache used by get_current_user. Entries are never
+    # invalidated (the app doesn't change users), so a user deleted in the
+    # database keeps access for up to the TTL. With AUTH_TRUST_TOKEN_CLAIMS
+    # the signed id/email in the JWT are used as-is and no lookup happens at
+    # all (deleted users keep access until token expiry).
+    auth_user_cache_ttl_seconds: float = 300.0
+    auth_user_negative_ttl_seconds: float = 30.0
+    auth_user_cache_max_entries: int = 10000
+    auth_trust_token_claims: bool = False
     ollama_base_url: str = "http://localhost:11434"
+    # Comma-separated Ollama hosts to spread generations over; when empty,
+    # OLLAMA_BASE_URL is the only backend (services.ollama_pool).
+    ollama_base_urls: str = ""
     ollama_model: str = "llama3.1:8b"
+    # Shared Ollama client: pool size per backend, in-flight generations per
+    # backend, timeouts and retry policy for connection errors.
+    ollama_max_connections: int = 8
+    ollama_max_concurrency: int = 2
+    ollama_timeout: float = 120.0
+    ollama_connect_timeout: float = 5.0
+    ollama_max_retries: int = 2
+    ollama_retry_backoff: float = 0.5
+    # Backend health checks (GET /api/ps) and circuit breaker: a backend is
+    # skipped for OLLAMA_BREAKER_COOLDOWN seconds after
+    # OLLAMA_BREAKER_FAILURES consecutive connection errors, timeouts, 5xx
+    # responses or health checks slower than OLLAMA_HEALTH_TIMEOUT.
+    ollama_health_interval: float = 15.0
+    ollama_health_timeout: float = 2.0
+    ollama_breaker_failures: int = 3
+    ollama_breaker_cooldown: float = 30.0
+    # LLM request queue (services.llm_scheduler): how many requests may wait
+    # for a generation slot in total and per user before new ones get a 429.
+    llm_queue_max_depth: int = 64
+    llm_queue_max_per_user: int = 4
+    # Context window requested from Ollama for every generation; prompts are
+    # trimmed to fit it (services.prompt_budget). PROMPT_TOKENIZER_PATH may
+    # point at the model's Hugging Face tokenizer.json for exact counts
+    # (needs the `tokenizers` package); otherwise counts are estimated.
+    ollama_num_ctx: int = 8192
+    prompt_overhead_tokens: int = 32
+    prompt_tokenizer_path: str = ""
+    # How long Ollama keeps the model loaded after multi-step requests
+    # (study packs), so later steps don't pay for a reload.
+    ollama_keep_alive: str = "10m"
+    # Retrieval for notebook context: "bm25" (default) or "ollama" embeddings
+    # with BM25 as the fallback.
+    retrieval_backend: str = "bm25"
+    ollama_embedding_model: str = "nomic-embed-text"
+    retrieval_chunk_tokens: int = 300
+    retrieval_chunk_overlap_tokens: int = 40
+    # Chunks are embedded when a document is indexed, this many per Ollama
+    # request; and read/written this many rows per Supabase request.
+    retrieval_embed_batch_size: int = 32
+    chunk_page_size: int = 500
+    # Map-reduce summaries (services.summarize): notebooks with more material
+    # than SUMMARY_MAP_REDUCE_MIN_TOKENS are summarized chunk by chunk
+    # (cached per chunk), then the chunk summaries are merged.
+    summary_map_reduce_min_tokens: int = 3000
+    summary_chunk_tokens: int = 1200
+    summary_chunk_max_tokens: int = 256
+    summary_map_concurrency: int = 4
+    retrieval_top_k: int = 8
+    retrieval_context_tokens: int = 3000
+    retrieval_query_tokens: int = 256
+    retrieval_max_notebooks: int = 256
+    # Chat sessions: once a session's history passes its token budget, older
+    # turns are folded into a rolling summary, keeping the latest messages.
+    chat_session_token_budget: int = 2000
+    chat_keep_recent_messages: int = 4
+    chat_summary_max_tokens: int = 300
+    # In-process cache of notebook contents used to build AI context.
+    context_cache_max_entries: int = 512
+    context_cache_max_bytes: int = 64 * 1024 * 1024
+    # LLM response cache for deterministic endpoints (summary, flashcards, ...).
+    response_cache_enabled: bool = True
+    response_cache_path: str = str(Path(__file__).resolve().parents[1] / "llm_cache.db")
+    response_cache_memory_entries: int = 256
+    response_cache_max_bytes: int = 256 * 1024 * 1024
+    response_cache_ttl_seconds: float = 7 * 24 * 3600
+    # Expired rows are deleted once every this many puts, not on each one.
+    response_cache_expire_every: int = 100
+    # Flashcards/quiz questions parsed from model output are inserted this
+    # many rows at a time.
+    structured_batch_size: int = 10
+    # Uploads are streamed to disk in chunks and capped at this size.
+    max_upload_bytes: int = 50 * 1024 * 1024
+    upload_chunk_bytes: int = 1024 * 1024
+    # Background extraction of uploads.
+    ingest_max_workers: int = os.cpu_count() or 2
+    ingest_pdf_pages_per_task: int = 8
+    ingest_ocr_min_chars: int = 20
+    ingest_retained_jobs: int = 1000
+    # GET /upload/{id}/text: bodies at least this large are compressed
+    # (brotli when installed, else gzip) at these levels.
+    text_compress_min_bytes: int = 1024
+    text_gzip_level: int = 6
+    text_brotli_quality: int = 5
+    # Startup warm-up (services.warmup): load OLLAMA_MODEL on the Ollama
+    # backends right after startup; GET /ready answers 503 until it's done.
+    ollama_warmup: bool = True
+    # Requests slower than this are logged with their stage breakdown
+    # (utils.metrics); 0 turns the log off.
+    slow_request_seconds: float = 5.0
     
     class Config:
         env_file = ".env"
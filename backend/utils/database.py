@@ -1,31 +1,49 @@
-from supabase import create_client, Client
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
 from utils.config import settings
 
-_supabase_client: Client = None
+if TYPE_CHECKING:
+    from supabase import Client
+
+_supabase_client: "Client" = None
+
+
+def check_supabase_settings() -> None:
+    """Raise ValueError if SUPABASE_URL/SUPABASE_KEY are missing or placeholders."""
+    url = settings.supabase_url
+    key = settings.supabase_key
+
+    # Validate URL format
+    if not url or url == "your_supabase_url_here" or not url.startswith("https://"):
+        raise ValueError(
+            f"Invalid SUPABASE_URL: '{url}'. "
+            "Please set a valid Supabase URL in your .env file. "
+            "Get it from: https://supabase.com/dashboard → Settings → API"
+        )
+
+    if not key or key == "your_supabase_key_here":
+        raise ValueError(
+            "Invalid SUPABASE_KEY. "
+            "Please set your Supabase anon key in your .env file. "
+            "Get it from: https://supabase.com/dashboard → Settings → API"
+        )
+
+
+def get_supabase() -> "Client":
+    """Lazy-load Supabase client to avoid errors at import time.
 
-def get_supabase() -> Client:
-    """Lazy-load Supabase client to avoid errors at import time."""
+    The `supabase` package (and its httpx/pydantic models) is imported here
+    rather than at module level, so starting the app doesn't pay for it.
+    """
     global _supabase_client
     if _supabase_client is None:
-        url = settings.supabase_url
-        key = settings.supabase_key
-        
-        # Validate URL format
-        if not url or url == "your_supabase_url_here" or not url.startswith("https://"):
-            raise ValueError(
-                f"Invalid SUPABASE_URL: '{url}'. "
-                "Please set a valid Supabase URL in your .env file. "
-                "Get it from: https://supabase.com/dashboard → Settings → API"
-            )
-        
-        if not key or key == "your_supabase_key_here":
-            raise ValueError(
-                "Invalid SUPABASE_KEY. "
-                "Please set your Supabase anon key in your .env file. "
-                "Get it from: https://supabase.com/dashboard → Settings → API"
-            )
-        
-        _supabase_client = create_client(url, key)
+        check_supabase_settings()
+        from supabase import create_client
+
+        _supabase_client = create_client(settings.supabase_url, settings.supabase_key)
     return _supabase_client
 
 # Proxy class to make supabase.table() work seamlessly
@@ -35,3 +53,24 @@ class SupabaseProxy:
 
 supabase = SupabaseProxy()
 
+
+
+# The Supabase client is synchronous. Data access runs on this bounded pool so
+# a slow round trip never blocks the event loop; the client's shared httpx
+# connection pool keeps connections alive across threads.
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.db_max_workers, thread_name_prefix="db"
+)
+
+
+def offloaded(fn):
+    """Turn a blocking data-access function into a coroutine run on the DB pool."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _db_executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    return wrapper
@@ -1,55 +1,381 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
-DB_PATH = Path(__file__).resolve().parents[1] / "local.db"
+from utils.config import settings
 
+DB_PATH = Path(settings.local_db_path)
 
-def _get_conn():
-    conn = sqlite3.connect(str(DB_PATH))
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run, so only append here; never edit an entry that has shipped.
+MIGRATIONS: List[str] = [
+    # 1: original users-only schema
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL
+    );
+    """,
+    # 2: everything else the app stores
+    """
+    CREATE TABLE IF NOT EXISTS notebooks (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        title TEXT NOT NULL,
+        description TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS notebooks_user_created ON notebooks(user_id, created_at);
+
+    CREATE TABLE IF NOT EXISTS notes (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        content TEXT NOT NULL,
+        ai_summary TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS notes_notebook ON notes(notebook_id);
+
+    CREATE TABLE IF NOT EXISTS files (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        storage_path TEXT NOT NULL,
+        extracted_text TEXT,
+        status TEXT NOT NULL DEFAULT 'ready',
+        error TEXT,
+        page_offsets TEXT,
+        content_hash TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS files_notebook ON files(notebook_id);
+    CREATE INDEX IF NOT EXISTS files_content_hash ON files(content_hash);
+
+    CREATE TABLE IF NOT EXISTS flashcards (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        front TEXT NOT NULL,
+        back TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS flashcards_notebook ON flashcards(notebook_id);
+
+    CREATE TABLE IF NOT EXISTS quizzes (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS quizzes_notebook ON quizzes(notebook_id);
+
+    CREATE TABLE IF NOT EXISTS study_plans (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        exam_date TEXT,
+        plan_json TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS study_plans_notebook ON study_plans(notebook_id);
+    """,
+    # 3: one row per generated quiz question
+    """
+    CREATE TABLE IF NOT EXISTS quiz_questions (
+        id TEXT PRIMARY KEY,
+        quiz_id TEXT NOT NULL REFERENCES quizzes(id) ON DELETE CASCADE,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        type TEXT,
+        question TEXT NOT NULL,
+        options TEXT,
+        answer TEXT,
+        explanation TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS quiz_questions_quiz ON quiz_questions(quiz_id, position);
+    CREATE INDEX IF NOT EXISTS quiz_questions_notebook ON quiz_questions(notebook_id);
+    """,
+    # 4: server-side chat sessions
+    """
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        notebook_id TEXT REFERENCES notebooks(id) ON DELETE CASCADE,
+        title TEXT,
+        summary TEXT,
+        token_budget INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS chat_sessions_user_created ON chat_sessions(user_id, created_at);
+
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        compacted INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+    );
+    CREATE INDEX IF NOT EXISTS chat_messages_session ON chat_messages(session_id, created_at);
+    """,
+    # 5: full-text search over notes and extracted file text. search_docs
+    # gives every document a stable integer rowid for the FTS table; the
+    # triggers keep both in step with notes/files.
+    """
+    CREATE TABLE IF NOT EXISTS search_docs (
+        rowid INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        doc_id TEXT NOT NULL UNIQUE,
+        notebook_id TEXT NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        body, tokenize = 'porter unicode61'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS notes_search_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO search_docs(kind, doc_id, notebook_id)
+        VALUES ('note', new.id, new.notebook_id);
+        INSERT INTO search_fts(rowid, body) VALUES (last_insert_rowid(), new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_search_update AFTER UPDATE OF content ON notes BEGIN
+        UPDATE search_fts SET body = new.content
+        WHERE rowid = (SELECT rowid FROM search_docs WHERE doc_id = new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS notes_search_delete AFTER DELETE ON notes BEGIN
+        DELETE FROM search_fts
+        WHERE rowid = (SELECT rowid FROM search_docs WHERE doc_id = old.id);
+        DELETE FROM search_docs WHERE doc_id = old.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS files_search_insert AFTER INSERT ON files BEGIN
+        INSERT INTO search_docs(kind, doc_id, notebook_id)
+        VALUES ('file', new.id, new.notebook_id);
+        INSERT INTO search_fts(rowid, body)
+        VALUES (last_insert_rowid(), coalesce(new.extracted_text, ''));
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_search_update AFTER UPDATE OF extracted_text ON files BEGIN
+        UPDATE search_fts SET body = coalesce(new.extracted_text, '')
+        WHERE rowid = (SELECT rowid FROM search_docs WHERE doc_id = new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS files_search_delete AFTER DELETE ON files BEGIN
+        DELETE FROM search_fts
+        WHERE rowid = (SELECT rowid FROM search_docs WHERE doc_id = old.id);
+        DELETE FROM search_docs WHERE doc_id = old.id;
+    END;
+
+    INSERT INTO search_docs(kind, doc_id, notebook_id)
+    SELECT 'note', id, notebook_id FROM notes
+    UNION ALL
+    SELECT 'file', id, notebook_id FROM files;
+    INSERT INTO search_fts(rowid, body)
+    SELECT d.rowid, coalesce(n.content, f.extracted_text, '')
+    FROM search_docs d
+    LEFT JOIN notes n ON d.kind = 'note' AND n.id = d.doc_id
+    LEFT JOIN files f ON d.kind = 'file' AND f.id = d.doc_id;
+    """,
+    # 6: keyset listings order by (created_at, id) within a notebook or user;
+    # these replace the single-column indexes they cover.
+    """
+    CREATE INDEX IF NOT EXISTS notebooks_user_keyset ON notebooks(user_id, created_at, id);
+    DROP INDEX IF EXISTS notebooks_user_created;
+    CREATE INDEX IF NOT EXISTS files_notebook_keyset ON files(notebook_id, created_at, id);
+    DROP INDEX IF EXISTS files_notebook;
+    CREATE INDEX IF NOT EXISTS flashcards_notebook_keyset
+        ON flashcards(notebook_id, created_at, id);
+    DROP INDEX IF EXISTS flashcards_notebook;
+    CREATE INDEX IF NOT EXISTS quizzes_notebook_keyset ON quizzes(notebook_id, created_at, id);
+    DROP INDEX IF EXISTS quizzes_notebook;
+    CREATE INDEX IF NOT EXISTS study_plans_notebook_keyset
+        ON study_plans(notebook_id, created_at, id);
+    DROP INDEX IF EXISTS study_plans_notebook;
+    """,
+    # 7: text size recorded at extraction, so upload responses and listings
+    # can describe a file without reading its text.
+    """
+    ALTER TABLE files ADD COLUMN page_count INTEGER;
+    ALTER TABLE files ADD COLUMN char_count INTEGER;
+    UPDATE files
+    SET char_count = length(coalesce(extracted_text, '')),
+        page_count = coalesce(json_array_length(page_offsets), 1)
+    WHERE status = 'ready';
+    """,
+    # 8: retrieval chunks, persisted when a document is indexed so building a
+    # notebook's retrieval index is a lookup, not a re-chunk and re-embed.
+    """
+    CREATE TABLE IF NOT EXISTS document_chunks (
+        id TEXT PRIMARY KEY,
+        notebook_id TEXT NOT NULL REFERENCES notebooks(id) ON DELETE CASCADE,
+        doc_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        source_hash TEXT NOT NULL,
+        embedding TEXT
+    );
+    CREATE INDEX IF NOT EXISTS document_chunks_doc
+        ON document_chunks(notebook_id, doc_id, position);
+    """,
+]
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    # cached_statements keeps prepared statements around per connection, so
+    # the repositories' fixed SQL is only compiled once.
+    conn = sqlite3.connect(
+        str(path),
+        check_same_thread=False,
+        timeout=30.0,
+        cached_statements=256,
+        isolation_level=None,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
 
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by the DB threads.
+
+    Connections are created lazily up to `size`; callers beyond that wait
+    for one to be returned. WAL mode lets readers proceed while a writer
+    holds the lock.
+    """
+
+    def __init__(self, path: Path, size: int) -> None:
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _connect(self.path)
+                except BaseException:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the shared pool, creating the database and schema on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+                pool = ConnectionPool(DB_PATH, settings.local_db_pool_size)
+                with pool.connection() as conn:
+                    migrate(conn)
+                _pool = pool
+    return _pool
+
+
+def _statements(script: str) -> Iterator[str]:
+    # Split on ";" but keep trigger bodies (which contain ";") in one piece.
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                yield statement
+            statement = ""
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations and return the resulting schema version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in _statements(script):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return len(MIGRATIONS)
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run several statements atomically on one pooled connection."""
+    with get_pool().connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def fetch_one(sql: str, params: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+    with get_pool().connection() as conn:
+        row = conn.execute(sql, params).fetchone()
+    return dict(row) if row is not None else None
+
+
+def fetch_all(sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    with get_pool().connection() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+def execute(sql: str, params: Sequence[Any] = ()) -> int:
+    """Run a single write statement (autocommitted) and return the row count."""
+    with get_pool().connection() as conn:
+        return conn.execute(sql, params).rowcount
+
+
 def init_db() -> None:
-    """Create users table if it doesn't exist."""
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = _get_conn()
-    try:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-            """
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    """Create the database and bring its schema up to date."""
+    get_pool()
 
 
 def create_user(user_id: str, email: str, password_hash: str) -> Dict[str, Any]:
-    conn = _get_conn()
-    try:
-        conn.execute(
-            "INSERT INTO users(id, email, password_hash) VALUES (?, ?, ?)",
-            (user_id, email, password_hash),
-        )
-        conn.commit()
-        return {"id": user_id, "email": email}
-    finally:
-        conn.close()
+    execute(
+        "INSERT INTO users(id, email, password_hash) VALUES (?, ?, ?)",
+        (user_id, email, password_hash),
+    )
+    return {"id": user_id, "email": email}
 
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
-    conn = _get_conn()
-    try:
-        cur = conn.execute("SELECT id, email, password_hash FROM users WHERE email = ? LIMIT 1", (email,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        return {"id": row["id"], "email": row["email"], "password_hash": row["password_hash"]}
-    finally:
-        conn.close()
+    return fetch_one(
+        "SELECT id, email, password_hash FROM users WHERE email = ? LIMIT 1", (email,)
+    )
@@ -0,0 +1,585 @@
+import json
+import re
+import shutil
+import uuid
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils import local_db
+from utils.columns import FILE_META_COLUMNS, NOTE_COLUMNS
+from utils.config import settings
+from utils.database import offloaded
+
+
+# SQLite-backed counterparts of the repositories in utils.repository, used
+# when USE_LOCAL_DB is set (import them through utils.repository). Method
+# names, arguments and returned rows match the Supabase versions so the
+# routers don't care which one they get.
+
+Row = Dict[str, Any]
+
+# Stored as TEXT here; jsonb (already decoded) in Supabase.
+_JSON_COLUMNS = {"page_offsets", "data", "plan_json", "options", "answer", "embedding"}
+
+
+def _encode(fields: Row) -> Row:
+    return {
+        key: json.dumps(value) if key in _JSON_COLUMNS and value is not None else value
+        for key, value in fields.items()
+    }
+
+
+def _decode(row: Optional[Row]) -> Optional[Row]:
+    if row is None:
+        return None
+    for key in _JSON_COLUMNS & row.keys():
+        if isinstance(row[key], str):
+            row[key] = json.loads(row[key])
+    return row
+
+
+def _select_list(columns: str, alias: str) -> str:
+    """Qualify a Supabase-style "a, b, c" column list for a SQL select."""
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    return ", ".join(f"{alias}.{name}" for name in names)
+
+
+def _insert(table: str, fields: Row) -> Row:
+    return _insert_many(table, [fields])[0]
+
+
+def _insert_many(table: str, rows: List[Row]) -> List[Row]:
+    """Insert rows sharing the same columns in one transaction and return them."""
+    if not rows:
+        return []
+    rows = [_encode({"id": str(uuid.uuid4()), **fields}) for fields in rows]
+    names = ", ".join(rows[0])
+    marks = ", ".join("?" for _ in rows[0])
+    ids = [row["id"] for row in rows]
+    with local_db.transaction() as conn:
+        conn.executemany(
+            f"INSERT INTO {table}({names}) VALUES ({marks})",
+            [tuple(row.values()) for row in rows],
+        )
+        stored = {
+            r["id"]: dict(r)
+            for r in conn.execute(
+                f"SELECT * FROM {table} WHERE id IN ({', '.join('?' for _ in ids)})",
+                ids,
+            ).fetchall()
+        }
+    return [_decode(stored[row_id]) for row_id in ids]
+
+
+def _list_page(
+    table: str,
+    owner_column: str,
+    owner_id: str,
+    columns: str,
+    limit: int,
+    after: Optional[List[Any]],
+) -> List[Row]:
+    """Newest-first rows of `table` after the (created_at, id) keyset `after`."""
+    sql = (
+        f"SELECT {_select_list(columns, 't')} FROM {table} t "
+        f"WHERE t.{owner_column} = ?"
+    )
+    params: List[Any] = [owner_id]
+    if after is not None:
+        sql += " AND (t.created_at, t.id) < (?, ?)"
+        params += after
+    rows = local_db.fetch_all(
+        sql + " ORDER BY t.created_at DESC, t.id DESC LIMIT ?", params + [limit]
+    )
+    return [_decode(row) for row in rows]
+
+
+class LocalUserRepository:
+    @offloaded
+    def get(self, user_id: str) -> Optional[Row]:
+        return local_db.fetch_one(
+            "SELECT id, email FROM users WHERE id = ? LIMIT 1", (user_id,)
+        )
+
+
+class LocalNotebookRepository:
+    @offloaded
+    def create(self, user_id: str, title: str, description: Optional[str]) -> Row:
+        return _insert(
+            "notebooks",
+            {"user_id": user_id, "title": title, "description": description},
+        )
+
+    @offloaded
+    def list_page(
+        self, user_id: str, columns: str, limit: int, after: Optional[List[Any]] = None
+    ) -> List[Row]:
+        return _list_page("notebooks", "user_id", user_id, columns, limit, after)
+
+    @offloaded
+    def get(self, notebook_id: str) -> Optional[Row]:
+        return local_db.fetch_one(
+            "SELECT * FROM notebooks WHERE id = ? LIMIT 1", (notebook_id,)
+        )
+
+    @offloaded
+    def get_owned(self, notebook_id: str, user_id: str) -> Optional[Row]:
+        return local_db.fetch_one(
+            "SELECT * FROM notebooks WHERE id = ? AND user_id = ? LIMIT 1",
+            (notebook_id, user_id),
+        )
+
+    @offloaded
+    def get_bundle(
+        self, notebook_id: str, user_id: str, include_text: bool = False
+    ) -> Optional[Row]:
+        file_columns = FILE_META_COLUMNS + (
+            ", extracted_text, page_offsets" if include_text else ""
+        )
+        with local_db.get_pool().connection() as conn:
+            notebook = conn.execute(
+                "SELECT * FROM notebooks WHERE id = ? AND user_id = ? LIMIT 1",
+                (notebook_id, user_id),
+            ).fetchone()
+            if notebook is None:
+                return None
+            note = conn.execute(
+                f"SELECT {NOTE_COLUMNS} FROM notes WHERE notebook_id = ? "
+                "ORDER BY created_at LIMIT 1",
+                (notebook_id,),
+            ).fetchone()
+            files = conn.execute(
+                f"SELECT {file_columns} FROM files WHERE notebook_id = ? ORDER BY created_at",
+                (notebook_id,),
+            ).fetchall()
+        return {
+            "notebook": dict(notebook),
+            "note": dict(note) if note is not None else None,
+            "files": [_decode(dict(f)) for f in files],
+        }
+
+
+class LocalNoteRepository:
+    @offloaded
+    def get_for_notebook(self, notebook_id: str) -> Optional[Row]:
+        return local_db.fetch_one(
+            "SELECT * FROM notes WHERE notebook_id = ? ORDER BY created_at LIMIT 1",
+            (notebook_id,),
+        )
+
+    @offloaded
+    def upsert(self, notebook_id: str, content: str) -> Row:
+        # Simple strategy: one main note per notebook
+        with local_db.transaction() as conn:
+            existing = conn.execute(
+                "SELECT id FROM notes WHERE notebook_id = ? ORDER BY created_at LIMIT 1",
+                (notebook_id,),
+            ).fetchone()
+            if existing is not None:
+                note_id = existing["id"]
+                conn.execute(
+                    "UPDATE notes SET content = ? WHERE id = ?", (content, note_id)
+                )
+            else:
+                note_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO notes(id, notebook_id, content) VALUES (?, ?, ?)",
+                    (note_id, notebook_id, content),
+                )
+            row = conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return dict(row)
+
+    @offloaded
+    def set_summary(self, notebook_id: str, summary: str) -> None:
+        local_db.execute(
+            "UPDATE notes SET ai_summary = ? WHERE notebook_id = ?",
+            (summary, notebook_id),
+        )
+
+
+class LocalFileRepository:
+    @offloaded
+    def upload_object(self, storage_path: str, local_path: str) -> None:
+        target = Path(settings.local_storage_path) / storage_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, target)
+
+    @offloaded
+    def create(self, fields: Row) -> Row:
+        return _insert("files", fields)
+
+    @offloaded
+    def update(self, file_id: str, fields: Row) -> None:
+        fields = _encode(fields)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        local_db.execute(
+            f"UPDATE files SET {assignments} WHERE id = ?",
+            (*fields.values(), file_id),
+        )
+
+    @offloaded
+    def fail_stale(self, statuses: List[str], before: str, error: str) -> int:
+        marks = ", ".join("?" for _ in statuses)
+        return local_db.execute(
+            "UPDATE files SET status = 'failed', error = ? "
+            f"WHERE status IN ({marks}) AND created_at < ?",
+            (error, *statuses, before),
+        )
+
+    @offloaded
+    def get_owned(self, file_id: str, user_id: str, columns: str) -> Optional[Row]:
+        """Fetch a file row if its notebook belongs to `user_id`."""
+        return _decode(
+            local_db.fetch_one(
+                f"SELECT {_select_list(columns, 'f')} FROM files f "
+                "JOIN notebooks n ON n.id = f.notebook_id "
+                "WHERE f.id = ? AND n.user_id = ? LIMIT 1",
+                (file_id, user_id),
+            )
+        )
+
+    @offloaded
+    def get_text(self, file_id: str, start: int, length: int) -> str:
+        row = local_db.fetch_one(
+            "SELECT substr(extracted_text, ?, ?) AS text FROM files WHERE id = ?",
+            (start + 1, length, file_id),
+        )
+        return (row or {}).get("text") or ""
+
+    @offloaded
+    def list_texts(self, notebook_id: str) -> List[Row]:
+        return local_db.fetch_all(
+            "SELECT id, extracted_text FROM files WHERE notebook_id = ? ORDER BY created_at",
+            (notebook_id,),
+        )
+
+    @offloaded
+    def find_by_hash(
+        self,
+        content_hash: str,
+        user_id: str,
+        columns: str,
+        status: Optional[str] = None,
+    ) -> Optional[Row]:
+        sql = (
+            f"SELECT {_select_list(columns, 'f')} FROM files f "
+            "JOIN notebooks n ON n.id = f.notebook_id "
+            "WHERE f.content_hash = ? AND n.user_id = ?"
+        )
+        params: List[Any] = [content_hash, user_id]
+        if status is not None:
+            sql += " AND f.status = ?"
+            params.append(status)
+        return _decode(local_db.fetch_one(sql + " LIMIT 1", params))
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page("files", "notebook_id", notebook_id, columns, limit, after)
+
+
+class LocalFlashcardRepository:
+    @offloaded
+    def create(self, notebook_id: str, front: str, back: str) -> Row:
+        return _insert(
+            "flashcards", {"notebook_id": notebook_id, "front": front, "back": back}
+        )
+
+    @offloaded
+    def create_many(self, notebook_id: str, cards: List[Row]) -> List[Row]:
+        return _insert_many(
+            "flashcards",
+            [
+                {"notebook_id": notebook_id, "front": c["front"], "back": c["back"]}
+                for c in cards
+            ],
+        )
+
+    @offloaded
+    def delete_many(self, card_ids: List[str]) -> None:
+        if card_ids:
+            local_db.execute(
+                "DELETE FROM flashcards WHERE id IN "
+                f"({', '.join('?' for _ in card_ids)})",
+                card_ids,
+            )
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page(
+            "flashcards", "notebook_id", notebook_id, columns, limit, after
+        )
+
+
+class LocalQuizRepository:
+    @offloaded
+    def create(self, notebook_id: str, data: Any) -> Row:
+        return _insert("quizzes", {"notebook_id": notebook_id, "data": data})
+
+    @offloaded
+    def set_data(self, quiz_id: str, data: Any) -> None:
+        local_db.execute(
+            "UPDATE quizzes SET data = ? WHERE id = ?", (json.dumps(data), quiz_id)
+        )
+
+    @offloaded
+    def delete(self, quiz_id: str) -> None:
+        local_db.execute("DELETE FROM quizzes WHERE id = ?", (quiz_id,))
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page("quizzes", "notebook_id", notebook_id, columns, limit, after)
+
+
+class LocalQuizQuestionRepository:
+    @offloaded
+    def create_many(
+        self, quiz_id: str, notebook_id: str, questions: List[Row], start: int = 0
+    ) -> List[Row]:
+        return _insert_many(
+            "quiz_questions",
+            [
+                {
+                    "quiz_id": quiz_id,
+                    "notebook_id": notebook_id,
+                    "position": start + i,
+                    "type": q.get("type"),
+                    "question": q["question"],
+                    "options": q.get("options"),
+                    "answer": q.get("answer"),
+                    "explanation": q.get("explanation"),
+                }
+                for i, q in enumerate(questions)
+            ],
+        )
+
+
+class LocalStudyPlanRepository:
+    @offloaded
+    def create(self, notebook_id: str, exam_date: Optional[date], plan_json: Any) -> Row:
+        return _insert(
+            "study_plans",
+            {
+                "notebook_id": notebook_id,
+                "exam_date": exam_date.isoformat() if exam_date else None,
+                "plan_json": plan_json,
+            },
+        )
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page(
+            "study_plans", "notebook_id", notebook_id, columns, limit, after
+        )
+
+
+class LocalChatSessionRepository:
+    @offloaded
+    def create(
+        self,
+        user_id: str,
+        notebook_id: Optional[str],
+        title: Optional[str],
+        token_budget: int,
+    ) -> Row:
+        return _insert(
+            "chat_sessions",
+            {
+                "user_id": user_id,
+                "notebook_id": notebook_id,
+                "title": title,
+                "token_budget": token_budget,
+            },
+        )
+
+    @offloaded
+    def get_owned(self, session_id: str, user_id: str) -> Optional[Row]:
+        return local_db.fetch_one(
+            "SELECT * FROM chat_sessions WHERE id = ? AND user_id = ? LIMIT 1",
+            (session_id, user_id),
+        )
+
+    @offloaded
+    def set_summary(self, session_id: str, summary: str) -> None:
+        local_db.execute(
+            "UPDATE chat_sessions SET summary = ? WHERE id = ?", (summary, session_id)
+        )
+
+
+class LocalChatMessageRepository:
+    @offloaded
+    def create_many(self, session_id: str, messages: List[Row]) -> List[Row]:
+        return _insert_many(
+            "chat_messages",
+            [
+                {
+                    "session_id": session_id,
+                    "role": m["role"],
+                    "content": m["content"],
+                    "tokens": m["tokens"],
+                    "created_at": m["created_at"],
+                }
+                for m in messages
+            ],
+        )
+
+    @offloaded
+    def list_for_session(
+        self, session_id: str, include_compacted: bool = False
+    ) -> List[Row]:
+        rows = local_db.fetch_all(
+            "SELECT id, role, content, tokens, compacted, created_at FROM chat_messages "
+            "WHERE session_id = ? AND (? OR compacted = 0) ORDER BY created_at, rowid",
+            (session_id, include_compacted),
+        )
+        for row in rows:
+            row["compacted"] = bool(row["compacted"])
+        return rows
+
+    @offloaded
+    def mark_compacted(self, message_ids: List[str]) -> None:
+        if message_ids:
+            local_db.execute(
+                "UPDATE chat_messages SET compacted = 1 WHERE id IN "
+                f"({', '.join('?' for _ in message_ids)})",
+                message_ids,
+            )
+
+
+class LocalDocumentChunkRepository:
+    @offloaded
+    def list_for_notebook(self, notebook_id: str) -> List[Row]:
+        return [
+            _decode(row)
+            for row in local_db.fetch_all(
+                "SELECT id, doc_id, position, content, source_hash, embedding "
+                "FROM document_chunks WHERE notebook_id = ?",
+                (notebook_id,),
+            )
+        ]
+
+    @offloaded
+    def replace_document(
+        self, notebook_id: str, doc_id: str, chunks: List[Row]
+    ) -> None:
+        rows = [
+            _encode(
+                {
+                    "id": str(uuid.uuid4()),
+                    "notebook_id": notebook_id,
+                    "doc_id": doc_id,
+                    "position": c["position"],
+                    "content": c["content"],
+                    "source_hash": c["source_hash"],
+                    "embedding": c.get("embedding"),
+                }
+            )
+            for c in chunks
+        ]
+        with local_db.transaction() as conn:
+            conn.execute(
+                "DELETE FROM document_chunks WHERE notebook_id = ? AND doc_id = ?",
+                (notebook_id, doc_id),
+            )
+            conn.executemany(
+                "INSERT INTO document_chunks(id, notebook_id, doc_id, position, "
+                "content, source_hash, embedding) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(row.values()) for row in rows],
+            )
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: all words, the last one as a prefix.
+
+    Same rule as the Supabase search_documents function (see README).
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    return " ".join(f'"{w}"' for w in words[:-1]) + f' "{words[-1]}"*'
+
+
+class LocalSearchRepository:
+    @offloaded
+    def search(
+        self, user_id: str, query: str, limit: int, after: Optional[List[Any]] = None
+    ) -> List[Row]:
+        match = _fts_query(query)
+        if not match:
+            return []
+        keyset = ""
+        params: List[Any] = [match, user_id]
+        if after is not None:
+            keyset = "WHERE score > ? OR (score = ? AND id > ?)"
+            params += [after[0], after[0], after[1]]
+        with local_db.get_pool().connection() as conn:
+            # Rank first, then build snippets for the page only: snippet()
+            # re-reads each document, too slow to run on every match.
+            # bm25() is lower-is-better, matching the Supabase function's score.
+            rows = [
+                dict(r)
+                for r in conn.execute(
+                    f"""
+                    SELECT * FROM (
+                        SELECT search_fts.rowid AS fts_rowid, d.kind AS type,
+                               d.doc_id AS id, d.notebook_id,
+                               nb.title AS notebook_title, bm25(search_fts) AS score
+                        FROM search_fts
+                        JOIN search_docs d ON d.rowid = search_fts.rowid
+                        JOIN notebooks nb ON nb.id = d.notebook_id
+                        WHERE search_fts MATCH ? AND nb.user_id = ?
+                    )
+                    {keyset}
+                    ORDER BY score, id
+                    LIMIT ?
+                    """,
+                    params + [limit],
+                ).fetchall()
+            ]
+            if not rows:
+                return []
+            marks = ", ".join("?" for _ in rows)
+            rowids = [r.pop("fts_rowid") for r in rows]
+            snippets = dict(
+                conn.execute(
+                    "SELECT rowid, snippet(search_fts, 0, '<mark>', '</mark>', '…', 16) "
+                    f"FROM search_fts WHERE search_fts MATCH ? AND rowid IN ({marks})",
+                    [match, *rowids],
+                ).fetchall()
+            )
+            file_ids = [r["id"] for r in rows if r["type"] == "file"]
+            paths = dict(
+                conn.execute(
+                    "SELECT id, storage_path FROM files WHERE id IN "
+                    f"({', '.join('?' for _ in file_ids)})",
+                    file_ids,
+                ).fetchall()
+            ) if file_ids else {}
+        for row, rowid in zip(rows, rowids):
+            row["snippet"] = snippets.get(rowid, "")
+            row["storage_path"] = paths.get(row["id"])
+        return rows
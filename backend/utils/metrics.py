@@ -0,0 +1,242 @@
+"""Request stage timings, Prometheus metrics and the Server-Timing header.
+
+Code marks the stages of a request with `span("name")` (or `record` when
+the duration is known, e.g. from Ollama's own timings). `TimingMiddleware`
+gives every request its own list of stages: they go out in the
+`Server-Timing` header and are logged when the request is slow. Every
+stage, and every request by route, also feeds a histogram served as
+Prometheus text at `GET /metrics`.
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from utils.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans from sub-millisecond cache hits to multi-minute generations.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: Dict[LabelValues, List[float]] = {}  # bucket counts + [sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, values in series:
+            for bound, count in zip(self.buckets, values):
+                le = _labels(self.label_names, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {_number(count)}")
+            plain = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{plain} {_number(values[-2])}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the end of the response body.",
+    ("method", "route", "status"),
+)
+stage_seconds = Histogram(
+    "stage_duration_seconds", "Time spent in one stage of a request or job.", ("stage",)
+)
+ollama_tokens = Counter(
+    "ollama_tokens_total", "Tokens evaluated by Ollama.", ("kind",)
+)
+
+# name -> (help, callable returning [(labels dict, value)]); see `register_gauge`.
+_gauges: Dict[str, Tuple[str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = {}
+
+
+def register_gauge(
+    name: str, help_text: str, read: Callable[[], List[Tuple[Dict[str, str], float]]]
+) -> None:
+    """Add a gauge whose samples are read from `read()` at scrape time."""
+    _gauges[name] = (help_text, read)
+
+
+def render() -> str:
+    lines = request_seconds.render() + stage_seconds.render() + ollama_tokens.render()
+    for name, (help_text, read) in sorted(_gauges.items()):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for labels, value in read():
+            names = tuple(labels)
+            lines.append(
+                f"{name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """Stages recorded during one request, in the order they finished."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def totals(self) -> Dict[str, float]:
+        # A stage can run several times (e.g. one Ollama call per chunk).
+        totals: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        entries = [f"{n};dur={1000 * s:.1f}" for n, s in self.totals().items()]
+        total = time.perf_counter() - self.started
+        return ", ".join(entries + [f"total;dur={1000 * total:.1f}"])
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Count `seconds` for `stage`, in the current request if there is one."""
+    stage_seconds.observe(seconds, stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.stages.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+class TimingMiddleware:
+    """Times each request and its stages.
+
+    The `Server-Timing` header carries the stages finished before the
+    response started, so for streamed answers it covers the work up to the
+    first byte; the histograms and the slow-request log use the full
+    duration, measured when the body is complete.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._finish(scope, timings, status)
+
+    @staticmethod
+    def _finish(scope, timings: RequestTimings, status: int) -> None:
+        seconds = time.perf_counter() - timings.started
+        route = scope.get("route")
+        # Unmatched paths share one label so scanners can't inflate the series.
+        path = getattr(route, "path", None) or "unmatched"
+        request_seconds.observe(seconds, scope["method"], path, str(status))
+        if settings.slow_request_seconds and seconds >= settings.slow_request_seconds:
+            breakdown = ", ".join(
+                f"{n}={s:.3f}s" for n, s in sorted(
+                    timings.totals().items(), key=lambda item: -item[1]
+                )
+            )
+            logger.warning(
+                "Slow request %s %s -> %s in %.2fs (%s)",
+                scope["method"],
+                path,
+                status,
+                seconds,
+                breakdown or "no stages recorded",
+            )
@@ -0,0 +1,551 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from utils.columns import FILE_META_COLUMNS, NOTE_COLUMNS
+from utils.config import settings
+from utils.database import offloaded, supabase
+
+
+# Async data access for the routers. Each method wraps one Supabase call and
+# runs it on the DB thread pool (see `utils.database.offloaded`), so awaiting
+# it never blocks the event loop. With USE_LOCAL_DB the same interface is
+# served from SQLite instead (utils.local_repository).
+
+Row = Dict[str, Any]
+
+
+def _first(resp) -> Optional[Row]:
+    return resp.data[0] if resp.data else None
+
+
+def _list_page(
+    table: str,
+    owner_column: str,
+    owner_id: str,
+    columns: str,
+    limit: int,
+    after: Optional[List[Any]],
+) -> List[Row]:
+    """Newest-first rows of `table` whose `owner_column` is `owner_id`.
+
+    Keyset paging on (created_at, id): `after` is the (created_at, id) of
+    the previous page's last row, so every page is one index range scan
+    however deep it is (see the indexes in README).
+    """
+    query = supabase.table(table).select(columns).eq(owner_column, owner_id)
+    if after is not None:
+        created_at, row_id = after
+        query = query.or_(
+            f'created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt.{row_id})'
+        )
+    return (
+        query.order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit)
+        .execute()
+        .data
+        or []
+    )
+
+
+class UserRepository:
+    @offloaded
+    def get(self, user_id: str) -> Optional[Row]:
+        return _first(
+            supabase.table("users")
+            .select("id, email")
+            .eq("id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+
+class NotebookRepository:
+    @offloaded
+    def create(self, user_id: str, title: str, description: Optional[str]) -> Row:
+        resp = (
+            supabase.table("notebooks")
+            .insert({"user_id": user_id, "title": title, "description": description})
+            .execute()
+        )
+        return resp.data[0]
+
+    @offloaded
+    def list_page(
+        self, user_id: str, columns: str, limit: int, after: Optional[List[Any]] = None
+    ) -> List[Row]:
+        return _list_page("notebooks", "user_id", user_id, columns, limit, after)
+
+    @offloaded
+    def get(self, notebook_id: str) -> Optional[Row]:
+        return _first(
+            supabase.table("notebooks")
+            .select("*")
+            .eq("id", notebook_id)
+            .limit(1)
+            .execute()
+        )
+
+    @offloaded
+    def get_owned(self, notebook_id: str, user_id: str) -> Optional[Row]:
+        # Ownership is part of the filter, so a foreign notebook is simply absent.
+        return _first(
+            supabase.table("notebooks")
+            .select("*")
+            .eq("id", notebook_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+    @offloaded
+    def get_bundle(
+        self, notebook_id: str, user_id: str, include_text: bool = False
+    ) -> Optional[Row]:
+        """Fetch an owned notebook with its main note and files in one request.
+
+        Returns {"notebook", "note", "files"} or None when the notebook
+        doesn't exist or belongs to someone else. File rows carry
+        `extracted_text`/`page_offsets` only with `include_text`.
+        """
+        file_columns = FILE_META_COLUMNS + (
+            ", extracted_text, page_offsets" if include_text else ""
+        )
+        row = _first(
+            supabase.table("notebooks")
+            .select(f"*, notes({NOTE_COLUMNS}), files({file_columns})")
+            .eq("id", notebook_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+        if row is None:
+            return None
+        notes = row.pop("notes", None) or []
+        files = row.pop("files", None) or []
+        return {"notebook": row, "note": notes[0] if notes else None, "files": files}
+
+
+class NoteRepository:
+    @offloaded
+    def get_for_notebook(self, notebook_id: str) -> Optional[Row]:
+        return _first(
+            supabase.table("notes")
+            .select(NOTE_COLUMNS)
+            .eq("notebook_id", notebook_id)
+            .limit(1)
+            .execute()
+        )
+
+    @offloaded
+    def upsert(self, notebook_id: str, content: str) -> Row:
+        # Simple strategy: one main note per notebook
+        existing = (
+            supabase.table("notes")
+            .select("id")
+            .eq("notebook_id", notebook_id)
+            .limit(1)
+            .execute()
+        )
+        if existing.data:
+            resp = (
+                supabase.table("notes")
+                .update({"content": content})
+                .eq("id", existing.data[0]["id"])
+                .execute()
+            )
+        else:
+            resp = (
+                supabase.table("notes")
+                .insert({"notebook_id": notebook_id, "content": content})
+                .execute()
+            )
+        return resp.data[0]
+
+    @offloaded
+    def set_summary(self, notebook_id: str, summary: str) -> None:
+        # Only the main note carries a summary; nothing to do if it doesn't exist.
+        supabase.table("notes").update({"ai_summary": summary}).eq(
+            "notebook_id", notebook_id
+        ).execute()
+
+
+class FileRepository:
+    bucket = "notebook-files"
+
+    @offloaded
+    def upload_object(self, storage_path: str, local_path: str) -> None:
+        with open(local_path, "rb") as f:
+            supabase.storage.from_(self.bucket).upload(file=f, path=storage_path)
+
+    @offloaded
+    def create(self, fields: Row) -> Row:
+        return supabase.table("files").insert(fields).execute().data[0]
+
+    @offloaded
+    def update(self, file_id: str, fields: Row) -> None:
+        supabase.table("files").update(fields).eq("id", file_id).execute()
+
+    @offloaded
+    def fail_stale(self, statuses: List[str], before: str, error: str) -> int:
+        """Mark rows still in `statuses` and created before `before` failed."""
+        resp = (
+            supabase.table("files")
+            .update({"status": "failed", "error": error})
+            .in_("status", statuses)
+            .lt("created_at", before)
+            .execute()
+        )
+        return len(resp.data or [])
+
+    @offloaded
+    def get_owned(self, file_id: str, user_id: str, columns: str) -> Optional[Row]:
+        """Fetch a file row if its notebook belongs to `user_id`."""
+        row = _first(
+            supabase.table("files")
+            .select(f"{columns}, notebooks(user_id)")
+            .eq("id", file_id)
+            .limit(1)
+            .execute()
+        )
+        if row is None or (row.pop("notebooks", None) or {}).get("user_id") != user_id:
+            return None
+        return row
+
+    @offloaded
+    def get_text(self, file_id: str, start: int, length: int) -> str:
+        """`length` characters of a file's extracted text from offset `start`.
+
+        Cut out by the file_text function (see README) so a page of a large
+        book doesn't pull the whole column out of Postgres.
+        """
+        params = {"p_file_id": file_id, "p_start": start, "p_length": length}
+        return supabase.rpc("file_text", params).execute().data or ""
+
+    @offloaded
+    def list_texts(self, notebook_id: str) -> List[Row]:
+        resp = (
+            supabase.table("files")
+            .select("id, extracted_text")
+            .eq("notebook_id", notebook_id)
+            .execute()
+        )
+        return resp.data or []
+
+    @offloaded
+    def find_by_hash(
+        self,
+        content_hash: str,
+        user_id: str,
+        columns: str,
+        status: Optional[str] = None,
+    ) -> Optional[Row]:
+        """An upload of the same bytes in one of `user_id`'s notebooks."""
+        query = (
+            supabase.table("files")
+            .select(f"{columns}, notebooks!inner(user_id)")
+            .eq("content_hash", content_hash)
+            .eq("notebooks.user_id", user_id)
+        )
+        if status is not None:
+            query = query.eq("status", status)
+        row = _first(query.limit(1).execute())
+        if row is not None:
+            row.pop("notebooks", None)
+        return row
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page("files", "notebook_id", notebook_id, columns, limit, after)
+
+
+class FlashcardRepository:
+    @offloaded
+    def create(self, notebook_id: str, front: str, back: str) -> Row:
+        resp = (
+            supabase.table("flashcards")
+            .insert({"notebook_id": notebook_id, "front": front, "back": back})
+            .execute()
+        )
+        return resp.data[0]
+
+    @offloaded
+    def create_many(self, notebook_id: str, cards: List[Row]) -> List[Row]:
+        # One insert for the whole batch.
+        rows = [
+            {"notebook_id": notebook_id, "front": c["front"], "back": c["back"]}
+            for c in cards
+        ]
+        return supabase.table("flashcards").insert(rows).execute().data
+
+    @offloaded
+    def delete_many(self, card_ids: List[str]) -> None:
+        if card_ids:
+            supabase.table("flashcards").delete().in_("id", card_ids).execute()
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page(
+            "flashcards", "notebook_id", notebook_id, columns, limit, after
+        )
+
+
+class QuizRepository:
+    @offloaded
+    def create(self, notebook_id: str, data: Any) -> Row:
+        resp = (
+            supabase.table("quizzes")
+            .insert({"notebook_id": notebook_id, "data": data})
+            .execute()
+        )
+        return resp.data[0]
+
+    @offloaded
+    def set_data(self, quiz_id: str, data: Any) -> None:
+        supabase.table("quizzes").update({"data": data}).eq("id", quiz_id).execute()
+
+    @offloaded
+    def delete(self, quiz_id: str) -> None:
+        # quiz_questions rows go with it (on delete cascade).
+        supabase.table("quizzes").delete().eq("id", quiz_id).execute()
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page("quizzes", "notebook_id", notebook_id, columns, limit, after)
+
+
+class QuizQuestionRepository:
+    @offloaded
+    def create_many(
+        self, quiz_id: str, notebook_id: str, questions: List[Row], start: int = 0
+    ) -> List[Row]:
+        rows = [
+            {"quiz_id": quiz_id, "notebook_id": notebook_id, "position": start + i, **q}
+            for i, q in enumerate(questions)
+        ]
+        return supabase.table("quiz_questions").insert(rows).execute().data
+
+
+class StudyPlanRepository:
+    @offloaded
+    def create(self, notebook_id: str, exam_date: Optional[date], plan_json: Any) -> Row:
+        resp = (
+            supabase.table("study_plans")
+            .insert(
+                {
+                    "notebook_id": notebook_id,
+                    "exam_date": exam_date.isoformat() if exam_date else None,
+                    "plan_json": plan_json,
+                }
+            )
+            .execute()
+        )
+        return resp.data[0]
+
+    @offloaded
+    def list_page(
+        self,
+        notebook_id: str,
+        columns: str,
+        limit: int,
+        after: Optional[List[Any]] = None,
+    ) -> List[Row]:
+        return _list_page(
+            "study_plans", "notebook_id", notebook_id, columns, limit, after
+        )
+
+
+class ChatSessionRepository:
+    @offloaded
+    def create(
+        self,
+        user_id: str,
+        notebook_id: Optional[str],
+        title: Optional[str],
+        token_budget: int,
+    ) -> Row:
+        resp = (
+            supabase.table("chat_sessions")
+            .insert(
+                {
+                    "user_id": user_id,
+                    "notebook_id": notebook_id,
+                    "title": title,
+                    "token_budget": token_budget,
+                }
+            )
+            .execute()
+        )
+        return resp.data[0]
+
+    @offloaded
+    def get_owned(self, session_id: str, user_id: str) -> Optional[Row]:
+        return _first(
+            supabase.table("chat_sessions")
+            .select("*")
+            .eq("id", session_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+
+    @offloaded
+    def set_summary(self, session_id: str, summary: str) -> None:
+        supabase.table("chat_sessions").update({"summary": summary}).eq(
+            "id", session_id
+        ).execute()
+
+
+class ChatMessageRepository:
+    @offloaded
+    def create_many(self, session_id: str, messages: List[Row]) -> List[Row]:
+        rows = [
+            {
+                "session_id": session_id,
+                "role": m["role"],
+                "content": m["content"],
+                "tokens": m["tokens"],
+                # Set by the caller so a question and its answer, inserted
+                # together, still sort in order.
+                "created_at": m["created_at"],
+            }
+            for m in messages
+        ]
+        return supabase.table("chat_messages").insert(rows).execute().data
+
+    @offloaded
+    def list_for_session(
+        self, session_id: str, include_compacted: bool = False
+    ) -> List[Row]:
+        query = (
+            supabase.table("chat_messages")
+            .select("id, role, content, tokens, compacted, created_at")
+            .eq("session_id", session_id)
+        )
+        if not include_compacted:
+            query = query.eq("compacted", False)
+        return query.order("created_at").execute().data or []
+
+    @offloaded
+    def mark_compacted(self, message_ids: List[str]) -> None:
+        if message_ids:
+            supabase.table("chat_messages").update({"compacted": True}).in_(
+                "id", message_ids
+            ).execute()
+
+
+class DocumentChunkRepository:
+    """Retrieval chunks (and their embeddings) of notebook documents.
+
+    Written when a note or file is (re)indexed, read back whole when a
+    notebook's retrieval index is first needed (services.retrieval).
+    """
+
+    @offloaded
+    def list_for_notebook(self, notebook_id: str) -> List[Row]:
+        # PostgREST caps rows per response; page until a short page.
+        rows: List[Row] = []
+        page = settings.chunk_page_size
+        while True:
+            data = (
+                supabase.table("document_chunks")
+                .select("id, doc_id, position, content, source_hash, embedding")
+                .eq("notebook_id", notebook_id)
+                .order("id")
+                .range(len(rows), len(rows) + page - 1)
+                .execute()
+                .data
+                or []
+            )
+            rows.extend(data)
+            if len(data) < page:
+                return rows
+
+    @offloaded
+    def replace_document(
+        self, notebook_id: str, doc_id: str, chunks: List[Row]
+    ) -> None:
+        supabase.table("document_chunks").delete().eq("notebook_id", notebook_id).eq(
+            "doc_id", doc_id
+        ).execute()
+        rows = [{"notebook_id": notebook_id, "doc_id": doc_id, **c} for c in chunks]
+        for start in range(0, len(rows), settings.chunk_page_size):
+            supabase.table("document_chunks").insert(
+                rows[start : start + settings.chunk_page_size]
+            ).execute()
+
+
+class SearchRepository:
+    @offloaded
+    def search(
+        self, user_id: str, query: str, limit: int, after: Optional[List[Any]] = None
+    ) -> List[Row]:
+        # Ranked by the search_documents function over the notes/files
+        # tsvector columns (see README). `score` sorts ascending (best first);
+        # `after` is the (score, id) of the previous page's last row.
+        params = {"p_user_id": user_id, "p_query": query, "p_limit": limit}
+        if after is not None:
+            params.update({"p_after_score": after[0], "p_after_id": after[1]})
+        return supabase.rpc("search_documents", params).execute().data or []
+
+
+if settings.use_local_db:
+    from utils.local_repository import (
+        LocalChatMessageRepository,
+        LocalChatSessionRepository,
+        LocalDocumentChunkRepository,
+        LocalFileRepository,
+        LocalFlashcardRepository,
+        LocalNotebookRepository,
+        LocalNoteRepository,
+        LocalQuizQuestionRepository,
+        LocalQuizRepository,
+        LocalSearchRepository,
+        LocalStudyPlanRepository,
+        LocalUserRepository,
+    )
+
+    user_repo = LocalUserRepository()
+    notebook_repo = LocalNotebookRepository()
+    note_repo = LocalNoteRepository()
+    file_repo = LocalFileRepository()
+    flashcard_repo = LocalFlashcardRepository()
+    quiz_repo = LocalQuizRepository()
+    quiz_question_repo = LocalQuizQuestionRepository()
+    study_plan_repo = LocalStudyPlanRepository()
+    chat_session_repo = LocalChatSessionRepository()
+    chat_message_repo = LocalChatMessageRepository()
+    search_repo = LocalSearchRepository()
+    chunk_repo = LocalDocumentChunkRepository()
+else:
+    user_repo = UserRepository()
+    notebook_repo = NotebookRepository()
+    note_repo = NoteRepository()
+    file_repo = FileRepository()
+    flashcard_repo = FlashcardRepository()
+    quiz_repo = QuizRepository()
+    quiz_question_repo = QuizQuestionRepository()
+    study_plan_repo = StudyPlanRepository()
+    chat_session_repo = ChatSessionRepository()
+    chat_message_repo = ChatMessageRepository()
+    search_repo = SearchRepository()
+    chunk_repo = DocumentChunkRepository()
@@ -0,0 +1,114 @@
+"""Plain-text responses with ETags, byte ranges and compression.
+
+`text_response` serves a body the way large extracted texts should go to
+clients on slow networks: a conditional GET with a matching `If-None-Match`
+gets a bodiless 304, a single `Range: bytes=...` gets just those bytes
+(206), and anything else is compressed with brotli (when the `brotli`
+package is installed) or gzip if the client accepts it.
+"""
+import gzip
+import re
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from utils.config import settings
+
+try:
+    import brotli
+except ImportError:  # optional; gzip covers every client
+    brotli = None
+
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if `If-None-Match` lists `etag` (weak comparison, as for GET)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=_base_headers(etag))
+
+
+def _base_headers(etag: str) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        # Per-user content: browsers may keep it, shared caches may not.
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse one `bytes=` range into [start, end); None to ignore the header.
+
+    Raises ValueError when the range can't be satisfied. Multiple ranges are
+    ignored (a full 200 is a valid answer to them).
+    """
+    match = _RANGE.match(header.replace(" ", ""))
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        end = min(size, int(last) + 1) if last else size
+    if start >= size or start >= end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def _encoding(request: Request) -> Optional[str]:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("accept-encoding", "").split(",")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def text_response(
+    request: Request, text: str, etag: str, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    body = text.encode("utf-8")
+    out = {**_base_headers(etag), **(headers or {})}
+    media_type = "text/plain; charset=utf-8"
+
+    range_header = request.headers.get("range")
+    # Our ETags are weak, which never satisfy If-Range: send the whole body.
+    if range_header and request.headers.get("if-range") is None:
+        try:
+            selected = _byte_range(range_header, len(body))
+        except ValueError:
+            out["Content-Range"] = f"bytes */{len(body)}"
+            return Response(status_code=416, headers=out)
+        if selected is not None:
+            start, end = selected
+            out["Content-Range"] = f"bytes {start}-{end - 1}/{len(body)}"
+            # Ranges address the identity bytes, so they go uncompressed.
+            return Response(
+                body[start:end], status_code=206, headers=out, media_type=media_type
+            )
+
+    encoding = _encoding(request)
+    if encoding is not None and len(body) >= settings.text_compress_min_bytes:
+        if encoding == "br":
+            body = brotli.compress(body, quality=settings.text_brotli_quality)
+        else:
+            body = gzip.compress(body, compresslevel=settings.text_gzip_level)
+        out["Content-Encoding"] = encoding
+    return Response(body, headers=out, media_type=media_type)
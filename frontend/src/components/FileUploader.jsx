@@ -2,6 +2,26 @@ import React, { useRef, useState } from "react";
 import api from "../utils/api";
 import { Upload } from "lucide-react";
 
+const POLL_INTERVAL_MS = 1000;
+// Large scanned PDFs take a while to OCR, but don't spin forever.
+const POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+async function waitForExtraction(jobId) {
+  // Uploads are extracted in the background; poll until the job settles.
+  const deadline = Date.now() + POLL_TIMEOUT_MS;
+  for (;;) {
+    if (Date.now() > deadline) {
+      throw new Error("Extraction is taking too long; check the notebook later");
+    }
+    const res = await api.get(`/upload/jobs/${jobId}`);
+    if (res.data.status === "ready") return res.data;
+    if (res.data.status === "failed") {
+      throw new Error(res.data.error || "Extraction failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+}
+
 export default function FileUploader({ notebookId, onExtracted }) {
   const [uploading, setUploading] = useState(false);
   const fileInputRef = useRef(null);
@@ -17,7 +37,12 @@ export default function FileUploader({ notebookId, onExtracted }) {
       const res = await api.post("/upload", form, {
         headers: { "Content-Type": "multipart/form-data" },
       });
-      onExtracted?.(res.data.extracted_text);
+      const job = await waitForExtraction(res.data.job_id);
+      // Jobs only describe the text (page/char counts); fetch it separately.
+      const text = await api.get(`/upload/${job.file_id}/text`, {
+        responseType: "text",
+      });
+      onExtracted?.(text.data);
     } catch (err) {
       console.error(err);
       alert("Upload failed");
@@ -1,9 +1,49 @@
-import React from "react";
+import React, { useEffect, useState } from "react";
+import { useNavigate } from "react-router-dom";
 import { Search, User } from "lucide-react";
+import api from "../../utils/api";
 import { useAuth } from "../../context/AuthContext";
 
+// Snippets come back as raw text with matches wrapped in <mark>; render the
+// pieces as text nodes instead of injecting HTML.
+function Snippet({ text }) {
+  return text.split(/(<mark>.*?<\/mark>)/g).map((part, i) =>
+    part.startsWith("<mark>") ? (
+      <mark key={i} className="bg-yellow-100 text-slate-900 rounded">
+        {part.slice(6, -7)}
+      </mark>
+    ) : (
+      <React.Fragment key={i}>{part}</React.Fragment>
+    )
+  );
+}
+
 export default function Navbar() {
   const { user } = useAuth();
+  const navigate = useNavigate();
+  const [query, setQuery] = useState("");
+  const [results, setResults] = useState([]);
+
+  useEffect(() => {
+    if (!query.trim()) {
+      setResults([]);
+      return undefined;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const res = await api.get("/notebooks/search", { params: { q: query, limit: 8 } });
+        setResults(res.data.items);
+      } catch (e) {
+        console.error(e);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [query]);
+
+  const openResult = (hit) => {
+    setQuery("");
+    navigate(`/notes?notebook=${hit.notebook_id}`);
+  };
 
   return (
     <header className="h-16 flex items-center justify-between border-b bg-white/80 backdrop-blur-sm px-4 md:px-6">
@@ -16,14 +56,38 @@ export default function Navbar() {
             AI Study Notebook
           </span>
         </div>
-        <div className="flex-1 max-w-xl mx-2">
+        <div className="relative flex-1 max-w-xl mx-2">
           <div className="flex items-center gap-2 px-3 py-2 rounded-full bg-slate-100">
             <Search size={16} className="text-slate-400" />
             <input
               className="w-full bg-transparent text-sm outline-none placeholder:text-slate-400"
               placeholder="Search notes, notebooks…"
+              value={query}
+              onChange={(e) => setQuery(e.target.value)}
             />
           </div>
+          {results.length > 0 && (
+            <ul className="absolute z-10 mt-2 w-full bg-white rounded-xl border border-slate-100 shadow-lg divide-y divide-slate-100">
+              {results.map((hit) => (
+                <li key={hit.id}>
+                  <button
+                    className="w-full text-left px-3 py-2 hover:bg-slate-50"
+                    onClick={() => openResult(hit)}
+                  >
+                    <p className="text-xs font-medium text-slate-900">
+                      {hit.notebook_title}
+                      <span className="ml-2 text-[10px] uppercase text-slate-400">
+                        {hit.type}
+                      </span>
+                    </p>
+                    <p className="text-xs text-slate-500 line-clamp-2">
+                      <Snippet text={hit.snippet} />
+                    </p>
+                  </button>
+                </li>
+              ))}
+            </ul>
+          )}
         </div>
       </div>
       <div className="flex items-center gap-3">
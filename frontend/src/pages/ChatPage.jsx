@@ -5,17 +5,26 @@ import ChatBox from "../components/ChatBox";
 export default function ChatPage() {
   const [messages, setMessages] = useState([]);
   const [notebookId, setNotebookId] = useState("");
+  const [sessionId, setSessionId] = useState(null);
   const [loading, setLoading] = useState(false);
 
+  // History is kept server-side per session; only the new message is sent.
+  const ensureSession = async () => {
+    if (sessionId) return sessionId;
+    const res = await api.post("/ai/chat/sessions", {
+      notebook_id: notebookId || null,
+    });
+    setSessionId(res.data.id);
+    return res.data.id;
+  };
+
   const send = async (content) => {
     const newMessages = [...messages, { role: "user", content }];
     setMessages(newMessages);
     setLoading(true);
     try {
-      const res = await api.post("/ai/chat", {
-        notebook_id: notebookId || null,
-        messages: newMessages,
-      });
+      const id = await ensureSession();
+      const res = await api.post(`/ai/chat/sessions/${id}/messages`, { content });
       setMessages([...newMessages, { role: "assistant", content: res.data.answer }]);
     } catch (e) {
       console.error(e);
@@ -54,7 +63,11 @@ export default function ChatPage() {
             className="w-full rounded-lg border border-slate-200 px-2 py-1.5 text-xs outline-none focus:ring-1 focus:ring-blue-500/70 focus:border-blue-500"
             placeholder="Link a notebook for RAG"
             value={notebookId}
-            onChange={(e) => setNotebookId(e.target.value)}
+            onChange={(e) => {
+              setNotebookId(e.target.value);
+              setSessionId(null);
+              setMessages([]);
+            }}
           />
         </div>
       </aside>
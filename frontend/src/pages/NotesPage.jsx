@@ -1,4 +1,5 @@
 import React, { useEffect, useState } from "react";
+import { useSearchParams } from "react-router-dom";
 import api from "../utils/api";
 import { Sparkles, StickyNote } from "lucide-react";
 import NotesEditor from "../components/NotesEditor";
@@ -8,19 +9,45 @@ import { useAuth } from "../context/AuthContext";
 export default function NotesPage() {
   const { user } = useAuth();
   const [notebooks, setNotebooks] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [activeNotebook, setActiveNotebook] = useState(null);
   const [title, setTitle] = useState("");
   const [content, setContent] = useState("");
   const [aiResult, setAiResult] = useState("");
   const [loadingAction, setLoadingAction] = useState("");
+  const [searchParams] = useSearchParams();
+  const requestedId = searchParams.get("notebook");
+
+  // The list is paged; only the columns the sidebar and editor use.
+  const fetchNotebooks = async (cursor) => {
+    const res = await api.get("/notebooks/list", {
+      params: { fields: "id,title,description", cursor: cursor || undefined },
+    });
+    setNextCursor(res.data.next_cursor);
+    return res.data.items;
+  };
+
+  // A requested notebook may not be on the pages loaded so far.
+  const openRequested = async (loaded) => {
+    const nb = loaded.find((n) => n.id === requestedId);
+    if (nb) return selectNotebook(nb);
+    try {
+      const res = await api.get(`/notebooks/${requestedId}`);
+      selectNotebook(res.data);
+    } catch (e) {
+      console.error(e);
+    }
+  };
 
   useEffect(() => {
     const load = async () => {
       try {
-        const res = await api.get("/notebooks/list");
-        setNotebooks(res.data);
-        if (res.data.length > 0) {
-          selectNotebook(res.data[0]);
+        const items = await fetchNotebooks();
+        setNotebooks(items);
+        if (requestedId) {
+          openRequested(items);
+        } else if (items.length > 0) {
+          selectNotebook(items[0]);
         }
       } catch (e) {
         console.error(e);
@@ -30,6 +57,21 @@ export default function NotesPage() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  // Opening a search result while already on this page.
+  useEffect(() => {
+    if (requestedId && requestedId !== activeNotebook?.id) openRequested(notebooks);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [requestedId]);
+
+  const loadMore = async () => {
+    try {
+      const items = await fetchNotebooks(nextCursor);
+      setNotebooks((prev) => [...prev, ...items]);
+    } catch (e) {
+      console.error(e);
+    }
+  };
+
   const selectNotebook = async (nb) => {
     setActiveNotebook(nb);
     setTitle(nb.title);
@@ -158,6 +200,14 @@ export default function NotesPage() {
               No notebooks yet. Create one to start capturing notes.
             </p>
           )}
+          {nextCursor && (
+            <button
+              onClick={loadMore}
+              className="w-full px-3 py-2 rounded-lg text-xs text-slate-500 hover:bg-slate-100"
+            >
+              Load more
+            </button>
+          )}
         </div>
       </aside>
 